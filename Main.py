@@ -1,16 +1,19 @@
+"""Run Pong.ch8 in a pygame window.
+
+Usage:
+    python Main.py [True|False] [--cache-dir DIR | --no-cache]
+
+The optional argument turns debug mode on or off (off by default).
+"""
+import argparse
+
+from disassembler import add_cache_arguments
 from emulator import Emulator
-import sys
 
-if len(sys.argv) == 2:
-    is_debug_mode = sys.argv[2].capitalize()
-    if is_debug_mode == "True":
-        is_debug_mode = True
-    elif is_debug_mode == "False":
-        is_debug_mode = False
-    else:
-        sys.exit(1)
-else:
-    is_debug_mode = False
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("debug_mode", nargs="?", default="False", type=str.capitalize, choices=("True", "False"))
+add_cache_arguments(parser)
+args = parser.parse_args()
 
-emu = Emulator("Pong.ch8", debug_mode=is_debug_mode)
-emu.start()
\ No newline at end of file
+emu = Emulator("Pong.ch8", debug_mode=args.debug_mode == "True")
+emu.start(cache_dir=args.cache_dir)
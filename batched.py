@@ -0,0 +1,337 @@
+import numpy as np
+
+from emulator import Emulator, INSTRUCTION_SET, SPRITE_BITS
+from faults import RomLoadError
+
+MEMORY_SIZE = Emulator.MEMORY_SIZE
+STACK_SIZE = 16
+
+
+def build_instruction_table():
+    """Map every 16-bit opcode to the index of its INSTRUCTION_SET entry, or -1 if it is unknown."""
+
+    opcodes = np.arange(0x10000)
+    table = np.full(0x10000, -1, dtype=np.int16)
+    for index, (mask, pattern, _, _) in enumerate(INSTRUCTION_SET):
+        table[(opcodes & mask == pattern) & (table == -1)] = index
+    return table
+
+
+INSTRUCTIONS = build_instruction_table()
+
+
+class BatchedEmulator:
+    """Runs `count` Chip-8 machines in lockstep, stored as a struct of NumPy arrays.
+
+    Row m of every array is the state of machine m. step() executes one instruction on every machine: the
+    machines are grouped by the instruction they are on, and each group is updated with array operations that
+    follow the matching Emulator.instruction_* method. A machine that faults (unknown opcode, stack overflow,
+    memory access out of range) is frozen on the faulting instruction and skipped from then on.
+    """
+
+    def __init__(self, count, seed=None):
+        self.count = count
+        self.memory = np.zeros((count, MEMORY_SIZE), dtype=np.uint8)
+        self.registers = np.zeros((count, 16), dtype=np.uint8)
+        self.stack = np.zeros((count, STACK_SIZE), dtype=np.uint16)
+        self.stack_pointer = np.zeros(count, dtype=np.int64)
+        self.pc = np.full(count, Emulator.PROGRAM_START, dtype=np.int64)
+        self.I = np.zeros(count, dtype=np.int64)
+        self.delay_timer = np.zeros(count, dtype=np.uint8)
+        self.sound_timer = np.zeros(count, dtype=np.uint8)
+        self.sprites_base_addr = 0
+        # Framebuffers indexed as pixels[machine, x, y], like Emulator.pixels.
+        self.pixels = np.zeros((count,) + Emulator.DISPLAY_SIZE, dtype=bool)
+        # keys[machine, k] is 1 while key k of that machine is held down.
+        self.keys = np.zeros((count, 16), dtype=np.uint8)
+        self.faulted = np.zeros(count, dtype=bool)
+        self.cycles = 0
+        self.random = np.random.default_rng(seed)
+        self.live = np.arange(count)
+
+        # INSTRUCTION_SET index -> bound handler.
+        self.handlers = [getattr(self, name) for _, _, name, _ in INSTRUCTION_SET]
+
+    def load_program(self, program):
+        """Copy the program bytes into the memory of every machine, starting at location 512."""
+
+        if len(program) > Emulator.PROGRAM_SIZE:
+            raise RomLoadError(f"ROM does not fit in the {Emulator.PROGRAM_SIZE}-byte program area")
+        start = Emulator.PROGRAM_START
+        self.memory[:, start:start + len(program)] = np.frombuffer(bytes(program), dtype=np.uint8)
+
+    def load_standard_sprites(self):
+        """Load standard sprites into every machine's memory, starting from sprites_base_addr."""
+
+        sprites = [row for rows in Emulator.standard_sprites.values() for row in rows]
+        self.memory[:, self.sprites_base_addr:self.sprites_base_addr + len(sprites)] = sprites
+
+    def fault(self, machines):
+        """Freeze the given machines on their current instruction."""
+
+        self.faulted[machines] = True
+        self.live = np.flatnonzero(~self.faulted)
+
+    def execute(self, cycles):
+        """Execute `cycles` lockstep steps and return how many were executed."""
+
+        for _ in range(cycles):
+            self.step()
+        return cycles
+
+    def step(self):
+        """Execute one instruction on every machine that has not faulted."""
+
+        machines = self.live
+        pc = self.pc[machines]
+        fetchable = pc < MEMORY_SIZE - 1
+        if not fetchable.all():
+            self.fault(machines[~fetchable])
+            machines = machines[fetchable]
+            pc = pc[fetchable]
+
+        memory = self.memory
+        opcodes = memory[machines, pc].astype(np.int64) << 8 | memory[machines, pc + 1]
+        kinds = INSTRUCTIONS[opcodes]
+        first = kinds[0] if len(kinds) else -1
+        if (kinds == first).all():
+            # All machines are on the same instruction, the usual case when they run the same ROM.
+            groups = ((first, machines, opcodes),) if len(kinds) else ()
+        else:
+            order = np.argsort(kinds, kind="stable")
+            kinds = kinds[order]
+            bounds = np.flatnonzero(np.diff(kinds)) + 1
+            groups = zip(
+                kinds[np.concatenate(([0], bounds))],
+                np.split(machines[order], bounds),
+                np.split(opcodes[order], bounds),
+            )
+        for kind, group, group_opcodes in groups:
+            if kind < 0:
+                self.fault(group)
+            else:
+                self.handlers[kind](group, group_opcodes)
+        self.cycles += 1
+
+    def tick_timers(self):
+        """Decrement the delay and sound timers of every machine. Called at 60 Hz."""
+
+        self.delay_timer -= self.delay_timer > 0
+        self.sound_timer -= self.sound_timer > 0
+
+    def skip_if(self, m, condition):
+        self.pc[m] += np.where(condition, 4, 2)
+
+    def instruction_00E0(self, m, opcodes):
+        self.pixels[m] = False
+        self.pc[m] += 2
+
+    def instruction_00EE(self, m, opcodes):
+        underflow = self.stack_pointer[m] == 0
+        if underflow.any():
+            self.fault(m[underflow])
+            m = m[~underflow]
+        self.stack_pointer[m] -= 1
+        self.pc[m] = self.stack[m, self.stack_pointer[m]]
+
+    def instruction_1nnn(self, m, opcodes):
+        self.pc[m] = opcodes & 0xFFF
+
+    def instruction_2nnn(self, m, opcodes):
+        overflow = self.stack_pointer[m] >= STACK_SIZE
+        if overflow.any():
+            self.fault(m[overflow])
+            m, opcodes = m[~overflow], opcodes[~overflow]
+        self.stack[m, self.stack_pointer[m]] = self.pc[m] + 2
+        self.stack_pointer[m] += 1
+        self.pc[m] = opcodes & 0xFFF
+
+    def instruction_3xkk(self, m, opcodes):
+        self.skip_if(m, self.registers[m, opcodes >> 8 & 0xF] == opcodes & 0xFF)
+
+    def instruction_4xkk(self, m, opcodes):
+        self.skip_if(m, self.registers[m, opcodes >> 8 & 0xF] != opcodes & 0xFF)
+
+    def instruction_5xy0(self, m, opcodes):
+        self.skip_if(m, self.registers[m, opcodes >> 8 & 0xF] == self.registers[m, opcodes >> 4 & 0xF])
+
+    def instruction_6xkk(self, m, opcodes):
+        self.registers[m, opcodes >> 8 & 0xF] = opcodes & 0xFF
+        self.pc[m] += 2
+
+    def instruction_7xkk(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        self.registers[m, x] = (self.registers[m, x] + opcodes) & 0xFF
+        self.pc[m] += 2
+
+    def instruction_8xy0(self, m, opcodes):
+        self.registers[m, opcodes >> 8 & 0xF] = self.registers[m, opcodes >> 4 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_8xy1(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        self.registers[m, x] |= self.registers[m, opcodes >> 4 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_8xy2(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        self.registers[m, x] &= self.registers[m, opcodes >> 4 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_8xy3(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        self.registers[m, x] ^= self.registers[m, opcodes >> 4 & 0xF]
+        self.pc[m] += 2
+
+    # The flag-setting instructions write VF first and then read Vx and Vy again, as the Emulator methods do,
+    # so that they give the same result when x or y is F.
+
+    def instruction_8xy4(self, m, opcodes):
+        x, y = opcodes >> 8 & 0xF, opcodes >> 4 & 0xF
+        registers = self.registers
+        registers[m, 0xF] = registers[m, x].astype(np.int64) + registers[m, y] >= 256
+        registers[m, x] = (registers[m, x].astype(np.int64) + registers[m, y]) & 0xFF
+        self.pc[m] += 2
+
+    def instruction_8xy5(self, m, opcodes):
+        x, y = opcodes >> 8 & 0xF, opcodes >> 4 & 0xF
+        registers = self.registers
+        registers[m, 0xF] = registers[m, x] > registers[m, y]
+        registers[m, x] = registers[m, x] - registers[m, y]
+        self.pc[m] += 2
+
+    def instruction_8xy6(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        registers = self.registers
+        registers[m, 0xF] = registers[m, x] & 0x1
+        registers[m, x] = registers[m, x] >> 1
+        self.pc[m] += 2
+
+    def instruction_8xy7(self, m, opcodes):
+        x, y = opcodes >> 8 & 0xF, opcodes >> 4 & 0xF
+        registers = self.registers
+        registers[m, 0xF] = registers[m, y] > registers[m, x]
+        registers[m, x] = registers[m, y] - registers[m, x]
+        self.pc[m] += 2
+
+    def instruction_8xyE(self, m, opcodes):
+        x = opcodes >> 8 & 0xF
+        registers = self.registers
+        registers[m, 0xF] = registers[m, x] >> 7
+        registers[m, x] = registers[m, x] << 1
+        self.pc[m] += 2
+
+    def instruction_9xy0(self, m, opcodes):
+        self.skip_if(m, self.registers[m, opcodes >> 8 & 0xF] != self.registers[m, opcodes >> 4 & 0xF])
+
+    def instruction_Annn(self, m, opcodes):
+        self.I[m] = opcodes & 0xFFF
+        self.pc[m] += 2
+
+    def instruction_Bnnn(self, m, opcodes):
+        self.pc[m] = (opcodes & 0xFFF) + self.registers[m, 0]
+
+    def instruction_Cxkk(self, m, opcodes):
+        # Same range as Emulator.instruction_Cxkk, random.randrange(255).
+        self.registers[m, opcodes >> 8 & 0xF] = self.random.integers(0, 255, size=len(m)) & opcodes & 0xFF
+        self.pc[m] += 2
+
+    def instruction_Dxyn(self, m, opcodes):
+        rows = opcodes & 0xF
+        I = self.I[m]
+        past_end = I + rows > MEMORY_SIZE
+        if past_end.any():
+            self.fault(m[past_end])
+            m, opcodes, rows, I = m[~past_end], opcodes[~past_end], rows[~past_end], I[~past_end]
+
+        # Every machine's sprite is handled as 15 rows, with the rows past its n masked out.
+        offsets = np.arange(15)
+        row_used = offsets < rows[:, np.newaxis]
+        addresses = np.minimum(I[:, np.newaxis] + offsets, MEMORY_SIZE - 1)
+        sprite_bytes = np.where(row_used, self.memory[m[:, np.newaxis], addresses], 0)
+        # (machine, column, row), laid out like the framebuffer.
+        sprite = SPRITE_BITS[sprite_bytes].transpose(0, 2, 1)
+
+        columns = (self.registers[m, opcodes >> 8 & 0xF][:, np.newaxis] + np.arange(8)) % 64
+        screen_rows = (self.registers[m, opcodes >> 4 & 0xF][:, np.newaxis] + offsets) % 32
+        area = (m[:, np.newaxis, np.newaxis], columns[:, :, np.newaxis], screen_rows[:, np.newaxis, :])
+        screen_area = self.pixels[area]
+        self.registers[m, 0xF] = (screen_area & sprite).any(axis=(1, 2))
+        self.pixels[area] = screen_area ^ sprite
+        self.pc[m] += 2
+
+    def key_skip(self, m, opcodes, pressed):
+        keys = self.registers[m, opcodes >> 8 & 0xF]
+        invalid = keys >= 16
+        if invalid.any():
+            self.fault(m[invalid])
+            m, keys = m[~invalid], keys[~invalid]
+        self.skip_if(m, (self.keys[m, keys] != 0) == pressed)
+
+    def instruction_Ex9E(self, m, opcodes):
+        self.key_skip(m, opcodes, True)
+
+    def instruction_ExA1(self, m, opcodes):
+        self.key_skip(m, opcodes, False)
+
+    def instruction_Fx07(self, m, opcodes):
+        self.registers[m, opcodes >> 8 & 0xF] = self.delay_timer[m]
+        self.pc[m] += 2
+
+    def instruction_Fx0A(self, m, opcodes):
+        keys = self.keys[m]
+        # Machines without a pressed key stay on this instruction.
+        waiting = ~keys.any(axis=1)
+        m, opcodes, keys = m[~waiting], opcodes[~waiting], keys[~waiting]
+        self.registers[m, opcodes >> 8 & 0xF] = keys.argmax(axis=1)
+        self.pc[m] += 2
+
+    def instruction_Fx15(self, m, opcodes):
+        self.delay_timer[m] = self.registers[m, opcodes >> 8 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_Fx18(self, m, opcodes):
+        self.sound_timer[m] = self.registers[m, opcodes >> 8 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_Fx1E(self, m, opcodes):
+        self.I[m] += self.registers[m, opcodes >> 8 & 0xF]
+        self.pc[m] += 2
+
+    def instruction_Fx29(self, m, opcodes):
+        self.I[m] = self.sprites_base_addr + 5 * self.registers[m, opcodes >> 8 & 0xF].astype(np.int64)
+        self.pc[m] += 2
+
+    def instruction_Fx33(self, m, opcodes):
+        I = self.I[m]
+        past_end = I + 3 > MEMORY_SIZE
+        if past_end.any():
+            self.fault(m[past_end])
+            m, opcodes, I = m[~past_end], opcodes[~past_end], I[~past_end]
+        value = self.registers[m, opcodes >> 8 & 0xF]
+        self.memory[m, I] = value // 100 % 10
+        self.memory[m, I + 1] = value // 10 % 10
+        self.memory[m, I + 2] = value % 10
+        self.pc[m] += 2
+
+    def register_transfer(self, m, opcodes):
+        """Return the valid machines and the (machine, register, address) index arrays of Fx55 and Fx65."""
+
+        x = opcodes >> 8 & 0xF
+        past_end = self.I[m] + x + 1 > MEMORY_SIZE
+        if past_end.any():
+            self.fault(m[past_end])
+            m, x = m[~past_end], x[~past_end]
+        rows, registers = np.nonzero(np.arange(16) <= x[:, np.newaxis])
+        machines = m[rows]
+        return m, machines, registers, self.I[machines] + registers
+
+    def instruction_Fx55(self, m, opcodes):
+        m, machines, registers, addresses = self.register_transfer(m, opcodes)
+        self.memory[machines, addresses] = self.registers[machines, registers]
+        self.pc[m] += 2
+
+    def instruction_Fx65(self, m, opcodes):
+        m, machines, registers, addresses = self.register_transfer(m, opcodes)
+        self.registers[machines, registers] = self.memory[machines, addresses]
+        self.pc[m] += 2
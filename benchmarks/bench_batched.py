@@ -0,0 +1,63 @@
+"""Compare aggregate throughput of the batched engine with one Emulator object per instance.
+
+Run from the repository root:
+    python -m benchmarks.bench_batched [--counts 1,100,1000,10000] [--workload NAME] [--seconds S]
+"""
+import argparse
+import time
+
+from batched import BatchedEmulator
+from benchmarks.bench_engines import make_emulator
+from benchmarks.workloads import WORKLOADS
+
+FRAME_CYCLES = 12
+
+
+def time_steps(step, instructions_per_step, seconds):
+    """Call step() for about `seconds` and return the aggregate instructions per second."""
+
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        step()
+        steps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return steps * instructions_per_step / elapsed
+
+
+def bench_objects(rom, count, seconds):
+    emulators = [make_emulator(rom) for _ in range(count)]
+
+    # Each object runs a whole frame's worth of instructions at a time, the best case for separate objects.
+    def step():
+        for emu in emulators:
+            emu.execute(FRAME_CYCLES)
+
+    return time_steps(step, count * FRAME_CYCLES, seconds)
+
+
+def bench_batched(rom, count, seconds):
+    batch = BatchedEmulator(count)
+    batch.load_standard_sprites()
+    batch.load_program(rom)
+    return time_steps(batch.step, count, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default="1,100,1000,10000")
+    parser.add_argument("--workload", default="alu", choices=WORKLOADS)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    rom = WORKLOADS[args.workload]()
+    print(f"{'instances':>10}{'objects':>14}{'batched':>14}{'speedup':>9}")
+    for count in map(int, args.counts.split(",")):
+        objects_ips = bench_objects(rom, count, args.seconds)
+        batched_ips = bench_batched(rom, count, args.seconds)
+        print(f"{count:>10,}{objects_ips:>14,.0f}{batched_ips:>14,.0f}{batched_ips / objects_ips:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
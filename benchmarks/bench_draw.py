@@ -0,0 +1,38 @@
+"""Measure sprite drawing throughput of instruction_Dxyn.
+
+Run from the repository root:
+    python -m benchmarks.bench_draw [--sprites N]
+"""
+import argparse
+import time
+
+from emulator import Emulator
+
+
+def bench(rows, wrap, sprites):
+    emu = Emulator("", False)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.I = 0
+    # Positions 60/30 make every sprite wrap around both screen edges.
+    emu.registers[0] = 60 if wrap else 10
+    emu.registers[1] = 30 if wrap else 10
+    start = time.perf_counter()
+    for _ in range(sprites):
+        emu.instruction_Dxyn(0, 1, rows)
+    return sprites / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sprites", type=int, default=20_000)
+    args = parser.parse_args()
+
+    for rows in (5, 15):
+        for wrap in (False, True):
+            rate = bench(rows, wrap, args.sprites)
+            print(f"{rows:>2} rows{' wrapped' if wrap else '':<9}{rate:>12,.0f} sprites/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare execution engines on the synthetic workloads.
+
+Run from the repository root:
+    python -m benchmarks.bench_engines [--cycles N] [--cycles-per-frame N]
+"""
+import argparse
+import time
+
+from block_cache import BlockCache
+from jit import Jit
+from emulator import Emulator
+from benchmarks.workloads import WORKLOADS
+
+
+def make_emulator(rom):
+    emu = Emulator("", False)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.memory[512:512 + len(rom)] = rom
+    return emu
+
+
+def run(emu, cycles, cycles_per_frame):
+    """Run `cycles` instructions in frames, decrementing the timers between frames. Returns instructions/s."""
+
+    start = time.perf_counter()
+    while emu.cycles < cycles:
+        emu.execute(min(cycles_per_frame, cycles - emu.cycles))
+        if emu.delay_timer > 0:
+            emu.delay_timer -= 1
+        if emu.sound_timer > 0:
+            emu.sound_timer -= 1
+    return cycles / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=300_000)
+    parser.add_argument("--cycles-per-frame", type=int, default=1000)
+    args = parser.parse_args()
+
+    engines = {"blocks": BlockCache, "jit": Jit}
+    print(f"{'workload':<16}{'interpreter':>14}" + "".join(f"{name:>14}{'speedup':>9}" for name in engines))
+    for name, workload in WORKLOADS.items():
+        rom = workload()
+        interpreter_ips = run(make_emulator(rom), args.cycles, args.cycles_per_frame)
+        row = f"{name:<16}{interpreter_ips:>14,.0f}"
+        for engine in engines.values():
+            emu = make_emulator(rom)
+            engine(emu).install()
+            ips = run(emu, args.cycles, args.cycles_per_frame)
+            row += f"{ips:>14,.0f}{ips / interpreter_ips:>8.2f}x"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
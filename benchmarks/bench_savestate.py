@@ -0,0 +1,67 @@
+"""Measure save state latency, the memory used by a minute of rewind and the size of incremental snapshots.
+
+Run from the repository root:
+    python -m benchmarks.bench_savestate [--frames N]
+"""
+import argparse
+import timeit
+
+from rewind import RewindBuffer
+from snapshots import Snapshotter
+from scheduler import DEFAULT_IPS, TIMER_FREQUENCY, cycles_for_tick
+from benchmarks.bench_engines import make_emulator
+from benchmarks.workloads import WORKLOADS
+
+
+def latency(function, number=20_000):
+    """Best time of one call to function, in microseconds."""
+
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=60 * TIMER_FREQUENCY)
+    args = parser.parse_args()
+
+    print(f"{'workload':<16}{'save us':>9}{'load us':>9}{'record us':>11}{'rewind us':>11}{'KiB/min':>9}")
+    for name, workload in WORKLOADS.items():
+        emu = make_emulator(workload())
+        rewind = RewindBuffer(emu, capacity=args.frames)
+        record_time = 0.0
+        for frame in range(args.frames):
+            emu.execute(cycles_for_tick(DEFAULT_IPS, frame))
+            emu.tick_timers()
+            record_time += timeit.timeit(rewind.record, number=1)
+        per_minute = rewind.memory_used * 60 * TIMER_FREQUENCY / args.frames
+
+        state = emu.save_state()
+        save = latency(emu.save_state)
+        load = latency(lambda: emu.load_state(state))
+        rewind_time = latency(lambda: rewind.emulator.load_state(rewind.state(30)), number=2000)
+        print(f"{name:<16}{save:>9.1f}{load:>9.1f}{record_time / args.frames * 1e6:>11.1f}{rewind_time:>11.1f}"
+              f"{per_minute / 1024:>9,.0f}")
+    print(f"full save state: {len(state):,} bytes, one minute of full states: "
+          f"{len(state) * 60 * TIMER_FREQUENCY / 1024:,.0f} KiB")
+
+    print()
+    print(f"{'workload':<16}{'bytes/snap':>11}{'take us':>9}{'restore us':>12}{'KiB/min':>9}")
+    for name, workload in WORKLOADS.items():
+        emu = make_emulator(workload())
+        snapshotter = Snapshotter(emu)
+        snapshots = []
+        take_time = 0.0
+        for frame in range(args.frames):
+            emu.execute(cycles_for_tick(DEFAULT_IPS, frame))
+            emu.tick_timers()
+            take_time += timeit.timeit(lambda: snapshots.append(snapshotter.take()), number=1)
+        stored = sum(snapshot.nbytes for snapshot in snapshots)
+        # Restoring the snapshot furthest from a full one walks the longest chain.
+        deepest = max(snapshots, key=lambda snapshot: snapshot.depth)
+        restore = latency(lambda: snapshotter.restore(deepest), number=2000)
+        print(f"{name:<16}{stored / len(snapshots):>11,.0f}{take_time / args.frames * 1e6:>9.1f}{restore:>12.1f}"
+              f"{stored * 60 * TIMER_FREQUENCY / args.frames / 1024:>9,.0f}")
+
+
+if __name__ == "__main__":
+    main()
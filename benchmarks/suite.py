@@ -0,0 +1,167 @@
+"""Benchmark suite: per-opcode-class and realistic workloads, compared against a committed baseline.
+
+Run from the repository root:
+    python -m benchmarks.suite [--cycles N] [--engines interpreter,jit] [--roms DIR]
+                               [--output results.json] [--baseline FILE] [--tolerance T] [--update-baseline]
+
+Every workload runs headless for a fixed number of instructions, in 1000-instruction frames with the timers
+decremented in between. For each workload and engine the suite reports instructions per second (best of
+--repeat runs), nanoseconds per instruction and the peak Python memory allocated while running. For the op_*
+workloads nearly every instruction belongs to one opcode class, so ns/op is that class's cost. The JIT runs
+with idle loop elision off, since skipped instructions would count as executed ones.
+
+Host speed drifts, especially on shared machines, so each measurement is bracketed by a short pure-Python
+calibration loop, and the "score" of a workload is its IPS times the calibration time: instructions per
+calibration loop. A workload whose score falls more than --tolerance below its baseline score is a regression,
+and the suite exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from engines import ENGINES
+from jit import Jit
+from benchmarks.bench_engines import make_emulator, run
+from benchmarks.workloads import OPCODE_WORKLOADS, WORKLOADS
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def load_roms(directory):
+    """Return {name: ROM bytes} for the .ch8 files in directory."""
+
+    roms = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(".ch8"):
+            with open(os.path.join(directory, name), "rb") as f:
+                roms["rom_" + os.path.splitext(name)[0]] = f.read()
+    return roms
+
+
+def prepare(rom, engine):
+    emu = make_emulator(rom)
+    if ENGINES[engine] is not None:
+        engine = ENGINES[engine](emu)
+        if isinstance(engine, Jit):
+            engine.elide_idle_loops = False
+        engine.install()
+    return emu
+
+
+def calibrate():
+    """Best time, in seconds, of a fixed pure-Python loop that stands for the host's current speed."""
+
+    best = float("inf")
+    data = list(range(256))
+    for _ in range(5):
+        start = time.perf_counter()
+        total = 0
+        for i in range(100_000):
+            total = (total + data[i & 255]) & 0xFFFF
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(rom, engine, cycles, repeat):
+    """Return the results of one workload on one engine."""
+
+    try:
+        calibration = calibrate()
+        ips = max(run(prepare(rom, engine), cycles, 1000) for _ in range(repeat))
+        calibration = (calibration + calibrate()) / 2
+        tracemalloc.start()
+        run(prepare(rom, engine), max(cycles // 10, 1), 1000)
+        peak = tracemalloc.get_traced_memory()[1]
+    except Exception as fault:
+        return {"fault": f"{type(fault).__name__}: {fault}"}
+    finally:
+        tracemalloc.stop()
+    return {
+        "ips": round(ips),
+        "ns_per_op": round(1e9 / ips, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "score": round(ips * calibration),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages."""
+
+    regressions = []
+    for key, expected in baseline["results"].items():
+        actual = results.get(key)
+        if actual is None or "score" not in expected:
+            continue
+        if "score" not in actual:
+            regressions.append(f"{key}: {actual['fault']}")
+        elif actual["score"] < expected["score"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: score {actual['score']:,} is {1 - actual['score'] / expected['score']:.0%} below the "
+                f"baseline {expected['score']:,} ({actual['ips']:,} IPS, baseline {expected['ips']:,} IPS)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--engines", default="interpreter,jit")
+    parser.add_argument("--roms", help="directory of .ch8 files to run as well, for example Pong")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed score drop, as a fraction")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    workloads = {name: workload() for name, workload in {**OPCODE_WORKLOADS, **WORKLOADS}.items()}
+    if args.roms:
+        workloads.update(load_roms(args.roms))
+
+    results = {}
+    print(f"{'workload':<24}{'engine':<13}{'IPS':>12}{'ns/op':>9}{'peak KiB':>10}{'score':>8}")
+    for name, rom in workloads.items():
+        for engine in args.engines.split(","):
+            key = f"{name}/{engine}"
+            result = results[key] = measure(rom, engine, args.cycles, args.repeat)
+            if "fault" in result:
+                print(f"{name:<24}{engine:<13}{result['fault']}")
+            else:
+                print(f"{name:<24}{engine:<13}{result['ips']:>12,}{result['ns_per_op']:>9}{result['peak_kib']:>10}"
+                      f"{result['score']:>8,}")
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cycles": args.cycles,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\nPERFORMANCE REGRESSION (tolerance {args.tolerance:.0%}):", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Synthetic Chip-8 programs used by the benchmarks.
+
+Every program loops forever, so they can be run for any number of cycles.
+"""
+
+
+def assemble(*opcodes):
+    """Return the ROM bytes for a sequence of 16-bit opcodes, loaded at 0x200."""
+
+    return b"".join(opcode.to_bytes(2, "big") for opcode in opcodes)
+
+
+def alu_loop():
+    """Straight-line register arithmetic closed by a jump."""
+
+    return assemble(
+        0x6005,  # 200: V0 = 5
+        0x6103,  # 202: V1 = 3
+        0x8014,  # 204: V0 += V1
+        0x7101,  # 206: V1 += 1
+        0x8125,  # 208: V1 -= V2
+        0x8203,  # 20A: V2 ^= V0
+        0xA300,  # 20C: I = 0x300
+        0xF01E,  # 20E: I += V0
+        0x1204,  # 210: jump 0x204
+    )
+
+
+def sprite_loop():
+    """Pong-like frame: move and redraw a sprite, then wait for the delay timer."""
+
+    return assemble(
+        0x6000,  # 200: V0 = 0 (x)
+        0x6100,  # 202: V1 = 0 (y)
+        0x6208,  # 204: V2 = 8
+        0xF229,  # 206: I = sprite for digit V2
+        0xD015,  # 208: draw (erase) at (V0, V1)
+        0x7001,  # 20A: V0 += 1
+        0x7101,  # 20C: V1 += 1
+        0xD015,  # 20E: draw at (V0, V1)
+        0x3F01,  # 210: skip next if collision
+        0x6000,  # 212: V0 = 0
+        0x6301,  # 214: V3 = 1
+        0xF315,  # 216: delay timer = V3
+        0xF407,  # 218: V4 = delay timer
+        0x3400,  # 21A: skip next if V4 == 0
+        0x1218,  # 21C: jump 0x218
+        0x1208,  # 21E: jump 0x208
+    )
+
+
+def subroutine_loop():
+    """Calls into a small subroutine and returns."""
+
+    return assemble(
+        0x2206,  # 200: call 0x206
+        0x7001,  # 202: V0 += 1
+        0x1200,  # 204: jump 0x200
+        0x8104,  # 206: V1 += V0
+        0x8216,  # 208: V2 >>= 1
+        0x00EE,  # 20A: return
+    )
+
+
+def score_loop():
+    """Stores a BCD score in a data area and reads it back, as score displays do."""
+
+    return assemble(
+        0x7001,  # 200: V0 += 1
+        0xA300,  # 202: I = 0x300
+        0xF033,  # 204: BCD of V0 at I
+        0xF265,  # 206: V0..V2 = memory[I..I+2]
+        0x6100,  # 208: V1 = 0
+        0x1200,  # 20A: jump 0x200
+    )
+
+
+def self_modifying_loop():
+    """Rewrites the immediate of its own first instruction with Fx55 on every iteration."""
+
+    return assemble(
+        0x6300,  # 200: V3 = kk, kk is rewritten below
+        0x6063,  # 202: V0 = 0x63, the high byte of "V3 = kk"
+        0x7101,  # 204: V1 += 1
+        0xA200,  # 206: I = 0x200
+        0xF155,  # 208: memory[0x200..0x201] = V0, V1, so 0x200 becomes "V3 = V1"
+        0x1200,  # 20A: jump 0x200
+    )
+
+
+WORKLOADS = {
+    "alu": alu_loop,
+    "sprites": sprite_loop,
+    "subroutines": subroutine_loop,
+    "score": score_loop,
+    "self_modifying": self_modifying_loop,
+}
+
+
+def alu_opcodes():
+    """Every 8xy* instruction on four register pairs."""
+
+    body = [0x8000 | x << 8 | (x + 4) << 4 | op for x in range(4) for op in (0, 1, 2, 3, 4, 5, 6, 7, 0xE)]
+    return assemble(*body, 0x1200)
+
+
+def branch_opcodes():
+    """3xkk, 4xkk, 5xy0 and 9xy0, half of them skipping. V0 = V1 = 0."""
+
+    return assemble(
+        0x3001,  # 200: not skipped
+        0x4001,  # 202: skips 204
+        0x6000,  # 204
+        0x5010,  # 206: skips 208
+        0x6000,  # 208
+        0x9010,  # 20A: not skipped
+        0x3000,  # 20C: skips 20E
+        0x6000,  # 20E
+        0x4000,  # 210: not skipped
+        0x1200,  # 212: jump 0x200
+    )
+
+
+def draw_opcodes():
+    """5-row sprite draws at four positions, each drawn and erased in turn."""
+
+    body = [0xD045 | x << 8 for x in range(4)] * 4
+    return assemble(0x6000, 0x6110, 0x6220, 0x6330, 0x6408, 0xA000, *body, 0x120C)
+
+
+def memory_opcodes():
+    """Fx55 and Fx65 register copies of 1 to 16 registers."""
+
+    return assemble(0xA300, 0xF055, 0xF065, 0xF755, 0xF765, 0xFF55, 0xFF65, 0x1202)
+
+
+def call_opcodes():
+    """Nested calls and returns."""
+
+    return assemble(
+        0x2204,  # 200: call 0x204
+        0x1200,  # 202: jump 0x200
+        0x2208,  # 204: call 0x208
+        0x00EE,  # 206: return to 0x202
+        0x00EE,  # 208: return to 0x206
+    )
+
+
+# One program per opcode class, nearly every executed instruction belongs to the class.
+OPCODE_WORKLOADS = {
+    "op_alu": alu_opcodes,
+    "op_branch": branch_opcodes,
+    "op_draw": draw_opcodes,
+    "op_memory": memory_opcodes,
+    "op_call": call_opcodes,
+}
@@ -0,0 +1,185 @@
+MEMORY_SIZE = 4096
+
+# A start PC whose block has been invalidated this many times is left to the interpreter from then on,
+# so code that rewrites itself in a loop does not pay for a recompilation on every iteration.
+RECOMPILATION_LIMIT = 8
+
+# Instructions that end a basic block: they transfer control (jumps, skips, calls and returns), may keep PC
+# where it is (Fx0A), or write to memory and so may modify the code that follows them.
+BLOCK_TERMINATORS = frozenset({
+    "instruction_00EE",
+    "instruction_1nnn",
+    "instruction_2nnn",
+    "instruction_3xkk",
+    "instruction_4xkk",
+    "instruction_5xy0",
+    "instruction_9xy0",
+    "instruction_Bnnn",
+    "instruction_Ex9E",
+    "instruction_ExA1",
+    "instruction_Fx0A",
+    "instruction_Fx33",
+    "instruction_Fx55",
+})
+
+
+class BlockCache:
+    """Execution engine that compiles straight-line runs of instructions into single Python callables.
+
+    Blocks are keyed by their start PC. A block is dropped as soon as an instruction writes into the addresses
+    it was compiled from, so self-modifying programs still execute the code that is actually in memory.
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        # start PC -> (callable, number of instructions, end address).
+        self.blocks = {}
+        # code_owners[address] is the set of start PCs of the blocks compiled from that address.
+        self.code_owners = [None] * MEMORY_SIZE
+        # Number of times the block at each start PC has been invalidated.
+        self.invalidation_counts = [0] * MEMORY_SIZE
+        # Addresses a block may start at but not run into, so that they are always seen between blocks.
+        self.stop_addresses = ()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def install(self):
+        """Make this cache the emulator's execution engine."""
+
+        self.flush()
+        self.emulator.write_observers.append(self.invalidate)
+        self.emulator.execute = self.execute
+
+    def uninstall(self):
+        """Restore the plain interpreter."""
+
+        self.emulator.write_observers.remove(self.invalidate)
+        self.emulator.execute = self.emulator.interpret
+        self.flush()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def flush(self):
+        """Drop every compiled block."""
+
+        self.blocks.clear()
+        self.code_owners = [None] * MEMORY_SIZE
+        self.invalidation_counts = [0] * MEMORY_SIZE
+
+    def preload(self, starts):
+        """Compile the blocks starting at the given addresses before they run, for example the basic blocks of a
+        disassembler.Analysis, instead of discovering them during the first frames."""
+
+        for start in starts:
+            if start not in self.blocks and start < MEMORY_SIZE - 1:
+                self.compile_block(start)
+
+    def invalidate(self, address, length):
+        """Drop the blocks compiled from any address in memory[address:address + length]."""
+
+        code_owners = self.code_owners
+        for owned_address in range(address, min(address + length, MEMORY_SIZE)):
+            owners = code_owners[owned_address]
+            if owners:
+                for start in list(owners):
+                    self.drop(start)
+
+    def drop(self, start):
+        """Drop the block starting at `start`."""
+
+        _, _, end = self.blocks.pop(start)
+        for address in range(start, end):
+            self.code_owners[address].discard(start)
+        self.invalidation_counts[start] += 1
+        self.invalidations += 1
+
+    def compile_block(self, start):
+        """Compile the block starting at `start`. Returns None if it should be left to the interpreter."""
+
+        if self.invalidation_counts[start] >= RECOMPILATION_LIMIT:
+            return None
+
+        memory = self.emulator.memory
+        decode_table = self.emulator.opcode_to_function_mapping
+
+        steps = []
+        pc = start
+        while pc < MEMORY_SIZE - 1:
+            instruction, operands = decode_table[memory[pc] << 8 | memory[pc + 1]]
+            name = instruction.__name__
+            # Unknown opcodes are left to the interpreter, which raises the fault with the right PC.
+            if name == "unknown_instruction":
+                break
+            steps.append((instruction, operands))
+            pc += 2
+            if name in BLOCK_TERMINATORS or pc in self.stop_addresses:
+                break
+        if not steps:
+            return None
+
+        namespace = {}
+        lines = ["def block(self):"]
+        for i, (instruction, operands) in enumerate(steps):
+            namespace[f"instruction_{i}"] = instruction
+            arguments = "".join(f", {operand}" for operand in operands)
+            lines.append(f"    instruction_{i}(self{arguments})")
+        exec(compile("\n".join(lines), f"<block {start:#05x}>", "exec"), namespace)
+
+        block = (namespace["block"], len(steps), pc)
+        self.blocks[start] = block
+        for address in range(start, pc):
+            if self.code_owners[address] is None:
+                self.code_owners[address] = set()
+            self.code_owners[address].add(start)
+        return block
+
+    def execute(self, cycles):
+        """Execute up to `cycles` instructions block by block and return how many were executed."""
+
+        emulator = self.emulator
+        blocks = self.blocks
+        executed = 0
+        interpreted = 0
+        hits = 0
+        misses = 0
+        block_pc = None
+        try:
+            while executed < cycles:
+                pc = emulator.pc
+                block = blocks.get(pc)
+                if block is None:
+                    misses += 1
+                    block = self.compile_block(pc)
+                    if block is None:
+                        ran = emulator.interpret(1)
+                        executed += ran
+                        interpreted += ran
+                        continue
+                else:
+                    hits += 1
+                run, length, _ = block
+                if length > cycles - executed:
+                    # Not enough budget left for the whole block, finish instruction by instruction.
+                    ran = emulator.interpret(cycles - executed)
+                    executed += ran
+                    interpreted += ran
+                    break
+                block_pc = pc
+                run(emulator)
+                block_pc = None
+                executed += length
+        except Exception:
+            if block_pc is not None:
+                # Every instruction but a block's last advances PC by 2, so PC tells how far the block got.
+                executed += (emulator.pc - block_pc) // 2
+            raise
+        finally:
+            emulator.cycles += executed - interpreted
+            self.hits += hits
+            self.misses += misses
+        return executed
@@ -0,0 +1,293 @@
+"""Run a ROM until a breakpoint or watchpoint fires, then single-step it in the debug window.
+
+Usage:
+    python debugger.py ROM [--break ADDR[:CONDITION]]... [--watch START[-END]]... [--headless] [--frames N]
+        [--cache-dir DIR | --no-cache]
+
+A condition compares a register with a number, for example --break 0x2A4:V3==0x2A. Registers are V0-VF, I, DT
+(delay timer) and ST (sound timer). Watchpoints fire after any instruction that writes into the address range,
+such as Fx33 and Fx55. With --headless the ROM runs unthrottled and the machine state is printed when one fires.
+"""
+import argparse
+import operator
+import re
+import sys
+
+from block_cache import BlockCache
+from disassembler import add_cache_arguments
+from emulator import Emulator
+from faults import EmulatorFault
+from jit import Jit
+from quirks import select_quirks
+from scheduler import Scheduler
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+CONDITION = re.compile(r"\s*(V[0-9A-F]|I|DT|ST)\s*(==|!=|<=|>=|<|>)\s*(\w+)\s*$", re.IGNORECASE)
+
+
+class Condition:
+    """Compares a register, I or a timer with a constant."""
+
+    def __init__(self, register, comparison, value):
+        self.register = register.upper()
+        self.comparison = comparison
+        self.value = value
+
+    def __call__(self, emulator):
+        register = self.register
+        if register == "I":
+            current = emulator.I
+        elif register == "DT":
+            current = emulator.delay_timer
+        elif register == "ST":
+            current = emulator.sound_timer
+        else:
+            current = emulator.registers[int(register[1], 16)]
+        return COMPARISONS[self.comparison](current, self.value)
+
+    def __str__(self):
+        return f"{self.register} {self.comparison} {self.value:#x}"
+
+    @classmethod
+    def parse(cls, text):
+        """Parse a condition like "V3 == 0x2A"."""
+
+        match = CONDITION.match(text)
+        if match is None:
+            raise ValueError(f"cannot parse condition {text!r}")
+        register, comparison, value = match.groups()
+        return cls(register, comparison, int(value, 0))
+
+
+class Debugger(BlockCache):
+    """PC breakpoints, optionally conditional, and memory write watchpoints.
+
+    install() records the emulator's execution engine. While no breakpoint or watchpoint is set that engine keeps
+    running, so there is no cost at all. Otherwise the debugger's own execute() runs instead: a block cache whose
+    blocks never run into a breakpoint address, so breakpoints are only looked up between blocks, and whose
+    write observer checks the watched ranges. Instructions that write memory end their block, so a watchpoint
+    stops execution right after the instruction that fired it.
+
+    When one fires, execute() returns early, `hit` describes it and the on_break callbacks are called with the
+    debugger. The next execute() continues from the breakpoint without firing it again.
+    """
+
+    def __init__(self, emulator):
+        super().__init__(emulator)
+        # PC -> Condition, or None to break whenever the instruction at PC is reached.
+        self.breakpoints = {}
+        # (start, end) address ranges, end excluded.
+        self.watchpoints = []
+        self.stop_addresses = self.breakpoints
+        # Callables invoked as callback(debugger) when a breakpoint or watchpoint fires.
+        self.on_break = []
+        # ("break", pc, condition) or ("watch", address, length) for the last one that fired, None if none did.
+        self.hit = None
+        self.breaks = 0
+        # PC to leave unchecked once, so that execution can continue from a breakpoint.
+        self.resume_pc = None
+        # Execution engine that runs while nothing is set.
+        self.engine = None
+
+    def install(self):
+        """Take over from the emulator's current execution engine whenever a breakpoint or watchpoint is set."""
+
+        self.engine = self.emulator.execute
+        self.update()
+
+    def uninstall(self):
+        """Restore the engine the emulator had when the debugger was installed."""
+
+        engine = self.engine
+        self.engine = None
+        self.update()
+        self.emulator.execute = engine
+
+    @property
+    def active(self):
+        return self.engine is not None and bool(self.breakpoints or self.watchpoints)
+
+    def update(self):
+        """Swap the checking engine in or out after the breakpoints or watchpoints changed."""
+
+        emulator = self.emulator
+        if self.active and emulator.execute != self.execute:
+            self.flush()
+            emulator.write_observers.append(self.invalidate)
+            emulator.write_observers.append(self.watch)
+            emulator.execute = self.execute
+        elif not self.active and self.watch in emulator.write_observers:
+            emulator.write_observers.remove(self.invalidate)
+            emulator.write_observers.remove(self.watch)
+            if self.engine is not None:
+                emulator.execute = self.engine
+            self.flush()
+
+    def add_breakpoint(self, pc, condition=None):
+        self.breakpoints[pc] = condition
+        # Blocks compiled earlier may run through the new address.
+        self.flush()
+        self.update()
+
+    def remove_breakpoint(self, pc):
+        del self.breakpoints[pc]
+        self.flush()
+        self.update()
+
+    def add_watchpoint(self, start, end=None):
+        """Watch writes to memory[start:end], or to the byte at start."""
+
+        self.watchpoints.append((start, start + 1 if end is None else end))
+        self.update()
+
+    def remove_watchpoint(self, start, end=None):
+        self.watchpoints.remove((start, start + 1 if end is None else end))
+        self.update()
+
+    def fire(self, hit):
+        self.hit = hit
+        self.breaks += 1
+        for callback in self.on_break:
+            callback(self)
+
+    def watch(self, address, length):
+        """Write observer: fire if memory[address:address + length] overlaps a watched range."""
+
+        for start, end in self.watchpoints:
+            if address < end and start < address + length:
+                self.fire(("watch", address, length))
+                return
+
+    def execute(self, cycles):
+        """Execute up to `cycles` instructions block by block, stopping early when a breakpoint or watchpoint
+        fires. Returns how many were executed."""
+
+        emulator = self.emulator
+        blocks = self.blocks
+        breakpoints = self.breakpoints
+        resume_pc = self.resume_pc
+        self.resume_pc = None
+        self.hit = None
+        executed = 0
+        interpreted = 0
+        block_pc = None
+        try:
+            while executed < cycles:
+                pc = emulator.pc
+                if pc in breakpoints and pc != resume_pc:
+                    condition = breakpoints[pc]
+                    if condition is None or condition(emulator):
+                        self.resume_pc = pc
+                        self.fire(("break", pc, condition))
+                        break
+                resume_pc = None
+                block = blocks.get(pc)
+                if block is None:
+                    block = self.compile_block(pc)
+                if block is None or block[1] > cycles - executed:
+                    ran = emulator.interpret(1)
+                    executed += ran
+                    interpreted += ran
+                else:
+                    block_pc = pc
+                    block[0](emulator)
+                    block_pc = None
+                    executed += block[1]
+                if self.hit is not None:
+                    break
+        except Exception:
+            if block_pc is not None:
+                executed += (emulator.pc - block_pc) // 2
+            raise
+        finally:
+            emulator.cycles += executed - interpreted
+        return executed
+
+
+def describe(hit):
+    if hit[0] == "break":
+        _, pc, condition = hit
+        return f"breakpoint at {pc:#05x}" + (f" ({condition})" if condition is not None else "")
+    _, address, length = hit
+    return f"watchpoint: write to {address:#05x}-{address + length - 1:#05x}"
+
+
+def machine_state(emulator):
+    registers = " ".join(f"V{i:X}={value:02X}" for i, value in enumerate(emulator.registers))
+    stack = " ".join(f"{address:03X}" for address in emulator.stack[:emulator.stack_pointer])
+    return (f"PC={emulator.pc:03X} I={emulator.I:03X} SP={emulator.stack_pointer} DT={emulator.delay_timer} "
+            f"ST={emulator.sound_timer} cycles={emulator.cycles:,}\n{registers}\nstack: {stack}")
+
+
+def parse_breakpoint(text):
+    """Parse "ADDR" or "ADDR:CONDITION" into (pc, condition)."""
+
+    address, _, condition = text.partition(":")
+    return int(address, 0), Condition.parse(condition) if condition else None
+
+
+def parse_watchpoint(text):
+    """Parse "START" or "START-END" (END included) into (start, end) with end excluded."""
+
+    start, _, end = text.partition("-")
+    start = int(start, 0)
+    return start, int(end, 0) + 1 if end else start + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rom")
+    parser.add_argument("--break", dest="breakpoints", action="append", default=[], type=parse_breakpoint)
+    parser.add_argument("--watch", dest="watchpoints", action="append", default=[], type=parse_watchpoint)
+    parser.add_argument("--headless", action="store_true", help="run without a window and print the state")
+    parser.add_argument("--frames", type=int, help="give up after this many frames (headless only)")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.headless:
+        # Imported here so that headless runs work without pygame installed.
+        from pygame_frontend import PygameFrontend
+        emu = Emulator(args.rom, True)
+        debugger = Debugger(emu)
+        for pc, condition in args.breakpoints:
+            debugger.add_breakpoint(pc, condition)
+        for start, end in args.watchpoints:
+            debugger.add_watchpoint(start, end)
+        PygameFrontend(emu, debugger=debugger, cache_dir=args.cache_dir).start()
+        return
+
+    emu = Emulator(args.rom, False)
+    select_quirks(emu)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.load_program_into_memory()
+    emu.run = True
+    Jit(emu).install()
+    debugger = Debugger(emu)
+    debugger.install()
+    for pc, condition in args.breakpoints:
+        debugger.add_breakpoint(pc, condition)
+    for start, end in args.watchpoints:
+        debugger.add_watchpoint(start, end)
+    scheduler = Scheduler(emu, sleep=lambda seconds: None)
+    debugger.on_break.append(lambda debugger: scheduler.stop())
+    try:
+        scheduler.run(ticks=args.frames)
+    except EmulatorFault as fault:
+        print(fault, file=sys.stderr)
+        print(machine_state(emu))
+        sys.exit(1)
+    print(describe(debugger.hit) if debugger.hit is not None else f"nothing fired in {scheduler.ticks:,} frames")
+    print(machine_state(emu))
+    sys.exit(0 if debugger.hit is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""Run the same programs on two execution engines and report where they first diverge.
+
+Usage:
+    python difftest.py roms ROM_OR_DIR... [--engines A,B] [--frames N] [--seeds N] [--workers N]
+    python difftest.py fuzz [--cases N] [--length N] [--engines A,B] [--frames N] [--quirks Q] [--workers N]
+    python difftest.py replay ROM LOG [--engines A,B]
+
+Engines are interpreter, blocks, jit and batched (a BatchedEmulator of one machine). Both engines run frame by
+frame with the same seed and key input, and their states are compared at the end of every frame. When a frame
+ends differently, the run is repeated up to the start of that frame and then stepped one instruction at a time,
+which finds the first diverging cycle and the instruction that caused it.
+
+fuzz runs random programs of valid instructions. The ROM runs press random keys, so that games get past their
+title screens. replay feeds both engines the input of a replay.py log, which must have been recorded with the
+ROM. Cases are spread over a process pool.
+
+The batched engine draws Cxkk numbers from a different generator and implements only the default quirks. When
+it is one of the engines, fuzz leaves Cxkk out and refuses --quirks, ROMs that get other quirks from the quirk
+database are skipped, and a run is stopped and reported as skipped at the first Cxkk whose number differs,
+instead of as a divergence.
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batched import BatchedEmulator
+from block_cache import BlockCache
+from emulator import INSTRUCTION_SET, Emulator
+from faults import EmulatorFault, InputLogError
+from jit import Jit
+from quirks import parse_quirks, quirks_for_rom
+from replay import InputLog, ReplayInput
+from scheduler import DEFAULT_IPS, cycles_for_tick
+from sweep import warm_up
+
+ENGINES = ("interpreter", "blocks", "jit", "batched")
+# Instructions that random_program picks less often: computed jumps can land anywhere in the program.
+RARE_INSTRUCTIONS = frozenset({"instruction_Bnnn"})
+SKIP_INSTRUCTIONS = frozenset({"instruction_3xkk", "instruction_4xkk", "instruction_5xy0", "instruction_9xy0",
+                               "instruction_Ex9E", "instruction_ExA1"})
+# Subroutines in a random program, each called only from code before it.
+MAX_SUBROUTINES = 4
+# Memory bytes listed in a state diff before the rest are only counted.
+MAX_LISTED_BYTES = 16
+
+
+class EmulatorMachine:
+    """An Emulator with one of the scalar engines installed."""
+
+    def __init__(self, engine, rom, seed, quirks):
+        emu = self.emulator = Emulator("<difftest>", False, seed=seed, quirks=quirks)
+        emu.map_opcodes_to_functions()
+        emu.load_standard_sprites()
+        emu.load_program(rom)
+        if engine == "blocks":
+            BlockCache(emu).install()
+        elif engine == "jit":
+            Jit(emu).install()
+        self.fault = None
+        # Instructions executed before the fault, which is the cycle of the faulting instruction.
+        self.fault_cycle = None
+
+    def execute(self, cycles):
+        if self.fault is None:
+            try:
+                self.emulator.execute(cycles)
+            except EmulatorFault as fault:
+                self.fault = str(fault)
+                self.fault_cycle = self.emulator.cycles
+
+    def tick_timers(self):
+        self.emulator.tick_timers()
+
+    def set_keys(self, mask):
+        self.emulator.keypad.set_mask(mask)
+
+    def state(self):
+        emu = self.emulator
+        return {
+            "pc": emu.pc, "I": emu.I, "stack_pointer": emu.stack_pointer, "stack": list(emu.stack),
+            "registers": list(emu.registers), "delay_timer": emu.delay_timer, "sound_timer": emu.sound_timer,
+            "memory": bytes(emu.memory), "pixels": emu.pixels.copy(), "faulted": self.fault is not None,
+        }
+
+
+class BatchedMachine:
+    """Machine 0 of a BatchedEmulator."""
+
+    def __init__(self, engine, rom, seed, quirks):
+        batch = self.batch = BatchedEmulator(1, seed)
+        batch.load_standard_sprites()
+        batch.load_program(rom)
+        self.cycles = 0
+        self.fault = None
+        self.fault_cycle = None
+
+    def execute(self, cycles):
+        # One step at a time, to know the cycle of a fault.
+        batch = self.batch
+        for _ in range(cycles):
+            if batch.faulted[0]:
+                break
+            batch.step()
+            if batch.faulted[0]:
+                pc = int(batch.pc[0])
+                self.fault = f"machine faulted at PC {pc:#05x}"
+                self.fault_cycle = self.cycles
+            else:
+                self.cycles += 1
+
+    def tick_timers(self):
+        self.batch.tick_timers()
+
+    def set_keys(self, mask):
+        self.batch.keys[0] = [mask >> key & 1 for key in range(16)]
+
+    def state(self):
+        batch = self.batch
+        return {
+            "pc": int(batch.pc[0]), "I": int(batch.I[0]), "stack_pointer": int(batch.stack_pointer[0]),
+            "stack": batch.stack[0].tolist(), "registers": batch.registers[0].tolist(),
+            "delay_timer": int(batch.delay_timer[0]), "sound_timer": int(batch.sound_timer[0]),
+            "memory": batch.memory[0].tobytes(), "pixels": batch.pixels[0].copy(), "faulted": bool(batch.faulted[0]),
+        }
+
+
+def make_machine(engine, rom, seed, quirks=None):
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    machine_class = BatchedMachine if engine == "batched" else EmulatorMachine
+    return machine_class(engine, rom, seed, quirks)
+
+
+def state_diff(a, b):
+    """Return the differences between two machine states as lines of text, empty if they are equal."""
+
+    lines = []
+    for name in ("pc", "I", "stack_pointer", "delay_timer", "sound_timer", "faulted"):
+        if a[name] != b[name]:
+            lines.append(f"{name}: {a[name]!r} != {b[name]!r}")
+    for index, (left, right) in enumerate(zip(a["registers"], b["registers"])):
+        if left != right:
+            lines.append(f"V{index:X}: {left:#04x} != {right:#04x}")
+    for index, (left, right) in enumerate(zip(a["stack"], b["stack"])):
+        if left != right:
+            lines.append(f"stack[{index}]: {left:#05x} != {right:#05x}")
+    addresses = np.flatnonzero(np.frombuffer(a["memory"], np.uint8) != np.frombuffer(b["memory"], np.uint8))
+    for address in addresses[:MAX_LISTED_BYTES]:
+        lines.append(f"memory[{address:#05x}]: {a['memory'][address]:#04x} != {b['memory'][address]:#04x}")
+    if len(addresses) > MAX_LISTED_BYTES:
+        lines.append(f"... and {len(addresses) - MAX_LISTED_BYTES} more memory bytes")
+    pixels = np.argwhere(a["pixels"] != b["pixels"])
+    if len(pixels):
+        lines.append(f"{len(pixels)} pixels differ, the first at {tuple(int(i) for i in pixels[0])}")
+    return lines
+
+
+class Run:
+    """Two machines fed the same frames and key input."""
+
+    def __init__(self, rom, engines, seed, quirks, events, ips):
+        self.machines = [make_machine(engine, rom, seed, quirks) for engine in engines]
+        log = InputLog(b"", seed, ips)
+        log.events = list(events)
+        self.input = ReplayInput(log)
+        self.ips = ips
+        self.frame = 0
+        self.cycle = 0
+
+    def start_frame(self):
+        mask = self.input.sample(self.cycle)
+        for machine in self.machines:
+            machine.set_keys(mask)
+        return cycles_for_tick(self.ips, self.frame)
+
+    def execute(self, cycles):
+        for machine in self.machines:
+            machine.execute(cycles)
+        self.cycle += cycles
+
+    def end_frame(self):
+        for machine in self.machines:
+            machine.tick_timers()
+        self.frame += 1
+
+    def diff(self):
+        return state_diff(self.machines[0].state(), self.machines[1].state())
+
+    def run_frame(self):
+        self.execute(self.start_frame())
+        self.end_frame()
+
+
+def compare(rom, engines=("interpreter", "jit"), frames=600, seed=0, quirks=None, events=(), ips=DEFAULT_IPS,
+            name=None):
+    """Run `rom` on both engines for `frames` frames and return a report dict. Its "diverged" entry is None, or
+    the frame and cycle of the first difference, the instruction that caused it and the state diff after it.
+    "frames" and "cycles" count what ran before the end of the run, or before the fault if both machines faulted
+    the same way."""
+
+    if quirks is None:
+        quirks = quirks_for_rom(rom)
+    report = {"name": name, "engines": list(engines), "seed": seed, "frames": 0, "cycles": 0, "fault": None,
+              "diverged": None, "skipped": None}
+    if "batched" in engines and quirks:
+        report["skipped"] = "the batched engine implements only the default quirks"
+        return report
+    run = Run(rom, engines, seed, quirks, events, ips)
+    while run.frame < frames:
+        run.run_frame()
+        if run.diff():
+            diverged = locate(rom, engines, seed, quirks, events, ips, run.frame - 1)
+            if "batched" in engines and diverged["opcode"] is not None and diverged["opcode"] & 0xF000 == 0xC000:
+                # Not a bug: the engines draw different random numbers.
+                report["skipped"] = (f"the batched engine draws a different Cxkk number at frame {diverged['frame']},"
+                                     f" cycle {diverged['cycle']:,}")
+            else:
+                report["diverged"] = diverged
+            break
+        if all(machine.fault is not None for machine in run.machines):
+            break
+    machine = run.machines[0]
+    report["frames"] = run.frame
+    report["cycles"] = run.cycle
+    report["fault"] = machine.fault
+    if machine.fault is not None and report["diverged"] is None and report["skipped"] is None:
+        # The frame the fault happened in did not finish.
+        report["frames"] = run.frame - 1
+        report["cycles"] = machine.fault_cycle
+    return report
+
+
+def locate(rom, engines, seed, quirks, events, ips, frame):
+    """Replay up to the start of `frame`, then step through it one instruction at a time to find the first
+    divergence."""
+
+    run = Run(rom, engines, seed, quirks, events, ips)
+    while run.frame < frame:
+        run.run_frame()
+    for _ in range(run.start_frame()):
+        machine = run.machines[0]
+        state = machine.state()
+        pc = state["pc"]
+        opcode = state["memory"][pc] << 8 | state["memory"][pc + 1] if pc < Emulator.MEMORY_SIZE - 1 else None
+        run.execute(1)
+        diff = run.diff()
+        if diff:
+            return {"frame": frame, "cycle": run.cycle - 1, "pc": pc, "opcode": opcode, "diff": diff}
+    run.end_frame()
+    diff = ["after the timer tick"] + run.diff()
+    return {"frame": frame, "cycle": run.cycle, "pc": None, "opcode": None, "diff": diff}
+
+
+def random_program(rng, length, exclude=()):
+    """Return a program of `length` random valid instructions that runs for a while without faulting.
+
+    About half of it is a main loop that ends with a jump back to the start, the rest is a few subroutines that
+    end with 00EE. Jumps stay in the main loop and calls go to a later subroutine, so every return has a call to
+    return to and the stack never overflows. Instructions that need a particular machine state come in a group
+    that sets it up, which jumps and skips never enter: Ex9E, ExA1 and Fx29 follow a 6xkk that loads a key or
+    digit, Bnnn
+    follows loads of V0 (and Vx, for the jump quirk) that take it to an instruction of the main loop, and Fx1E
+    follows an Annn with room for any Vx. I is only loaded with addresses of sprites or of memory after the
+    program, so that Fx33 and Fx55 do not overwrite code.
+    """
+
+    entries = [entry for entry in INSTRUCTION_SET if entry[2] not in exclude and entry[2] != "instruction_00EE"]
+    weights = [1 if entry[2] in RARE_INSTRUCTIONS else 4 for entry in entries]
+    subroutines = min(MAX_SUBROUTINES, length // 16)
+    subroutine_length = length // 2 // subroutines if subroutines else 0
+    main_length = length - subroutines * subroutine_length
+    end = Emulator.PROGRAM_START + 2 * length
+    # Room for Fx1E to add up to 0xFF to I and for Fx55 to store 16 bytes there.
+    free = Emulator.MEMORY_SIZE - end - 0x10F
+
+    def address():
+        return rng.randrange(0x50) if free <= 0 or rng.random() < 0.5 else end + rng.randrange(free)
+
+    def block(size, subroutine, last):
+        """Return `size` opcodes in groups, ending with `last`. Jumps and calls are left as placeholders."""
+
+        groups = []
+        used = 0
+        after_skip = False
+        while used < size - 1:
+            (mask, pattern, name, _), = rng.choices(entries, weights)
+            x = rng.randrange(16) << 8
+            opcode = pattern | rng.getrandbits(16) & ~mask & 0xFFFF
+            if name == "instruction_1nnn":
+                group = [("jump", None)]
+            elif name == "instruction_Bnnn":
+                group = [("computed jump", None)] * 3
+            elif name == "instruction_2nnn":
+                group = [("call", subroutine + 1)]
+            elif name == "instruction_Annn":
+                group = [pattern | address()]
+            elif name == "instruction_Fx1E":
+                group = [0xA000 | address(), pattern | x]
+            elif name in ("instruction_Ex9E", "instruction_ExA1", "instruction_Fx29"):
+                group = [0x6000 | x | rng.randrange(16), pattern | x]
+            else:
+                group = [opcode]
+            skips = name in SKIP_INSTRUCTIONS
+            if (subroutine >= 0 and name in ("instruction_1nnn", "instruction_Bnnn")
+                    or subroutine + 1 >= subroutines and name == "instruction_2nnn"
+                    or after_skip and len(group) > 1 or used + len(group) > size - 1
+                    or skips and used + len(group) == size - 1):
+                continue
+            groups.append(group)
+            used += len(group)
+            after_skip = skips
+        return groups + [[last]]
+
+    blocks = [block(main_length, -1, 0x1000 | Emulator.PROGRAM_START)]
+    blocks += [block(subroutine_length, i, 0x00EE) for i in range(subroutines)]
+
+    # Resolve the placeholders now that the group addresses are known.
+    starts = []
+    pc = Emulator.PROGRAM_START
+    for groups in blocks:
+        starts.append([])
+        for group in groups:
+            starts[-1].append(pc)
+            pc += 2 * len(group)
+    calls = [block_starts[0] for block_starts in starts[1:]]
+    opcodes = []
+    for groups in blocks:
+        for group in groups:
+            kind, argument = group[0] if isinstance(group[0], tuple) else (None, None)
+            if kind == "jump":
+                group = [0x1000 | rng.choice(starts[0])]
+            elif kind == "call":
+                group = [0x2000 | rng.choice(calls[argument:])]
+            elif kind == "computed jump":
+                offset = rng.randrange(0, 0x100, 2)
+                nnn = rng.choice(starts[0]) - offset
+                group = [0x6000 | offset, 0x6000 | nnn & 0xF00 | offset, 0xB000 | nnn]
+            opcodes += group
+    return b"".join(opcode.to_bytes(2, "big") for opcode in opcodes)
+
+
+def random_events(rng, frames, ips=DEFAULT_IPS, every=10):
+    """Return key input that changes every `every` frames to none or one or two random keys pressed."""
+
+    events = []
+    cycle = 0
+    for frame in range(frames):
+        if frame % every == 0:
+            mask = 0
+            for _ in range(rng.choice((0, 1, 1, 2))):
+                mask |= 1 << rng.randrange(16)
+            events.append((cycle, mask))
+        cycle += cycles_for_tick(ips, frame)
+    return events
+
+
+def fuzz_cases(count, length=64, frames=60, engines=("interpreter", "jit"), quirks=frozenset(), first_seed=0):
+    exclude = ("instruction_Cxkk",) if "batched" in engines else ()
+    for seed in range(first_seed, first_seed + count):
+        rng = random.Random(seed)
+        yield {
+            "name": f"fuzz seed {seed}", "rom": random_program(rng, length, exclude), "engines": engines,
+            "frames": frames, "seed": seed, "quirks": quirks, "events": random_events(rng, frames),
+        }
+
+
+def rom_cases(paths, seeds=1, frames=600, engines=("interpreter", "jit")):
+    for path in paths:
+        with open(path, "rb") as f:
+            rom = f.read()
+        for seed in range(seeds):
+            yield {
+                "name": f"{os.path.basename(path)} seed {seed}", "rom": rom, "engines": engines, "frames": frames,
+                "seed": seed, "events": random_events(random.Random(seed), frames),
+            }
+
+
+def replay_case(rom_path, log_path, engines=("interpreter", "jit")):
+    """Return the case that replays the input log at `log_path` on the ROM it was recorded with."""
+
+    log = InputLog.load(log_path)
+    with open(rom_path, "rb") as f:
+        rom = f.read()
+    if hashlib.sha1(rom).digest() != log.rom_hash:
+        raise InputLogError(f"{rom_path} is not the ROM this input log was recorded with")
+    return {"name": os.path.basename(rom_path), "rom": rom, "engines": engines, "frames": log.ticks,
+            "seed": log.seed, "quirks": log.quirks, "events": log.events, "ips": log.ips}
+
+
+def run_case(case):
+    return compare(**case)
+
+
+def run_cases(cases, workers=None):
+    """Compare every case on a process pool and yield the reports in order."""
+
+    cases = list(cases)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as pool:
+        yield from pool.map(run_case, cases, chunksize=max(1, len(cases) // (workers * 8)))
+
+
+def format_report(report):
+    diverged = report["diverged"]
+    engines = " vs ".join(report["engines"])
+    if report["skipped"] is not None:
+        return f"{report['name']}: {engines} skipped, {report['skipped']}"
+    if diverged is None and report["fault"] is not None:
+        return (f"{report['name']}: {engines} match until both fault in frame {report['frames']}, cycle "
+                f"{report['cycles']:,}: {report['fault']}")
+    if diverged is None:
+        return f"{report['name']}: {engines} match for {report['frames']} frames, {report['cycles']:,} cycles"
+    where = f"frame {diverged['frame']}, cycle {diverged['cycle']:,}"
+    if diverged["pc"] is not None:
+        opcode = f"{diverged['opcode']:04X}" if diverged["opcode"] is not None else "----"
+        where += f", instruction {opcode} at {diverged['pc']:#05x}"
+    return "\n".join([f"{report['name']}: {engines} DIVERGE at {where}"] + ["    " + line for line in diverged["diff"]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("roms", "fuzz", "replay"):
+        command = commands.add_parser(name)
+        command.add_argument("--engines", type=lambda text: tuple(text.split(",")), default=("interpreter", "jit"))
+        command.add_argument("--workers", type=int, default=os.cpu_count())
+        command.add_argument("--all", action="store_true", help="also list the cases that match")
+        if name == "roms":
+            command.add_argument("paths", nargs="+", metavar="ROM_OR_DIR")
+            command.add_argument("--frames", type=int, default=600)
+            command.add_argument("--seeds", type=int, default=1, help="runs per ROM, each with its own seed")
+        elif name == "fuzz":
+            command.add_argument("--cases", type=int, default=1000)
+            command.add_argument("--length", type=int, default=64, help="instructions per program")
+            command.add_argument("--frames", type=int, default=60)
+            command.add_argument("--quirks", type=parse_quirks, default=frozenset())
+            command.add_argument("--first-seed", type=int, default=0)
+        else:
+            command.add_argument("rom")
+            command.add_argument("log")
+    args = parser.parse_args()
+    if len(args.engines) != 2 or not set(args.engines) <= set(ENGINES):
+        parser.error(f"--engines takes two of {', '.join(ENGINES)}")
+    if args.command == "fuzz" and args.quirks and "batched" in args.engines:
+        parser.error("the batched engine implements only the default quirks, --quirks cannot be used with it")
+
+    if args.command == "roms":
+        paths = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                paths += sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".ch8"))
+            else:
+                paths.append(path)
+        cases = rom_cases(paths, args.seeds, args.frames, args.engines)
+    elif args.command == "fuzz":
+        cases = fuzz_cases(args.cases, args.length, args.frames, args.engines, args.quirks, args.first_seed)
+    else:
+        cases = [replay_case(args.rom, args.log, args.engines)]
+
+    start = time.perf_counter()
+    total = diverged = skipped = faulted = 0
+    for report in run_cases(cases, args.workers):
+        total += 1
+        faulted += report["fault"] is not None
+        diverged += report["diverged"] is not None
+        skipped += report["skipped"] is not None
+        if report["diverged"] is not None or report["skipped"] is not None or args.all:
+            print(format_report(report))
+    print(f"{total:,} cases, {diverged:,} diverged, {skipped:,} skipped, {faulted:,} faulted on both engines, "
+          f"{time.perf_counter() - start:.1f} s")
+    sys.exit(1 if diverged else 0)
+
+
+if __name__ == "__main__":
+    main()
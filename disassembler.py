@@ -0,0 +1,372 @@
+"""Disassemble a ROM and analyse its control flow without running it.
+
+Usage:
+    python disassembler.py ROM [--json] [--cache-dir DIR | --no-cache]
+
+Code is found by recursive descent from the entry point at 0x200: jumps, calls and both outcomes of every skip
+are followed, so bytes that are never reached are reported as data. The analysis lists the basic blocks and
+their successors, the subroutines and the call graph, the data regions, the addresses loaded into I by Annn,
+indirect jumps (Bnnn) whose targets cannot be known statically, and the memory writes of Fx33 and Fx55. A write
+whose I value is known from a preceding Annn in the same block and that lands on code makes the ROM
+self-modifying.
+
+Analyses are cached as JSON files named after the ROM's SHA-1 hash, so analysing a ROM again is a file read. The
+cache is in $XDG_CACHE_HOME/chip8-emulator/analysis, ~/.cache if XDG_CACHE_HOME is not set.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from emulator import INSTRUCTION_SET, Emulator, decode_opcode
+
+# Bump whenever the analysis or its JSON layout changes, older cache files are then ignored.
+ANALYSIS_VERSION = 1
+
+
+def default_cache_dir(environ=os.environ):
+    """Return the analysis cache directory under XDG_CACHE_HOME, which is ignored unless it is an absolute path."""
+
+    cache_home = environ.get("XDG_CACHE_HOME", "")
+    if not os.path.isabs(cache_home):
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "chip8-emulator", "analysis")
+
+
+DEFAULT_CACHE_DIR = default_cache_dir()
+
+# Handler name -> operand field names, in the order decode_opcode returns the operands.
+OPERAND_FIELDS = {name: fields for _, _, name, fields in INSTRUCTION_SET}
+
+MNEMONICS = {
+    "instruction_00E0": "CLS",
+    "instruction_00EE": "RET",
+    "instruction_1nnn": "JP {nnn:#05x}",
+    "instruction_2nnn": "CALL {nnn:#05x}",
+    "instruction_3xkk": "SE V{x:X}, {kk:#04x}",
+    "instruction_4xkk": "SNE V{x:X}, {kk:#04x}",
+    "instruction_5xy0": "SE V{x:X}, V{y:X}",
+    "instruction_6xkk": "LD V{x:X}, {kk:#04x}",
+    "instruction_7xkk": "ADD V{x:X}, {kk:#04x}",
+    "instruction_8xy0": "LD V{x:X}, V{y:X}",
+    "instruction_8xy1": "OR V{x:X}, V{y:X}",
+    "instruction_8xy2": "AND V{x:X}, V{y:X}",
+    "instruction_8xy3": "XOR V{x:X}, V{y:X}",
+    "instruction_8xy4": "ADD V{x:X}, V{y:X}",
+    "instruction_8xy5": "SUB V{x:X}, V{y:X}",
+    "instruction_8xy6": "SHR V{x:X}, V{y:X}",
+    "instruction_8xy7": "SUBN V{x:X}, V{y:X}",
+    "instruction_8xyE": "SHL V{x:X}, V{y:X}",
+    "instruction_9xy0": "SNE V{x:X}, V{y:X}",
+    "instruction_Annn": "LD I, {nnn:#05x}",
+    "instruction_Bnnn": "JP V0, {nnn:#05x}",
+    "instruction_Cxkk": "RND V{x:X}, {kk:#04x}",
+    "instruction_Dxyn": "DRW V{x:X}, V{y:X}, {n}",
+    "instruction_Ex9E": "SKP V{x:X}",
+    "instruction_ExA1": "SKNP V{x:X}",
+    "instruction_Fx07": "LD V{x:X}, DT",
+    "instruction_Fx0A": "LD V{x:X}, K",
+    "instruction_Fx15": "LD DT, V{x:X}",
+    "instruction_Fx18": "LD ST, V{x:X}",
+    "instruction_Fx1E": "ADD I, V{x:X}",
+    "instruction_Fx29": "LD F, V{x:X}",
+    "instruction_Fx33": "LD B, V{x:X}",
+    "instruction_Fx55": "LD [I], V{x:X}",
+    "instruction_Fx65": "LD V{x:X}, [I]",
+}
+
+SKIPS = frozenset({
+    "instruction_3xkk",
+    "instruction_4xkk",
+    "instruction_5xy0",
+    "instruction_9xy0",
+    "instruction_Ex9E",
+    "instruction_ExA1",
+})
+# Instructions after which execution does not simply continue with the next one.
+BLOCK_ENDS = SKIPS | {"instruction_00EE", "instruction_1nnn", "instruction_2nnn", "instruction_Bnnn"}
+
+
+def mnemonic(opcode):
+    """Return the assembly text of an opcode, or None if it is not a valid instruction."""
+
+    decoded = decode_opcode(opcode)
+    if decoded is None:
+        return None
+    name, operands = decoded
+    return MNEMONICS[name].format(**dict(zip(OPERAND_FIELDS[name], operands)))
+
+
+class Analysis:
+    """The result of analyse(). Addresses are absolute; block and region ends are excluded."""
+
+    def __init__(self, rom_hash, start, end):
+        self.rom_hash = rom_hash
+        self.start = start
+        self.end = end
+        # Addresses of the reachable instructions, in order.
+        self.code = []
+        # Block start -> (block end, successor block starts).
+        self.blocks = {}
+        # Subroutine entry (the entry point included) -> sorted entries of the subroutines it calls.
+        self.functions = {}
+        # (start, end) ranges of ROM bytes that are not part of any reachable instruction.
+        self.data = []
+        # Addresses loaded into I by Annn.
+        self.data_refs = []
+        # Addresses of Bnnn instructions.
+        self.indirect_jumps = []
+        # Addresses where the descent hit an invalid opcode or left the ROM.
+        self.invalid = []
+        # (instruction address, first address written or None if I is not known, number of bytes).
+        self.writes = []
+        self.self_modifying = False
+
+    def to_dict(self):
+        return {
+            "version": ANALYSIS_VERSION,
+            "rom_hash": self.rom_hash,
+            "start": self.start,
+            "end": self.end,
+            "code": self.code,
+            "blocks": {str(start): [end, successors] for start, (end, successors) in self.blocks.items()},
+            "functions": {str(entry): callees for entry, callees in self.functions.items()},
+            "data": self.data,
+            "data_refs": self.data_refs,
+            "indirect_jumps": self.indirect_jumps,
+            "invalid": self.invalid,
+            "writes": self.writes,
+            "self_modifying": self.self_modifying,
+        }
+
+    @classmethod
+    def from_dict(cls, entry):
+        analysis = cls(entry["rom_hash"], entry["start"], entry["end"])
+        analysis.code = entry["code"]
+        analysis.blocks = {int(start): (end, successors) for start, (end, successors) in entry["blocks"].items()}
+        analysis.functions = {int(entry_point): callees for entry_point, callees in entry["functions"].items()}
+        analysis.data = [tuple(region) for region in entry["data"]]
+        analysis.data_refs = entry["data_refs"]
+        analysis.indirect_jumps = entry["indirect_jumps"]
+        analysis.invalid = entry["invalid"]
+        analysis.writes = [tuple(write) for write in entry["writes"]]
+        analysis.self_modifying = entry["self_modifying"]
+        return analysis
+
+
+def rom_hash(rom):
+    return hashlib.sha1(rom).hexdigest()
+
+
+def analyse(rom, start=Emulator.PROGRAM_START):
+    """Analyse the control flow of a ROM loaded at `start`. Returns an Analysis."""
+
+    end = start + len(rom)
+    analysis = Analysis(rom_hash(rom), start, end)
+    instructions = {}
+    calls = set()
+    invalid = set()
+
+    # Recursive descent, with an explicit work list of addresses that execution can reach.
+    worklist = [start]
+    while worklist:
+        pc = worklist.pop()
+        while pc not in instructions:
+            if not start <= pc < end - 1:
+                invalid.add(pc)
+                break
+            decoded = decode_opcode(rom[pc - start] << 8 | rom[pc - start + 1])
+            if decoded is None:
+                invalid.add(pc)
+                break
+            instructions[pc] = decoded
+            name, operands = decoded
+            if name == "instruction_1nnn":
+                worklist.append(operands[0])
+                break
+            if name == "instruction_2nnn":
+                calls.add(operands[0])
+                worklist.append(operands[0])
+            elif name in SKIPS:
+                worklist.append(pc + 4)
+            elif name in ("instruction_00EE", "instruction_Bnnn"):
+                break
+            pc += 2
+    analysis.code = sorted(instructions)
+    analysis.invalid = sorted(invalid)
+
+    # Basic blocks start at the entry point, at branch and call targets and after every block end.
+    leaders = {start} | calls
+    for pc, (name, operands) in instructions.items():
+        if name in ("instruction_1nnn", "instruction_2nnn"):
+            leaders.add(operands[0])
+        if name in BLOCK_ENDS:
+            leaders.add(pc + 2)
+        if name in SKIPS:
+            leaders.add(pc + 4)
+    for leader in sorted(leaders & instructions.keys()):
+        pc = leader
+        i_value = None
+        while True:
+            name, operands = instructions[pc]
+            # Track I through the block, to tell where Fx33 and Fx55 write.
+            if name == "instruction_Annn":
+                i_value = operands[0]
+                analysis.data_refs.append(operands[0])
+            elif name in ("instruction_Fx1E", "instruction_Fx29", "instruction_Fx55", "instruction_Fx65"):
+                if name == "instruction_Fx55":
+                    analysis.writes.append((pc, i_value, operands[0] + 1))
+                i_value = None
+            elif name == "instruction_Fx33":
+                analysis.writes.append((pc, i_value, 3))
+            elif name == "instruction_Bnnn":
+                analysis.indirect_jumps.append(pc)
+            pc += 2
+            if name in BLOCK_ENDS or pc in leaders or pc not in instructions:
+                break
+        if name == "instruction_1nnn":
+            successors = [operands[0]]
+        elif name in SKIPS:
+            successors = [pc, pc + 2]
+        elif name in ("instruction_00EE", "instruction_Bnnn"):
+            successors = []
+        else:
+            successors = [pc] if pc in instructions else []
+        analysis.blocks[leader] = (pc, [successor for successor in successors if successor in instructions])
+    analysis.data_refs = sorted(set(analysis.data_refs))
+    analysis.writes.sort()
+    analysis.indirect_jumps.sort()
+
+    # A subroutine is every block reachable from its entry without following calls.
+    for entry in sorted({start} | (calls & instructions.keys())):
+        seen = {entry}
+        pending = [entry]
+        callees = set()
+        while pending:
+            block_start = pending.pop()
+            block_end, successors = analysis.blocks[block_start]
+            name, operands = instructions[block_end - 2]
+            if name == "instruction_2nnn":
+                callees.add(operands[0])
+            for successor in successors:
+                if successor not in seen:
+                    seen.add(successor)
+                    pending.append(successor)
+        analysis.functions[entry] = sorted(callees)
+
+    # Everything in the ROM that no reachable instruction covers is data.
+    covered = bytearray(len(rom))
+    for pc in instructions:
+        covered[pc - start:pc - start + 2] = b"\x01\x01"
+    region_start = None
+    for offset, is_code in enumerate(covered):
+        if not is_code and region_start is None:
+            region_start = offset + start
+        elif is_code and region_start is not None:
+            analysis.data.append((region_start, offset + start))
+            region_start = None
+    if region_start is not None:
+        analysis.data.append((region_start, end))
+
+    analysis.self_modifying = any(
+        address is not None and any(pc in instructions for pc in range(address - 1, address + length))
+        for _, address, length in analysis.writes
+    )
+    return analysis
+
+
+def load_analysis(rom, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the Analysis of a ROM, from the cache if it has been analysed before. cache_dir=None disables it."""
+
+    if cache_dir is None:
+        return analyse(rom)
+    path = os.path.join(cache_dir, rom_hash(rom) + ".json")
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        if entry.get("version") == ANALYSIS_VERSION:
+            return Analysis.from_dict(entry)
+    except (OSError, ValueError, KeyError):
+        pass
+    analysis = analyse(rom)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written under a temporary name and renamed, so that concurrent readers never see half a file.
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(analysis.to_dict(), f)
+        os.replace(temporary, path)
+    except OSError:
+        # The cache is only an optimisation.
+        pass
+    return analysis
+
+
+def listing(rom, analysis):
+    """Return the disassembly of a ROM as text, with labels for subroutines and branch targets."""
+
+    start = analysis.start
+    code = set(analysis.code)
+    data = {region_start: region_end for region_start, region_end in analysis.data}
+    lines = []
+    pc = start
+    while pc < analysis.end:
+        if pc in data:
+            region_end = data[pc]
+            lines.append(f"; data {pc:#05x}-{region_end - 1:#05x}")
+            for row in range(pc, region_end, 8):
+                chunk = rom[row - start:min(row + 8, region_end) - start]
+                lines.append(f"{row:#05x}  db " + ", ".join(f"{byte:#04x}" for byte in chunk))
+            pc = region_end
+            continue
+        if pc in analysis.functions:
+            lines.append(f"sub_{pc:03X}:")
+        elif pc in analysis.blocks:
+            lines.append(f"loc_{pc:03X}:")
+        opcode = rom[pc - start] << 8 | rom[pc - start + 1]
+        lines.append(f"{pc:#05x}  {opcode:04X}  {mnemonic(opcode) if pc in code else '???'}")
+        pc += 2
+    return "\n".join(lines)
+
+
+def add_cache_arguments(parser):
+    """Add the --cache-dir and --no-cache options to an argparse parser. Both set args.cache_dir, which is None
+    with --no-cache, for load_analysis."""
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, metavar="DIR",
+                       help="analysis cache directory (default: %(default)s)")
+    group.add_argument("--no-cache", dest="cache_dir", action="store_const", const=None,
+                       help="neither read nor write cached analyses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rom")
+    parser.add_argument("--json", action="store_true", help="print the analysis as JSON instead of a listing")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.rom, "rb") as f:
+        rom = f.read()
+    analysis = load_analysis(rom, args.cache_dir)
+    if args.json:
+        json.dump(analysis.to_dict(), sys.stdout, indent=2)
+        print()
+        return
+    print(listing(rom, analysis))
+    print()
+    print(f"; {len(analysis.code)} instructions in {len(analysis.blocks)} blocks, {len(analysis.functions)} "
+          f"subroutines, {sum(end - start for start, end in analysis.data)} bytes of data")
+    for entry, callees in analysis.functions.items():
+        if callees:
+            print(f"; sub_{entry:03X} calls " + ", ".join(f"sub_{callee:03X}" for callee in callees))
+    if analysis.indirect_jumps:
+        print("; indirect jumps at " + ", ".join(f"{pc:#05x}" for pc in analysis.indirect_jumps))
+    if analysis.self_modifying:
+        print("; self-modifying: Fx33/Fx55 write into code")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,130 @@
 import random
-import pygame
-import threading
-import os
+import struct
+from array import array
 import numpy as np
 
+from faults import (
+    InvalidKeyFault, MemoryAccessFault, RomLoadError, SaveStateError, StackOverflowFault, StackUnderflowFault,
+    UnknownOpcodeFault,
+)
+from frontends import Display, Keypad, Sound
+from scheduler import DEFAULT_IPS, cycles_for_tick
+
+
+# Extract an operand field from an opcode.
+OPERAND_FIELDS = {
+    "x": lambda opcode: (opcode >> 8) & 0xF,
+    "y": lambda opcode: (opcode >> 4) & 0xF,
+    "n": lambda opcode: opcode & 0xF,
+    "kk": lambda opcode: opcode & 0xFF,
+    "nnn": lambda opcode: opcode & 0xFFF,
+}
+
+# (mask, pattern, handler name, operand fields). An opcode belongs to an instruction if opcode & mask == pattern.
+INSTRUCTION_SET = (
+    (0xFFFF, 0x00E0, "instruction_00E0", ()),
+    (0xFFFF, 0x00EE, "instruction_00EE", ()),
+    (0xF000, 0x1000, "instruction_1nnn", ("nnn",)),
+    (0xF000, 0x2000, "instruction_2nnn", ("nnn",)),
+    (0xF000, 0x3000, "instruction_3xkk", ("x", "kk")),
+    (0xF000, 0x4000, "instruction_4xkk", ("x", "kk")),
+    (0xF00F, 0x5000, "instruction_5xy0", ("x", "y")),
+    (0xF000, 0x6000, "instruction_6xkk", ("x", "kk")),
+    (0xF000, 0x7000, "instruction_7xkk", ("x", "kk")),
+    (0xF00F, 0x8000, "instruction_8xy0", ("x", "y")),
+    (0xF00F, 0x8001, "instruction_8xy1", ("x", "y")),
+    (0xF00F, 0x8002, "instruction_8xy2", ("x", "y")),
+    (0xF00F, 0x8003, "instruction_8xy3", ("x", "y")),
+    (0xF00F, 0x8004, "instruction_8xy4", ("x", "y")),
+    (0xF00F, 0x8005, "instruction_8xy5", ("x", "y")),
+    (0xF00F, 0x8006, "instruction_8xy6", ("x", "y")),
+    (0xF00F, 0x8007, "instruction_8xy7", ("x", "y")),
+    (0xF00F, 0x800E, "instruction_8xyE", ("x", "y")),
+    (0xF00F, 0x9000, "instruction_9xy0", ("x", "y")),
+    (0xF000, 0xA000, "instruction_Annn", ("nnn",)),
+    (0xF000, 0xB000, "instruction_Bnnn", ("nnn",)),
+    (0xF000, 0xC000, "instruction_Cxkk", ("x", "kk")),
+    (0xF000, 0xD000, "instruction_Dxyn", ("x", "y", "n")),
+    (0xF0FF, 0xE09E, "instruction_Ex9E", ("x",)),
+    (0xF0FF, 0xE0A1, "instruction_ExA1", ("x",)),
+    (0xF0FF, 0xF007, "instruction_Fx07", ("x",)),
+    (0xF0FF, 0xF00A, "instruction_Fx0A", ("x",)),
+    (0xF0FF, 0xF015, "instruction_Fx15", ("x",)),
+    (0xF0FF, 0xF018, "instruction_Fx18", ("x",)),
+    (0xF0FF, 0xF01E, "instruction_Fx1E", ("x",)),
+    (0xF0FF, 0xF029, "instruction_Fx29", ("x",)),
+    (0xF0FF, 0xF033, "instruction_Fx33", ("x",)),
+    (0xF0FF, 0xF055, "instruction_Fx55", ("x",)),
+    (0xF0FF, 0xF065, "instruction_Fx65", ("x",)),
+)
+
+
+def decode_opcode(opcode):
+    """Return (handler name, operands) for the opcode, or None if it is not a valid instruction."""
+
+    for mask, pattern, name, fields in INSTRUCTION_SET:
+        if opcode & mask == pattern:
+            return name, tuple(OPERAND_FIELDS[field](opcode) for field in fields)
+    return None
+
+
+# SPRITE_BITS[byte] is the byte's 8 pixels, most significant bit first.
+SPRITE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).astype(bool)
+# Screen coordinates covered by a sprite drawn at (x, y), wrapped around the 64x32 display. The columns are
+# shaped (8, 1) so that indexing the framebuffer with (columns, rows) selects the whole 8 x n sprite area.
+SPRITE_COLUMNS = ((np.arange(256)[:, np.newaxis] + np.arange(8)) % 64)[:, :, np.newaxis]
+SPRITE_ROWS = (np.arange(256)[:, np.newaxis] + np.arange(16)) % 32
+
+
+# Save states are the header below followed by the registers, the stack (16 little-endian 16-bit words), memory,
+# the framebuffer packed 8 pixels to a byte and the state of the random number generator used by Cxkk. Bump the
+# version whenever the layout changes.
+SAVE_STATE_MAGIC = b"C8ST"
+SAVE_STATE_VERSION = 2
+# magic, version, pc, I, stack pointer, delay timer, sound timer, sprites base address, cycles.
+SAVE_STATE_HEADER = struct.Struct("<4sHHQBBBHQ")
+SAVE_STATE_STACK = struct.Struct("<16H")
+# The 624 words of the Mersenne Twister followed by its position in them. Between draws that regenerate the words,
+# only the position changes.
+SAVE_STATE_RANDOM = struct.Struct("<625I")
+SAVE_STATE_SIZE = SAVE_STATE_HEADER.size + 16 + SAVE_STATE_STACK.size + 4096 + 64 * 32 // 8 + SAVE_STATE_RANDOM.size
+
+
+# Decode tables are built once per Emulator class and shared by all of its instances.
+_decode_tables = {}
+
+
+def build_decode_table(emulator_class):
+    """Map every 16-bit opcode to (handler function, operands) for the given Emulator class."""
+
+    table = _decode_tables.get(emulator_class)
+    if table is None:
+        unknown = emulator_class.unknown_instruction
+        table = [(unknown, (opcode,)) for opcode in range(0x10000)]
+        for mask, pattern, name, fields in INSTRUCTION_SET:
+            handler = getattr(emulator_class, name)
+            extractors = [OPERAND_FIELDS[field] for field in fields]
+            # Enumerate every opcode matching the pattern by walking the subsets of its free bits.
+            free_bits = ~mask & 0xFFFF
+            subset = free_bits
+            while True:
+                opcode = pattern | subset
+                table[opcode] = (handler, tuple(extract(opcode) for extract in extractors))
+                if subset == 0:
+                    break
+                subset = (subset - 1) & free_bits
+        _decode_tables[emulator_class] = table
+    return table
+
 
 class Emulator:
 
-    keyboard_mapping = {
-        0x1: pygame.K_1,
-        0x2: pygame.K_2,
-        0x3: pygame.K_3,
-        0xC: pygame.K_4,
-        0x4: pygame.K_q,
-        0x5: pygame.K_w,
-        0x6: pygame.K_e,
-        0xD: pygame.K_r,
-        0x7: pygame.K_a,
-        0x8: pygame.K_s,
-        0x9: pygame.K_d,
-        0xE: pygame.K_f,
-        0xA: pygame.K_z,
-        0x0: pygame.K_x,
-        0xB: pygame.K_c,
-        0xF: pygame.K_v
-    }
+    __slots__ = (
+        "file", "memory", "registers", "stack", "stack_pointer", "pc", "I", "debug_mode",
+        "opcode_to_function_mapping", "current_opcode", "delay_timer", "sound_timer", "sprites_base_addr",
+        "cycles", "execute", "write_observers", "pixels", "display_dirty", "display", "keypad", "key_wait", "sound",
+        "random", "random_draws", "saved_random", "run", "quirks", "tone", "frames", "frame_remaining",
+    )
 
     standard_sprites = {
         0: [0xF0, 0x90, 0x90, 0x90, 0xF0],
@@ -46,12 +146,16 @@ class Emulator:
     }
 
     UNSIGNED_CHAR_SIZE = 256
+    MEMORY_SIZE = 4096
+    PROGRAM_START = 512
+    PROGRAM_SIZE = MEMORY_SIZE - PROGRAM_START
+    DISPLAY_SIZE = (64, 32)
 
-    def __init__(self, fname, debug_mode):
+    def __init__(self, fname, debug_mode, display=None, keypad=None, sound=None, seed=None, quirks=None):
         self.file = fname
-        self.memory = [0] * 4096
-        self.registers = [0] * 16
-        self.stack = [0] * 16
+        self.memory = bytearray(Emulator.MEMORY_SIZE)
+        self.registers = bytearray(16)
+        self.stack = array("H", bytes(32))
         self.stack_pointer = 0
         self.pc = 512
         self.I = 0
@@ -59,150 +163,155 @@ class Emulator:
         self.debug_mode = debug_mode
 
         self.opcode_to_function_mapping = None
+        # Set of quirks.QUIRKS the handlers implement. None until chosen, which behaves like the empty set.
+        self.quirks = quirks
 
         self.current_opcode = 0
 
         self.delay_timer = 0
         self.sound_timer = 0
 
-        self.sound = None
-
         self.sprites_base_addr = 0
 
-        self.main_window_size = (640, 320)
-        self.main_window_debug_mode_size = (800, 320)
-        self.main_window = None
-        self.game_window_size = (64, 32)
-        self.game_window = None
-        self.game_window_scaled_size = self.main_window_size
-        self.game_window_scaled = None
-        self.info_bar_size = (160, self.main_window_size[1])
-        self.info_bar_window = None
-
-        self.pixels = None
-
-        self.font = None
-        self.font_name = "SourceCodePro-Black.ttf"
-        self.sound_name = "beep-6.wav"
+        # Number of instructions executed so far.
+        self.cycles = 0
+        # Number of frames run by run_frame(), which spreads the instructions per second over them.
+        self.frames = 0
+        # Instructions left of a frame that the engine cut short, see run_frame().
+        self.frame_remaining = 0
+        # Execution engine: execute(cycles) runs up to that many instructions and returns how many ran.
+        # Faster engines (for example block_cache.BlockCache) install themselves here.
+        self.execute = self.interpret
+        # Callables invoked as observer(address, length) after instructions write to memory.
+        self.write_observers = []
+
+        # Framebuffer indexed as pixels[x][y]; True means the pixel is lit.
+        self.pixels = np.zeros(shape=Emulator.DISPLAY_SIZE, dtype=bool)
+        # Set by the draw instructions, cleared when the framebuffer is presented.
+        self.display_dirty = False
+
+        # Frontends. The defaults discard output and never report a pressed key, which is what headless runs need.
+        self.display = display if display is not None else Display()
+        self.keypad = keypad if keypad is not None else Keypad()
+        # Set while Fx0A waits for a key press, so the scheduler can suspend the CPU until one arrives.
+        self.key_wait = False
+        self.sound = sound if sound is not None else Sound()
+        # Whether the sound frontend is playing the tone, which it does while the sound timer runs.
+        self.tone = False
+
+        # Random number generator of Cxkk. Runs with the same seed and input draw the same numbers.
+        self.random = random.Random(seed)
+        # Number of Cxkk draws, and the packed generator state of the last save state with the draw count it was
+        # taken at, so that saving only repacks the generator after a draw. Code that reseeds or draws from
+        # self.random other than through Cxkk must count it in random_draws.
+        self.random_draws = 0
+        self.saved_random = (-1, b"")
 
         self.run = False
 
-    def start(self):
-        """Start the emulator."""
-
-        self.run = True
-        self.map_opcodes_to_functions()
-        self.load_standard_sprites()
-        self.load_program_into_memory()
-        self.setup_sound()
-        if self.debug_mode:
-            self.setup_display_debug_mode()
-            self.create_thread_for_emulator_window()
-            self.run_program_debug_mode()
-        else:
-            self.setup_display()
-            self.create_thread_for_emulator_window()
-            self.run_program()
-
-    def map_opcodes_to_functions(self):
-        self.opcode_to_function_mapping = {
-            "00": self.instruction_00E0,
-            "0E": self.instruction_00EE,
-            "1": self.instruction_1nnn,
-            "2": self.instruction_2nnn,
-            "3": self.instruction_3xkk,
-            "4": self.instruction_4xkk,
-            "5": self.instruction_5xy0,
-            "6": self.instruction_6xkk,
-            "7": self.instruction_7xkk,
-            "80": self.instruction_8xy0,
-            "81": self.instruction_8xy1,
-            "82": self.instruction_8xy2,
-            "83": self.instruction_8xy3,
-            "84": self.instruction_8xy4,
-            "85": self.instruction_8xy5,
-            "86": self.instruction_8xy6,
-            "87": self.instruction_8xy7,
-            "8E": self.instruction_8xyE,
-            "9": self.instruction_9xy0,
-            "A": self.instruction_Annn,
-            "B": self.instruction_Bnnn,
-            "C": self.instruction_Cxkk,
-            "D": self.instruction_Dxyn,
-            "EE": self.instruction_Ex9E,
-            "E1": self.instruction_ExA1,
-            "F07": self.instruction_Fx07,
-            "F0A": self.instruction_Fx0A,
-            "F15": self.instruction_Fx15,
-            "F18": self.instruction_Fx18,
-            "F1E": self.instruction_Fx1E,
-            "F29": self.instruction_Fx29,
-            "F33": self.instruction_Fx33,
-            "F55": self.instruction_Fx55,
-            "F65": self.instruction_Fx65,
-        }
-
-    def load_program_into_memory(self):
-        """Loads the program into memory."""
-
-        try:
-            with open(self.file, "rb") as f:
-                # Begin storing the program at location 512.
-                mem_pointer = 512
-                while True:
-                    first_byte = f.read(1).hex()
-                    if not first_byte:
-                        break
-                    second_byte = f.read(1).hex()
-
-                    self.memory[mem_pointer] = int(first_byte, 16)
-                    self.memory[mem_pointer + 1] = int(second_byte, 16)
-
-                    mem_pointer += 2
-        except:
-            os._exit(1)
+    def start(self, **options):
+        """Start the emulator in a pygame window. Keyword arguments, such as cache_dir, go to PygameFrontend."""
 
-    def setup_display(self):
-        """Initial display setup."""
+        # Imported here so that the core can be used without pygame installed.
+        from pygame_frontend import PygameFrontend
+        PygameFrontend(self, **options).start()
 
-        pygame.init()
-
-        self.main_window = pygame.display.set_mode(self.main_window_size)
-        self.game_window = pygame.Surface(self.game_window_size)
-        self.game_window_scaled = pygame.Surface(self.game_window_scaled_size)
-        pygame.transform.scale(self.game_window, self.game_window_scaled_size, self.game_window_scaled)
-        self.pixels = np.full(shape=self.game_window_size, fill_value=0x0)
-
-    def setup_display_debug_mode(self):
-        """Initial display setup for debug mode."""
-
-        pygame.init()
-
-        self.font = pygame.font.Font(self.font_name, 12)
-
-        self.main_window = pygame.display.set_mode(self.main_window_debug_mode_size)
-        self.game_window = pygame.Surface(self.game_window_size)
-        self.game_window_scaled = pygame.Surface(self.game_window_scaled_size)
-        pygame.transform.scale(self.game_window, self.game_window_scaled_size, self.game_window_scaled)
-
-        self.info_bar_window = pygame.Surface(self.info_bar_size)
-        self.info_bar_window.fill(0x0f343b)
-
-        self.pixels = np.full(shape=self.game_window_size, fill_value=0x0)
-        self.display_info_panel()
-
-    def setup_sound(self):
-        """Sound setup."""
-
-        pygame.mixer.init()
-        self.sound = pygame.mixer.Sound(self.sound_name)
-        self.sound.set_volume(0.1)
+    def map_opcodes_to_functions(self):
+        """Attach the precomputed opcode -> (handler, operands) decode table for the emulator's quirks."""
 
-    def create_thread_for_emulator_window(self):
-        """Create and run a separate thread for emulator options (for example quitting, entering debugger mode etc)."""
+        if self.quirks:
+            # Imported here because quirks builds on this module.
+            from quirks import quirk_class
+            self.opcode_to_function_mapping = build_decode_table(quirk_class(type(self), self.quirks))
+        else:
+            self.opcode_to_function_mapping = build_decode_table(type(self))
 
-        emulator_thread = threading.Thread(target=self.emulator_window)
-        emulator_thread.start()
+    def load_program_into_memory(self):
+        """Loads the program file into memory."""
+
+        with open(self.file, "rb") as f:
+            # Read one byte more than fits, to tell a full program area from an oversized ROM.
+            program = f.read(Emulator.PROGRAM_SIZE + 1)
+        self.load_program(program)
+
+    def load_program(self, program):
+        """Copy the program bytes into memory, starting at location 512."""
+
+        if len(program) > Emulator.PROGRAM_SIZE:
+            raise RomLoadError(f"ROM {self.file!r} does not fit in the {Emulator.PROGRAM_SIZE}-byte program area")
+        self.memory[Emulator.PROGRAM_START:Emulator.PROGRAM_START + len(program)] = program
+        self.notify_memory_write(Emulator.PROGRAM_START, len(program))
+
+    def save_state(self):
+        """Return the machine state (registers, stack, memory, timers, framebuffer and random number generator) as a
+        bytes blob."""
+
+        return b"".join((self.save_cpu_state(), self.memory, np.packbits(self.pixels).data, self.save_random_state()))
+
+    def save_cpu_state(self):
+        """Return the part of the save state that comes before memory: the header, registers and stack."""
+
+        header = SAVE_STATE_HEADER.pack(
+            SAVE_STATE_MAGIC, SAVE_STATE_VERSION, self.pc, self.I, self.stack_pointer, self.delay_timer,
+            self.sound_timer, self.sprites_base_addr, self.cycles,
+        )
+        return b"".join((header, self.registers, SAVE_STATE_STACK.pack(*self.stack)))
+
+    def save_random_state(self):
+        """Return the last part of the save state: the state of the random number generator used by Cxkk."""
+
+        draws, state = self.saved_random
+        if draws != self.random_draws:
+            _, words, _ = self.random.getstate()
+            state = SAVE_STATE_RANDOM.pack(*words)
+            self.saved_random = (self.random_draws, state)
+        return state
+
+    def load_state(self, state):
+        """Restore a state returned by save_state."""
+
+        if len(state) != SAVE_STATE_SIZE:
+            raise SaveStateError(f"save state is {len(state)} bytes, expected {SAVE_STATE_SIZE}")
+        magic, version, pc, I, stack_pointer, delay_timer, sound_timer, sprites_base_addr, cycles = \
+            SAVE_STATE_HEADER.unpack_from(state)
+        if magic != SAVE_STATE_MAGIC or version != SAVE_STATE_VERSION:
+            raise SaveStateError(f"unsupported save state (magic {magic!r}, version {version})")
+        # The generator state is checked by setstate, so restore it before anything else.
+        random_state = bytes(state[-SAVE_STATE_RANDOM.size:])
+        if self.saved_random != (self.random_draws, random_state):
+            try:
+                self.random.setstate((self.random.VERSION, SAVE_STATE_RANDOM.unpack(random_state), None))
+            except ValueError as error:
+                raise SaveStateError(f"invalid random number generator state: {error}") from error
+            self.saved_random = (self.random_draws, random_state)
+
+        offset = SAVE_STATE_HEADER.size
+        self.registers[:] = state[offset:offset + 16]
+        offset += 16
+        self.stack[:] = array("H", SAVE_STATE_STACK.unpack_from(state, offset))
+        offset += SAVE_STATE_STACK.size
+
+        # Only report the memory that actually changes, so the execution engines keep the rest of their code.
+        memory = np.frombuffer(state, dtype=np.uint8, count=Emulator.MEMORY_SIZE, offset=offset)
+        changed = np.flatnonzero(memory != np.frombuffer(self.memory, dtype=np.uint8))
+        self.memory[:] = memoryview(state)[offset:offset + Emulator.MEMORY_SIZE]
+        offset += Emulator.MEMORY_SIZE
+
+        width, height = Emulator.DISPLAY_SIZE
+        packed_pixels = np.frombuffer(state, dtype=np.uint8, count=width * height // 8, offset=offset)
+        self.pixels[...] = np.unpackbits(packed_pixels).reshape(Emulator.DISPLAY_SIZE)
+        self.display_dirty = True
+
+        self.pc = pc
+        self.I = I
+        self.stack_pointer = stack_pointer
+        self.delay_timer = delay_timer
+        self.sound_timer = sound_timer
+        self.sprites_base_addr = sprites_base_addr
+        self.cycles = cycles
+        self.key_wait = False
+        if len(changed):
+            self.notify_memory_write(int(changed[0]), int(changed[-1] - changed[0]) + 1)
 
     def load_standard_sprites(self):
         """Load standard sprites into memory, starting from sprites_base_addr."""
@@ -212,444 +321,402 @@ class Emulator:
             for row in binary_list:
                 self.memory[self.sprites_base_addr + i] = row
                 i += 1
+        self.notify_memory_write(self.sprites_base_addr, i)
+
+    def interpret(self, cycles):
+        """Execute up to `cycles` instructions one at a time and return how many were executed."""
+
+        decode_table = self.opcode_to_function_mapping
+        memory = self.memory
+        executed = 0
+        try:
+            while executed < cycles:
+                # Merge 2 bytes from memory to get the opcode.
+                instruction, operands = decode_table[memory[self.pc] << 8 | memory[self.pc + 1]]
+                instruction(self, *operands)
+                executed += 1
+        except IndexError as error:
+            # PC ran off the end of memory, for example after a Bnnn jump.
+            raise self.fault(MemoryAccessFault) from error
+        finally:
+            self.cycles += executed
+        return executed
+
+    def fault(self, fault_class):
+        """Return a fault of the given faults.EmulatorFault class for the instruction at PC."""
+
+        pc = self.pc
+        memory = self.memory
+        opcode = memory[pc] << 8 | memory[pc + 1] if 0 <= pc < Emulator.MEMORY_SIZE - 1 else 0
+        return fault_class(pc, opcode)
+
+    def run_cycles(self, cycles):
+        """Execute `cycles` instructions with the installed engine, without ticking the timers.
+
+        Returns the number of instructions executed. Faults are raised as faults.EmulatorFault subclasses, with
+        the machine stopped on the faulting instruction.
+        """
+
+        return self.execute(cycles)
+
+    def run_frame(self, cycles):
+        """Execute one 60 Hz frame of `cycles` instructions, then tick the timers. Returns the instruction count.
+
+        While the program waits for a key with Fx0A and none is pressed, the instructions are counted without
+        being executed: every one of them would execute Fx0A again and find no key.
+
+        An engine may return before the whole budget has run, when a debugger breakpoint or watchpoint fires. The
+        rest of the budget is then kept in frame_remaining, the timers are not ticked, and the next call finishes
+        the frame with it instead of `cycles`. Stopping at a breakpoint therefore does not change the program's
+        timeline, and neither does single-stepping with Scheduler.step, which takes its instructions out of
+        frame_remaining too.
+        """
+
+        if self.frame_remaining:
+            cycles = self.frame_remaining
+        if self.key_wait and not any(self.keypad.keys):
+            self.cycles += cycles
+            executed = cycles
+        else:
+            executed = self.execute(cycles)
+        if executed < cycles:
+            self.frame_remaining = cycles - executed
+            return executed
+        self.frame_remaining = 0
+        self.tick_timers()
+        self.frames += 1
+        return executed
+
+    def run_frames(self, frames, ips=DEFAULT_IPS):
+        """Run `frames` frames at `ips` instructions per second, as fast as possible. Returns the instruction
+        count. Returns early if a frame is cut short; calling again finishes that frame first."""
+
+        executed = 0
+        for _ in range(frames):
+            executed += self.run_frame(cycles_for_tick(ips, self.frames))
+            if self.frame_remaining:
+                break
+        return executed
+
+    def run_until(self, predicate, max_frames=None, ips=DEFAULT_IPS):
+        """Run frames until predicate(emulator) is true or `max_frames` frames have run. The predicate is checked
+        before every frame. Returns the instruction count, early if a frame is cut short."""
+
+        executed = 0
+        frames = 0
+        while not predicate(self) and (max_frames is None or frames < max_frames):
+            executed += self.run_frame(cycles_for_tick(ips, self.frames))
+            if self.frame_remaining:
+                break
+            frames += 1
+        return executed
+
+    def step(self):
+        """Fetch, decode and execute a single instruction, counted in cycles. Scheduler.step also counts it in the
+        current frame."""
 
-    def emulator_window(self):
-        """Keeps listening for events such as quitting etc."""
-
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.run = False
-                    pygame.quit()
-                    os._exit(0)
-
-                if self.debug_mode:
-                    if event.type == pygame.KEYDOWN:
-                        # F1 = decode next opcode.
-                        if event.key == pygame.K_F1:
-                            self.run_program_debug_mode()
-
-    def run_program(self):
-        while self.run:
-            if self.sound_timer > 0:
-                self.play_sound()
-            if self.delay_timer > 0:
-                self.delay_screen()
-            # Merge 2 bytes from memory to get the current opcode.
-            self.current_opcode = self.memory[self.pc] << 8 | self.memory[self.pc + 1]
-            self.run_current_instruction()
-
-    def run_program_debug_mode(self):
         # Merge 2 bytes from memory to get the current opcode.
         self.current_opcode = self.memory[self.pc] << 8 | self.memory[self.pc + 1]
         self.run_current_instruction()
-        self.display_info_panel()
+        self.cycles += 1
 
     def run_current_instruction(self):
-        try:
-            instruction_method = self.find_instruction_to_run()
-            instruction_method()
-        except:
-            os._exit(1)
-
-    def find_instruction_to_run(self):
-        current_opcode_as_string = f"{self.current_opcode:04X}"
-
-        first_hex_digit = current_opcode_as_string[0]
-        instructions_with_two_unique_digits = ("0", "8", "E")
-        if first_hex_digit in instructions_with_two_unique_digits:
-            last_hex_digit = current_opcode_as_string[3]
-            return self.opcode_to_function_mapping[first_hex_digit + last_hex_digit]
-        elif first_hex_digit == "F":
-            third_hex_digit = current_opcode_as_string[2]
-            last_hex_digit = current_opcode_as_string[3]
-            return self.opcode_to_function_mapping[first_hex_digit + third_hex_digit + last_hex_digit]
-        else:
-            return self.opcode_to_function_mapping[first_hex_digit]
+        instruction, operands = self.opcode_to_function_mapping[self.current_opcode]
+        instruction(self, *operands)
+
+    def unknown_instruction(self, opcode):
+        """Raise a fault for an opcode that does not decode to any instruction."""
+
+        raise UnknownOpcodeFault(self.pc, opcode)
 
     def instruction_00E0(self):
         """Clear the display."""
 
-        self.pixels = np.full(shape=self.game_window_size, fill_value=0x0)
-        self.update_display()
+        self.pixels.fill(False)
+        self.display_dirty = True
         self.pc += 2
 
     def instruction_00EE(self):
         """Return from a subroutine."""
 
-        self.pc = self.stack[self.stack_pointer - 1]
+        if self.stack_pointer == 0:
+            raise self.fault(StackUnderflowFault)
         self.stack_pointer -= 1
-        if self.stack_pointer < 0:
-            self.stack_pointer = 0
+        self.pc = self.stack[self.stack_pointer]
 
-    def instruction_1nnn(self):
+    def instruction_1nnn(self, nnn):
         """Jump to location nnn."""
 
-        nnn = self.current_opcode & 0xFFF
         self.pc = nnn
 
-    def instruction_2nnn(self):
+    def instruction_2nnn(self, nnn):
         """Call subroutine at nnn."""
 
+        if self.stack_pointer == len(self.stack):
+            raise self.fault(StackOverflowFault)
         self.pc += 2
-        nnn = self.current_opcode & 0xFFF
         self.stack[self.stack_pointer] = self.pc
         self.stack_pointer += 1
         self.pc = nnn
 
-    def instruction_3xkk(self):
+    def instruction_3xkk(self, vx, kk):
         """Skip next instruction if Vx = kk."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        kk = self.current_opcode & 0xFF
         if self.registers[vx] == kk:
             self.pc += 4
         else:
             self.pc += 2
 
-    def instruction_4xkk(self):
+    def instruction_4xkk(self, vx, kk):
         """Skip next instruction if Vx != kk."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        kk = self.current_opcode & 0xFF
         if self.registers[vx] != kk:
             self.pc += 4
         else:
             self.pc += 2
 
-    def instruction_5xy0(self):
+    def instruction_5xy0(self, vx, vy):
         """Skip next instruction if Vx = Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.pc += 2
         if self.registers[vx] == self.registers[vy]:
             self.pc += 2
 
-    def instruction_6xkk(self):
+    def instruction_6xkk(self, vx, kk):
         """Set Vx = kk."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        kk = self.current_opcode & 0xFF
         self.registers[vx] = kk
         self.pc += 2
 
-    def instruction_7xkk(self):
+    def instruction_7xkk(self, vx, kk):
         """Set Vx = Vx + kk."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        kk = self.current_opcode & 0xFF
         self.registers[vx] = (self.registers[vx] + kk) % Emulator.UNSIGNED_CHAR_SIZE
         self.pc += 2
 
-    def instruction_8xy0(self):
+    def instruction_8xy0(self, vx, vy):
         """Set Vx = Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[vx] = self.registers[vy]
         self.pc += 2
 
-    def instruction_8xy1(self):
+    def instruction_8xy1(self, vx, vy):
         """Set Vx = Vx OR Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[vx] = self.registers[vx] | self.registers[vy]
         self.pc += 2
 
-    def instruction_8xy2(self):
+    def instruction_8xy2(self, vx, vy):
         """Set Vx = Vx AND Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[vx] = self.registers[vx] & self.registers[vy]
         self.pc += 2
 
-    def instruction_8xy3(self):
+    def instruction_8xy3(self, vx, vy):
         """Set Vx = Vx XOR Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[vx] = self.registers[vx] ^ self.registers[vy]
         self.pc += 2
 
-    def instruction_8xy4(self):
+    def instruction_8xy4(self, vx, vy):
         """Set Vx = Vx + Vy, set VF = carry."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[0xF] = int(self.registers[vx] + self.registers[vy] >= Emulator.UNSIGNED_CHAR_SIZE)
         self.registers[vx] = (self.registers[vx] + self.registers[vy]) % Emulator.UNSIGNED_CHAR_SIZE
         self.pc += 2
 
-    def instruction_8xy5(self):
+    def instruction_8xy5(self, vx, vy):
         """Set Vx = Vx - Vy, set VF = NOT borrow."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[0xF] = int(self.registers[vx] > self.registers[vy])
         self.registers[vx] = (self.registers[vx] - self.registers[vy]) % 256
         self.pc += 2
 
-    def instruction_8xy6(self):
+    def instruction_8xy6(self, vx, vy):
         """Set Vx = Vx SHR 1."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[0xF] = self.registers[vx] & 0x1
         self.registers[vx] = self.registers[vx] >> 0x1
         self.pc += 2
 
-    def instruction_8xy7(self):
+    def instruction_8xy7(self, vx, vy):
         """Set Vx = Vy - Vx, set VF = NOT borrow."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[0xF] = int(self.registers[vy] > self.registers[vx])
         self.registers[vx] = (self.registers[vy] - self.registers[vx]) % Emulator.UNSIGNED_CHAR_SIZE
         self.pc += 2
 
-    def instruction_8xyE(self):
+    def instruction_8xyE(self, vx, vy):
         """Set Vx = Vx SHL 1."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         self.registers[0xF] = (self.registers[vx] >> 7) & 0x1
         self.registers[vx] = (self.registers[vx] << 1) % Emulator.UNSIGNED_CHAR_SIZE
         self.pc += 2
 
-    def instruction_9xy0(self):
+    def instruction_9xy0(self, vx, vy):
         """Skip next instruction if Vx != Vy."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        vy = (self.current_opcode >> 4) & 0xF
         if self.registers[vx] != self.registers[vy]:
             self.pc += 4
         else:
             self.pc += 2
 
-    def instruction_Annn(self):
+    def instruction_Annn(self, nnn):
         """The value of register I is set to nnn."""
 
-        nnn = self.current_opcode & 0xFFF
         self.I = nnn
         self.pc += 2
 
-    def instruction_Bnnn(self):
+    def instruction_Bnnn(self, nnn):
         """Jump to location nnn + V0."""
 
-        nnn = self.current_opcode & 0xFFF
         self.pc = nnn + self.registers[0x0]
 
-    def instruction_Cxkk(self):
+    def instruction_Cxkk(self, vx, kk):
         """Set Vx = random byte AND kk."""
 
         random_max_range = 255
 
-        vx = (self.current_opcode >> 8) & 0xF
-        kk = self.current_opcode & 0xFF
-        rand_num = random.randrange(random_max_range)
+        rand_num = self.random.randrange(random_max_range)
+        self.random_draws += 1
         self.registers[vx] = rand_num & kk
         self.pc += 2
 
-    def instruction_Dxyn(self):
+    def instruction_Dxyn(self, vx, vy, num_of_bytes):
         """Display n-byte sprite starting at memory location I at (Vx, Vy), set VF = collision."""
 
-        num_of_bytes = self.current_opcode & 0xF
-        x_coord = self.registers[(self.current_opcode >> 8) & 0xF]
-        y_coord = self.registers[(self.current_opcode >> 4) & 0xF]
-
-        self.registers[0xF] = 0
+        sprite_bytes = self.memory[self.I:self.I + num_of_bytes]
+        if len(sprite_bytes) != num_of_bytes:
+            raise self.fault(MemoryAccessFault)
 
-        for i in range(num_of_bytes):
-            # Get the 8 pixels and XOR them with the pixels that are already on the screen.
-            # If the sprite is positioned so part of it is outside the coordinates of the display,
-            # it wraps around to the opposite side of the screen.
-            row = f"{self.memory[self.I + i]:08b}"
+        # Unpack the sprite into an 8 x n boolean array laid out like the framebuffer (column, row).
+        sprite = SPRITE_BITS.take(sprite_bytes, axis=0).T
+        # If the sprite is positioned so part of it is outside the coordinates of the display,
+        # it wraps around to the opposite side of the screen.
+        columns = SPRITE_COLUMNS[self.registers[vx]]
+        rows = SPRITE_ROWS[self.registers[vy], :num_of_bytes]
 
-            for j in range(8):
-                curr_pixel = 1 if self.pixels[(x_coord + j) % 64][(y_coord + i) % 32] == 0xFFFFFF else 0x0
-                # If a pixel is unset, set the F register's flag to 1.
-                if curr_pixel ^ int(row[j]) == 1:
-                    self.registers[0xF] = 1
+        screen_area = self.pixels[columns, rows]
+        # If a pixel is unset, set the F register's flag to 1.
+        self.registers[0xF] = int(np.count_nonzero(screen_area & sprite) != 0)
+        self.pixels[columns, rows] = screen_area ^ sprite
 
-                new_pixel = curr_pixel ^ int(row[j])
-                self.pixels[(x_coord + j) % 64][(y_coord + i) % 32] = 0xFFFFFF if new_pixel == 1 else 0x0
-
-        self.update_display()
+        self.display_dirty = True
         self.pc += 2
 
-    def instruction_Ex9E(self):
+    def instruction_Ex9E(self, vx):
         """Skip next instruction if key with the value of Vx is pressed."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        key = Emulator.keyboard_mapping[self.registers[vx]]
-        all_keys = pygame.key.get_pressed()
-
+        key = self.registers[vx]
+        if key > 0xF:
+            raise self.fault(InvalidKeyFault)
         self.pc += 2
-        # If a key is pressed, it is represented in all_keys as True. If it's not pressed, it is False.
-        if all_keys[key]:
+        if self.keypad.keys[key]:
             self.pc += 2
 
-    def instruction_ExA1(self):
+    def instruction_ExA1(self, vx):
         """Skip next instruction if key with the value of Vx is not pressed."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        key = Emulator.keyboard_mapping[self.registers[vx]]
-        all_keys = pygame.key.get_pressed()
-
+        key = self.registers[vx]
+        if key > 0xF:
+            raise self.fault(InvalidKeyFault)
         self.pc += 2
-        # If a key is pressed, it is represented in all_keys as True. If it's not pressed, it is False.
-        if not all_keys[key]:
+        if not self.keypad.keys[key]:
             self.pc += 2
 
-    def instruction_Fx07(self):
+    def instruction_Fx07(self, vx):
         """Set Vx = delay timer value."""
 
-        vx = (self.current_opcode >> 8) & 0xF
         self.registers[vx] = self.delay_timer
         self.pc += 2
 
-    def instruction_Fx0A(self):
+    def instruction_Fx0A(self, vx):
         """Wait for a key press, store the value of the key in Vx."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        pressed_key = self.find_pressed_key()
-        # Get the key number associated with the pressed key.
-        for key, value in Emulator.keyboard_mapping.items():
-            if value == pressed_key:
-                key_number = key
-                self.registers[vx] = key_number
-                break
-
-        self.pc += 2
+        pressed_key = self.keypad.pressed_key()
+        # Until a key is pressed, PC stays on this instruction so it is executed again.
+        if pressed_key is not None:
+            self.registers[vx] = pressed_key
+            self.pc += 2
+            self.key_wait = False
+        else:
+            self.key_wait = True
 
-    def find_pressed_key(self):
-        pressed_key = None
-        while True:
-            # Search through all the keys dict and if any key is pressed and it is in Chip-8's keyboard,
-            # set it to pressed_key.
-            all_keys = pygame.key.get_pressed()
-            if any(all_keys):
-                for key, value in all_keys.items():
-                    if value is True and key in Emulator.keyboard_mapping.values():
-                        pressed_key = key
-                        break
-            if pressed_key:
-                return pressed_key
-
-    def instruction_Fx15(self):
+    def instruction_Fx15(self, vx):
         """Set delay timer = Vx."""
 
-        vx = (self.current_opcode >> 8) & 0xF
         self.delay_timer = self.registers[vx]
         self.pc += 2
 
-    def instruction_Fx18(self):
+    def instruction_Fx18(self, vx):
         """Set sound timer = Vx."""
 
-        vx = (self.current_opcode >> 8) & 0xF
         self.sound_timer = self.registers[vx]
         self.pc += 2
 
-    def instruction_Fx1E(self):
+    def instruction_Fx1E(self, vx):
         """Set I = I + Vx."""
 
-        vx = (self.current_opcode >> 8) & 0xF
         self.I += self.registers[vx]
         self.pc += 2
 
-    def instruction_Fx29(self):
+    def instruction_Fx29(self, vx):
         """Set I = location of sprite for digit Vx."""
 
-        vx = (self.current_opcode >> 8) & 0xF
         self.I = self.sprites_base_addr + 5 * self.registers[vx]
         self.pc += 2
 
-    def instruction_Fx33(self):
+    def instruction_Fx33(self, vx):
         """Store BCD representation of Vx in memory locations I, I+1, and I+2."""
 
-        vx = (self.current_opcode >> 8) & 0xF
+        if self.I + 3 > Emulator.MEMORY_SIZE:
+            raise self.fault(MemoryAccessFault)
         self.memory[self.I] = (self.registers[vx] // 100) % 10
         self.memory[self.I + 1] = (self.registers[vx] // 10) % 10
         self.memory[self.I + 2] = self.registers[vx] % 10
         self.pc += 2
+        self.notify_memory_write(self.I, 3)
 
-    def instruction_Fx55(self):
+    def instruction_Fx55(self, vx):
         """Store registers V0 through Vx in memory starting at location I."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        for i in range(vx + 1):
-            self.memory[self.I + i] = self.registers[i]
+        if self.I + vx + 1 > Emulator.MEMORY_SIZE:
+            raise self.fault(MemoryAccessFault)
+        self.memory[self.I:self.I + vx + 1] = self.registers[:vx + 1]
         self.pc += 2
+        self.notify_memory_write(self.I, vx + 1)
 
-    def instruction_Fx65(self):
+    def instruction_Fx65(self, vx):
         """Read registers V0 through Vx from memory starting at location I."""
 
-        vx = (self.current_opcode >> 8) & 0xF
-        for i in range(vx + 1):
-            self.registers[i] = self.memory[self.I + i]
+        if self.I + vx + 1 > Emulator.MEMORY_SIZE:
+            raise self.fault(MemoryAccessFault)
+        self.registers[:vx + 1] = self.memory[self.I:self.I + vx + 1]
         self.pc += 2
 
+    def notify_memory_write(self, address, length):
+        """Tell the write observers that memory[address:address + length] has changed."""
+
+        for observer in self.write_observers:
+            observer(address, length)
+
     def update_display(self):
         """Refreshes the display."""
 
-        pygame.surfarray.blit_array(self.game_window, self.pixels)
-        pygame.transform.scale(self.game_window, self.game_window_scaled_size, self.game_window_scaled)
-
-        self.main_window.blit(self.game_window_scaled, (0, 0))
-        if self.debug_mode:
-            self.main_window.blit(self.info_bar_window, (640, 0))
-        pygame.display.update()
-
-    def display_info_panel(self):
-        self.info_bar_window.fill(0x0f343b)
-
-        white_color = (255, 255, 255)
-        v_x = 15
-        v_y = 5
-        registers_title_text = self.font.render("Registers", True, white_color), (v_x, v_y)
-        self.info_bar_window.blit(registers_title_text)
-
-        stack_x = 100
-        stack_y = 5
-        stack_title_text = self.font.render("Stack", True, white_color), (stack_x, stack_y)
-        self.info_bar_window.blit(stack_title_text)
-
-        for i in range(16):
-            y_offset = 20 + 15 * i
-            register_value_text = self.font.render(f"{i:X}: {hex(self.registers[i])}", True, white_color), (v_x, y_offset)
-            self.info_bar_window.blit(register_value_text)
-
-            stack_value_text = self.font.render(f"{i:X}: {hex(self.stack[i])}", True, white_color), (stack_x, y_offset)
-            self.info_bar_window.blit(stack_value_text)
-
-        extras_x = 15
-        extras_y = 270
-        I_value_text = self.font.render(f"I:  {hex(self.I)}", True, white_color), (extras_x, extras_y)
-        sp_value_text = self.font.render(f"SP: {hex(self.stack_pointer)}", True, white_color), (extras_x, extras_y + 15)
-        pc_value_text = self.font.render(f"PC: {hex(self.pc)}", True, white_color), (extras_x, extras_y + 30)
-        self.info_bar_window.blit(I_value_text)
-        self.info_bar_window.blit(sp_value_text)
-        self.info_bar_window.blit(pc_value_text)
-
-        opcode_x = 100
-        opcode_y = 270
-        current_opcode_text = self.font.render("Opcode", True, white_color), (opcode_x, opcode_y)
-        current_opcode_value_text = self.font.render(f"{self.current_opcode:04X}", True, white_color), (opcode_x, opcode_y + 15)
-        self.info_bar_window.blit(current_opcode_text)
-        self.info_bar_window.blit(current_opcode_value_text)
-
-        self.update_display()
-
-    def delay_screen(self):
-        while self.delay_timer > 0:
-            self.delay_timer -= 1
-            pygame.time.delay(17)
+        self.display.update(self.pixels)
+        self.display_dirty = False
+
+    def tick_timers(self):
+        """Decrement the delay and sound timers. Called at 60 Hz by the scheduler."""
 
-    def play_sound(self):
-        while self.sound_timer > 0:
+        if self.delay_timer > 0:
+            self.delay_timer -= 1
+        # The tone is switched at ticks only, so a program setting the timer costs nothing until the next one.
+        if self.sound_timer > 0:
+            if not self.tone:
+                self.tone = True
+                self.sound.start()
             self.sound_timer -= 1
-            self.sound.play()
-            pygame.time.delay(17)
\ No newline at end of file
+        elif self.tone:
+            self.tone = False
+            self.sound.stop()
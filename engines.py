@@ -0,0 +1,14 @@
+"""The execution engines the command line tools can install, by name, and the framebuffer hash they report."""
+import hashlib
+
+import numpy as np
+
+from block_cache import BlockCache
+from jit import Jit
+
+# Engine class to install on an emulator, None for the plain interpreter.
+ENGINES = {"interpreter": None, "blocks": BlockCache, "jit": Jit}
+
+
+def framebuffer_hash(pixels):
+    return hashlib.sha1(np.packbits(pixels).tobytes()).hexdigest()
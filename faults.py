@@ -0,0 +1,51 @@
+class EmulatorFault(Exception):
+    """Base class for faults raised by the emulated CPU."""
+
+    description = "Emulator fault"
+
+    def __init__(self, pc, opcode):
+        self.pc = pc
+        self.opcode = opcode
+        super().__init__(f"{self.description} at PC {pc:#05x} (opcode {opcode:04X})")
+
+
+class UnknownOpcodeFault(EmulatorFault):
+    """The opcode at PC does not decode to any instruction."""
+
+    description = "Unknown opcode"
+
+
+class StackOverflowFault(EmulatorFault):
+    """2nnn was executed with all 16 stack slots in use."""
+
+    description = "Stack overflow"
+
+
+class StackUnderflowFault(EmulatorFault):
+    """00EE was executed with an empty stack."""
+
+    description = "Stack underflow"
+
+
+class MemoryAccessFault(EmulatorFault):
+    """The instruction at PC reads or writes past the end of memory, or PC itself is out of memory."""
+
+    description = "Memory access out of range"
+
+
+class InvalidKeyFault(EmulatorFault):
+    """Ex9E or ExA1 was executed with a value above 0xF in Vx, which names no key."""
+
+    description = "Invalid key"
+
+
+class RomLoadError(Exception):
+    """The ROM cannot be loaded into the program area."""
+
+
+class SaveStateError(Exception):
+    """The save state is not one this version of the emulator can load."""
+
+
+class InputLogError(Exception):
+    """The input log cannot be replayed."""
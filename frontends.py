@@ -0,0 +1,99 @@
+class Display:
+    """Display frontend that discards every frame. Used for headless runs."""
+
+    def update(self, pixels):
+        """Present the 64x32 framebuffer."""
+
+
+class Keypad:
+    """Input frontend holding the state of the 16 Chip-8 keys. Keys are pressed and released programmatically."""
+
+    def __init__(self):
+        # keys[k] is 1 while key k is held down.
+        self.keys = bytearray(16)
+
+    def press(self, key):
+        self.keys[key] = 1
+
+    def release(self, key):
+        self.keys[key] = 0
+
+    def mask(self):
+        """Return the key state as a 16-bit mask, bit k set while key k is held down."""
+
+        mask = 0
+        for key, pressed in enumerate(self.keys):
+            if pressed:
+                mask |= 1 << key
+        return mask
+
+    def set_mask(self, mask):
+        for key in range(16):
+            self.keys[key] = mask >> key & 1
+
+    def pressed_key(self):
+        """Return the lowest pressed key, or None if no key is pressed."""
+
+        for key, pressed in enumerate(self.keys):
+            if pressed:
+                return key
+        return None
+
+
+class KeypadInput:
+    """Input source reading a keypad that another thread updates, for example the pygame event loop.
+
+    Input sources are sampled by the Scheduler at tick boundaries, so the emulated program only sees the keys
+    change between ticks. That makes a run reproducible from the sequence of samples.
+    """
+
+    def __init__(self, keypad):
+        self.keypad = keypad
+
+    def sample(self, cycle):
+        """Return the key mask for the tick starting at instruction number `cycle`."""
+
+        return self.keypad.mask()
+
+
+class Sound:
+    """Sound frontend that stays silent.
+
+    The emulator calls start() when the sound timer starts running and stop() when it reaches zero, at timer
+    ticks. Nothing is called while the timer keeps running or stays at zero.
+    """
+
+    def start(self):
+        """Start playing the tone, until stop() is called."""
+
+    def stop(self):
+        """Stop playing the tone."""
+
+
+class FramePresenter:
+    """Presents the framebuffer at most once per timer tick, and only when a draw instruction changed it.
+
+    Register on_tick as a Scheduler callback. When the tick ran more than a tick period late, presenting is
+    skipped so the host can catch up, but never for more than max_frame_skip ticks in a row. A skipped frame
+    leaves the framebuffer dirty, so the next tick presents it.
+    """
+
+    def __init__(self, emulator, frame_skip=True, max_frame_skip=4):
+        self.emulator = emulator
+        self.frame_skip = frame_skip
+        self.max_frame_skip = max_frame_skip
+        self.frames_presented = 0
+        self.frames_skipped = 0
+        self.consecutive_skips = 0
+
+    def on_tick(self, scheduler):
+        if not self.emulator.display_dirty:
+            return
+        behind = scheduler.lateness > scheduler.tick_period
+        if self.frame_skip and behind and self.consecutive_skips < self.max_frame_skip:
+            self.frames_skipped += 1
+            self.consecutive_skips += 1
+            return
+        self.emulator.update_display()
+        self.frames_presented += 1
+        self.consecutive_skips = 0
@@ -0,0 +1,289 @@
+from block_cache import BlockCache
+from emulator import Emulator, INSTRUCTION_SET
+
+# Number of times a block has to be entered before the JIT tries to compile a loop starting there.
+HOT_LOOP_THRESHOLD = 64
+# Longest loop body, in instructions, the JIT looks for.
+MAX_LOOP_INSTRUCTIONS = 64
+
+# Python source for the instructions the JIT inlines, mirroring the statements of the matching instruction_*
+# method. "V" is the register file; x, y, kk and nnn are replaced by constants.
+INLINE_TEMPLATES = {
+    Emulator.instruction_6xkk: ("V[{x}] = {kk}",),
+    Emulator.instruction_7xkk: ("V[{x}] = (V[{x}] + {kk}) % 256",),
+    Emulator.instruction_8xy0: ("V[{x}] = V[{y}]",),
+    Emulator.instruction_8xy1: ("V[{x}] = V[{x}] | V[{y}]",),
+    Emulator.instruction_8xy2: ("V[{x}] = V[{x}] & V[{y}]",),
+    Emulator.instruction_8xy3: ("V[{x}] = V[{x}] ^ V[{y}]",),
+    Emulator.instruction_8xy4: ("V[15] = int(V[{x}] + V[{y}] >= 256)", "V[{x}] = (V[{x}] + V[{y}]) % 256"),
+    Emulator.instruction_8xy5: ("V[15] = int(V[{x}] > V[{y}])", "V[{x}] = (V[{x}] - V[{y}]) % 256"),
+    Emulator.instruction_8xy6: ("V[15] = V[{x}] & 0x1", "V[{x}] = V[{x}] >> 0x1"),
+    Emulator.instruction_8xy7: ("V[15] = int(V[{y}] > V[{x}])", "V[{x}] = (V[{y}] - V[{x}]) % 256"),
+    Emulator.instruction_8xyE: ("V[15] = (V[{x}] >> 7) & 0x1", "V[{x}] = (V[{x}] << 1) % 256"),
+    Emulator.instruction_Annn: ("self.I = {nnn}",),
+    Emulator.instruction_Fx07: ("V[{x}] = self.delay_timer",),
+    Emulator.instruction_Fx15: ("self.delay_timer = V[{x}]",),
+    Emulator.instruction_Fx18: ("self.sound_timer = V[{x}]",),
+    Emulator.instruction_Fx1E: ("self.I += V[{x}]",),
+    Emulator.instruction_Fx29: ("self.I = self.sprites_base_addr + 5 * V[{x}]",),
+}
+
+# Conditions under which the skip instructions skip the next instruction.
+SKIP_CONDITIONS = {
+    Emulator.instruction_3xkk: "V[{x}] == {kk}",
+    Emulator.instruction_4xkk: "V[{x}] != {kk}",
+    Emulator.instruction_5xy0: "V[{x}] == V[{y}]",
+    Emulator.instruction_9xy0: "V[{x}] != V[{y}]",
+}
+
+# Inlined instructions that can leave the machine state as it was, as in a loop waiting for the delay timer.
+# Loops made of only these, skips and jumps are checked for iterations that change nothing, see IDLE_CHECK.
+IDLE_CANDIDATES = frozenset({
+    Emulator.instruction_6xkk,
+    Emulator.instruction_8xy0,
+    Emulator.instruction_8xy1,
+    Emulator.instruction_8xy2,
+    Emulator.instruction_Annn,
+    Emulator.instruction_Fx07,
+    Emulator.instruction_Fx15,
+    Emulator.instruction_Fx18,
+    Emulator.instruction_Fx29,
+})
+
+# Inserted at the jump back of an idle candidate loop. Inlined instructions only depend on the registers, I and
+# the timers, and the timers do not tick during a call. So when an iteration leaves all of them unchanged,
+# every further iteration is the same one, and the loop runs until the budget is spent without anything
+# observable happening: add up those iterations instead of running them.
+IDLE_CHECK = (
+    "state = (bytes(V), self.I, self.delay_timer, self.sound_timer)",
+    "if state == previous:",
+    "    cost = n - start",
+    "    repeats = max(0, (budget - {length} - n) // cost + 1)",
+    "    n += repeats * cost",
+    "    jit.elided_cycles += repeats * cost",
+    "    break",
+    "previous = state",
+    "start = n",
+)
+
+# Handler name -> operand field names, in the order the decode table passes the operands.
+OPERAND_FIELDS = {name: fields for _, _, name, fields in INSTRUCTION_SET}
+
+
+class Jit(BlockCache):
+    """Tiered execution engine: the block cache, plus hot loops compiled to specialised Python source.
+
+    Every block entry is counted. Once a block has been entered HOT_LOOP_THRESHOLD times, the JIT looks for a
+    loop that starts there and ends with a jump back to it. If the body only contains register, timer and I
+    operations, skips, and jumps out of the loop, it is compiled into a function with register indices and
+    immediates as constants and no PC updates inside the loop. The function runs until the loop exits, the
+    cycle budget (the next timer tick) runs out, or the loop reaches an instruction it does not inline, such
+    as a draw or a key check. The instruction_* methods remain the reference semantics and run everything else.
+
+    Loops that may be idle, such as Fx07/3xkk/1nnn spinning until the delay timer expires or a jump to self, are
+    compiled with a check at the jump back: once an iteration leaves the machine state unchanged, the rest of
+    the budget is skipped and counted in elided_cycles, with the same final state as running it.
+    """
+
+    def __init__(self, emulator):
+        super().__init__(emulator)
+        # head PC -> (compiled loop, end address).
+        self.loops = {}
+        self.heat = [0] * 4096
+        self.loop_entries = 0
+        # Instructions that idle loops would have executed but were skipped.
+        self.elided_cycles = 0
+        # Whether idle loops are compiled with the check that skips them. Applies to loops compiled afterwards.
+        self.elide_idle_loops = True
+        self._enabled = True
+
+    def install(self):
+        super().install()
+        self.enabled = self._enabled
+
+    @property
+    def enabled(self):
+        """Whether hot loops are compiled and run. When off, execution falls back to the block cache tier."""
+
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled):
+        self._enabled = enabled
+        if self.emulator.execute in (self.execute, self.execute_blocks):
+            self.emulator.execute = self.execute if enabled else self.execute_blocks
+
+    def execute_blocks(self, cycles):
+        return BlockCache.execute(self, cycles)
+
+    def flush(self):
+        super().flush()
+        self.loops = {}
+        self.heat = [0] * 4096
+
+    def invalidate(self, address, length):
+        super().invalidate(address, length)
+        for head, (_, end) in list(self.loops.items()):
+            if head < address + length and address < end:
+                del self.loops[head]
+                self.heat[head] = 0
+                self.invalidations += 1
+
+    def execute(self, cycles):
+        """Execute up to `cycles` instructions, running compiled loops where possible."""
+
+        emulator = self.emulator
+        blocks = self.blocks
+        loops = self.loops
+        heat = self.heat
+        executed = 0
+        interpreted = 0
+        hits = 0
+        misses = 0
+        loop_entries = 0
+        block_pc = None
+        try:
+            while executed < cycles:
+                pc = emulator.pc
+                loop = loops.get(pc)
+                if loop is not None:
+                    ran = loop[0](emulator, cycles - executed)
+                    if ran:
+                        loop_entries += 1
+                        executed += ran
+                        continue
+                block = blocks.get(pc)
+                if block is None:
+                    misses += 1
+                    block = self.compile_block(pc)
+                    if block is None:
+                        ran = emulator.interpret(1)
+                        executed += ran
+                        interpreted += ran
+                        continue
+                else:
+                    hits += 1
+                    heat[pc] += 1
+                    if heat[pc] == HOT_LOOP_THRESHOLD:
+                        self.compile_loop(pc)
+                run, length, _ = block
+                if length > cycles - executed:
+                    ran = emulator.interpret(cycles - executed)
+                    executed += ran
+                    interpreted += ran
+                    break
+                block_pc = pc
+                run(emulator)
+                block_pc = None
+                executed += length
+        except Exception:
+            if block_pc is not None:
+                executed += (emulator.pc - block_pc) // 2
+            raise
+        finally:
+            emulator.cycles += executed - interpreted
+            self.hits += hits
+            self.misses += misses
+            self.loop_entries += loop_entries
+        return executed
+
+    def compile_loop(self, head):
+        """Compile the loop starting at `head`. Returns None if there is no loop there worth compiling."""
+
+        source = self.generate_loop_source(head)
+        if source is None:
+            return None
+        source, end = source
+        namespace = {"jit": self}
+        exec(compile(source, f"<loop {head:#05x}>", "exec"), namespace)
+        loop = (namespace["loop"], end)
+        self.loops[head] = loop
+        return loop
+
+    def generate_loop_source(self, head):
+        """Return (source of loop(self, budget), end address) for the loop at `head`, or None."""
+
+        memory = self.emulator.memory
+        decode_table = self.emulator.opcode_to_function_mapping
+
+        # Find the jump back to head, making sure every instruction on the way can be compiled.
+        body = []
+        address = head
+        guarded = False
+        while len(body) < MAX_LOOP_INSTRUCTIONS and address < 4095:
+            instruction, operands = decode_table[memory[address] << 8 | memory[address + 1]]
+            is_jump = instruction is Emulator.instruction_1nnn
+            if is_jump and operands[0] == head:
+                body.append((address, instruction, operands))
+                break
+            inlined = instruction in INLINE_TEMPLATES or instruction in SKIP_CONDITIONS
+            # A jump elsewhere or an instruction that is not inlined leaves the loop. That is fine under a skip,
+            # but without one the loop would leave on every iteration.
+            if not inlined and not guarded:
+                return None
+            body.append((address, instruction, operands))
+            guarded = instruction in SKIP_CONDITIONS
+            address += 2
+        else:
+            return None
+
+        end = body[-1][0] + 2
+        idle = self.elide_idle_loops and all(
+            instruction in IDLE_CANDIDATES or instruction not in INLINE_TEMPLATES for _, instruction, _ in body
+        )
+        lines = [
+            "def loop(self, budget):",
+            "    V = self.registers",
+            "    n = 0",
+            "    skip = False",
+        ]
+        if idle:
+            lines.append("    previous = (bytes(V), self.I, self.delay_timer, self.sound_timer)")
+            lines.append("    start = 0")
+        lines.append(f"    while n + {len(body)} <= budget:")
+        idle_check = [line.format(length=len(body)) for line in IDLE_CHECK] if idle else []
+        # Instructions executed since the last update of n.
+        pending = 0
+        guarded = False
+        for address, instruction, operands in body:
+            fields = dict(zip(OPERAND_FIELDS[instruction.__name__], operands))
+            indent = "        "
+            if guarded:
+                if pending:
+                    lines.append(f"{indent}n += {pending}")
+                    pending = 0
+                lines.append(f"{indent}if skip:")
+                lines.append(f"{indent}    skip = False")
+                lines.append(f"{indent}else:")
+                indent += "    "
+
+            if instruction in INLINE_TEMPLATES:
+                lines.extend(indent + template.format(**fields) for template in INLINE_TEMPLATES[instruction])
+                if guarded:
+                    lines.append(f"{indent}n += 1")
+                else:
+                    pending += 1
+            elif instruction in SKIP_CONDITIONS:
+                lines.append(f"{indent}skip = {SKIP_CONDITIONS[instruction].format(**fields)}")
+                lines.append(f"{indent}n += {pending + 1}")
+                pending = 0
+            elif instruction is Emulator.instruction_1nnn and fields["nnn"] == head:
+                lines.append(f"{indent}n += {pending + 1}")
+                lines.extend(indent + line for line in idle_check)
+                if guarded:
+                    lines.append(f"{indent}continue")
+                    # Only reached when the jump back was skipped.
+                    lines.append(f"        self.pc = {end}")
+                    lines.append("        return n")
+            elif instruction is Emulator.instruction_1nnn:
+                lines.append(f"{indent}self.pc = {fields['nnn']}")
+                lines.append(f"{indent}return n + {pending + 1}")
+            else:
+                # Leave the loop before this instruction and let the other tiers execute it.
+                lines.append(f"{indent}self.pc = {address}")
+                lines.append(f"{indent}return n + {pending}")
+            guarded = instruction in SKIP_CONDITIONS
+
+        lines.append(f"    self.pc = {head}")
+        lines.append("    return n")
+        return "\n".join(lines) + "\n", end
@@ -0,0 +1,213 @@
+"""Profile a ROM headless: per-opcode counts and time, a PC heatmap, display and timer-wait time.
+
+Usage:
+    python profiler.py ROM [--frames N] [--realtime] [--json FILE] [--top N]
+"""
+import argparse
+import json
+import time
+
+from emulator import Emulator
+from faults import MemoryAccessFault
+from frontends import FramePresenter
+from quirks import select_quirks
+from scheduler import Scheduler
+
+
+class TimedDisplay:
+    """Wraps a display frontend and adds the time spent presenting frames to a profiler."""
+
+    def __init__(self, display, profiler):
+        self.display = display
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.display, name)
+
+    def update(self, pixels):
+        start = time.perf_counter_ns()
+        self.display.update(pixels)
+        self.profiler.present_time += time.perf_counter_ns() - start
+        self.profiler.present_count += 1
+
+
+class Profiler:
+    """Instrumentation installed by swapping in a profiling dispatch loop, the display and the scheduler's sleep.
+
+    While installed, every instruction goes through execute(), which times the fetch and decode and the handler
+    separately and accumulates counts and time per handler and per PC. Compiled engines are bypassed while
+    profiling, so the numbers describe the interpreter. uninstall() puts the original objects back; nothing is
+    checked on the normal execution path.
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.saved = None
+        self.scheduler = None
+        self.reset()
+
+    def reset(self):
+        # Handler function -> number of executions and nanoseconds spent in it.
+        self.counts = {}
+        self.times = {}
+        self.pc_counts = [0] * Emulator.MEMORY_SIZE
+        self.pc_times = [0] * Emulator.MEMORY_SIZE
+        self.decode_time = 0
+        self.present_count = 0
+        self.present_time = 0
+        self.wait_count = 0
+        self.wait_time = 0
+        self.started = time.perf_counter_ns()
+
+    def install(self, scheduler=None):
+        """Start profiling the emulator, and the timer waits of `scheduler` if given."""
+
+        emulator = self.emulator
+        self.saved = (emulator.execute, emulator.display)
+        emulator.execute = self.execute
+        emulator.display = TimedDisplay(emulator.display, self)
+        if scheduler is not None:
+            self.scheduler = scheduler
+            sleep = scheduler.sleep
+
+            def timed_sleep(seconds):
+                start = time.perf_counter_ns()
+                sleep(seconds)
+                self.wait_time += time.perf_counter_ns() - start
+                self.wait_count += 1
+
+            scheduler.sleep = timed_sleep
+            self.saved += (sleep,)
+        self.reset()
+
+    def uninstall(self):
+        """Stop profiling and restore the execution engine, display and scheduler sleep."""
+
+        self.emulator.execute, self.emulator.display = self.saved[:2]
+        if self.scheduler is not None:
+            self.scheduler.sleep = self.saved[2]
+            self.scheduler = None
+        self.saved = None
+
+    def execute(self, cycles):
+        """Interpret up to `cycles` instructions, timing each one. Same contract as Emulator.interpret."""
+
+        emulator = self.emulator
+        decode_table = emulator.opcode_to_function_mapping
+        memory = emulator.memory
+        clock = time.perf_counter_ns
+        counts = self.counts
+        times = self.times
+        pc_counts = self.pc_counts
+        pc_times = self.pc_times
+        decode_time = 0
+        executed = 0
+        try:
+            while executed < cycles:
+                pc = emulator.pc
+                fetched = clock()
+                instruction, operands = decode_table[memory[pc] << 8 | memory[pc + 1]]
+                decoded = clock()
+                instruction(emulator, *operands)
+                done = clock()
+                decode_time += decoded - fetched
+                counts[instruction] = counts.get(instruction, 0) + 1
+                times[instruction] = times.get(instruction, 0) + done - decoded
+                pc_counts[pc] += 1
+                pc_times[pc] += done - fetched
+                executed += 1
+        except IndexError as error:
+            raise emulator.fault(MemoryAccessFault) from error
+        finally:
+            emulator.cycles += executed
+            self.decode_time += decode_time
+        return executed
+
+    def report(self, top=20):
+        """Return the profile as a dict that can be written as JSON."""
+
+        opcodes = {
+            instruction.__name__.replace("instruction_", ""): {
+                "count": count,
+                "time_ns": self.times[instruction],
+                "ns_per_op": self.times[instruction] / count,
+            }
+            for instruction, count in sorted(self.counts.items(), key=lambda item: -self.times[item[0]])
+        }
+        hot_pcs = sorted(range(Emulator.MEMORY_SIZE), key=lambda pc: -self.pc_times[pc])[:top]
+        return {
+            "wall_time_ns": time.perf_counter_ns() - self.started,
+            "instructions": sum(self.counts.values()),
+            "decode_time_ns": self.decode_time,
+            "execute_time_ns": sum(self.times.values()),
+            "present": {"count": self.present_count, "time_ns": self.present_time},
+            "timer_wait": {"count": self.wait_count, "time_ns": self.wait_time},
+            "opcodes": opcodes,
+            "hot_pcs": [
+                {"pc": pc, "count": self.pc_counts[pc], "time_ns": self.pc_times[pc]}
+                for pc in hot_pcs if self.pc_counts[pc]
+            ],
+            # Full heatmap: executions of the instruction at every address.
+            "pc_counts": self.pc_counts,
+        }
+
+    def dump(self, path=None, top=20):
+        """Return the report as a text table, writing it as JSON to `path` if given."""
+
+        report = self.report(top)
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(report, f)
+        return format_report(report)
+
+
+def format_report(report):
+    wall = report["wall_time_ns"] or 1
+
+    def row(name, count, time_ns):
+        per_op = f"{time_ns / count:>10,.0f}" if count else f"{'':>10}"
+        return f"{name:<14}{count:>12,}{time_ns / 1e6:>12,.2f}{per_op}{time_ns / wall:>8.1%}"
+
+    lines = [
+        f"{report['instructions']:,} instructions in {wall / 1e9:.3f} s",
+        "",
+        f"{'':<14}{'count':>12}{'total ms':>12}{'ns/op':>10}{'wall':>8}",
+        row("decode", report["instructions"], report["decode_time_ns"]),
+        row("present", report["present"]["count"], report["present"]["time_ns"]),
+        row("timer wait", report["timer_wait"]["count"], report["timer_wait"]["time_ns"]),
+        "",
+    ]
+    lines += [row(name, entry["count"], entry["time_ns"]) for name, entry in report["opcodes"].items()]
+    lines += ["", f"{'pc':<14}{'count':>12}{'total ms':>12}{'ns/op':>10}{'wall':>8}"]
+    lines += [row(f"{entry['pc']:#05x}", entry["count"], entry["time_ns"]) for entry in report["hot_pcs"]]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rom")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--realtime", action="store_true", help="sleep between ticks as a real run does")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    parser.add_argument("--top", type=int, default=20, help="number of hottest PCs to list")
+    args = parser.parse_args()
+
+    emu = Emulator(args.rom, False)
+    select_quirks(emu)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.load_program_into_memory()
+    emu.run = True
+    scheduler = Scheduler(emu) if args.realtime else Scheduler(emu, sleep=lambda seconds: None)
+    scheduler.on_tick.append(FramePresenter(emu).on_tick)
+    profiler = Profiler(emu)
+    profiler.install(scheduler)
+    try:
+        scheduler.run(ticks=args.frames)
+    finally:
+        profiler.uninstall()
+        print(profiler.dump(args.json, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+import os
+import sys
+import time
+import numpy as np
+import pygame
+
+from debugger import describe
+from disassembler import DEFAULT_CACHE_DIR, load_analysis
+from emulator import Emulator
+from faults import EmulatorFault
+from frontends import Display, FramePresenter, Keypad, KeypadInput, Sound
+from jit import Jit
+from profiler import Profiler
+from quirks import select_quirks
+from replay import RecordingInput, finish_recording
+from scheduler import DEFAULT_IPS, Scheduler
+
+
+class PygameDisplay(Display):
+    """Scales the framebuffer into a pygame window, with the debug info panel to its right in debug mode."""
+
+    main_window_size = (640, 320)
+    main_window_debug_mode_size = (800, 320)
+    info_bar_size = (160, 320)
+
+    def __init__(self, debug_mode):
+        window_size = self.main_window_debug_mode_size if debug_mode else self.main_window_size
+        self.main_window = pygame.display.set_mode(window_size)
+        self.game_window = pygame.Surface(Emulator.DISPLAY_SIZE)
+        self.game_window_scaled = pygame.Surface(self.main_window_size)
+        pygame.transform.scale(self.game_window, self.main_window_size, self.game_window_scaled)
+
+        self.info_bar_window = None
+        if debug_mode:
+            self.info_bar_window = pygame.Surface(self.info_bar_size)
+            self.info_bar_window.fill(DebugPanel.background)
+
+    def update(self, pixels):
+        pygame.surfarray.blit_array(self.game_window, np.where(pixels, 0xFFFFFF, 0x0))
+        pygame.transform.scale(self.game_window, self.main_window_size, self.game_window_scaled)
+
+        self.main_window.blit(self.game_window_scaled, (0, 0))
+        if self.info_bar_window is not None:
+            self.main_window.blit(self.info_bar_window, (self.main_window_size[0], 0))
+        pygame.display.update()
+
+    def update_info_bar(self, rects):
+        """Present the given areas of the info bar, leaving the rest of the window as it is."""
+
+        x = self.main_window_size[0]
+        screen_rects = [rect.move(x, 0) for rect in rects]
+        for rect, screen_rect in zip(rects, screen_rects):
+            self.main_window.blit(self.info_bar_window, screen_rect, rect)
+        pygame.display.update(screen_rects)
+
+
+class GlyphAtlas:
+    """The characters used by hex values, each rendered once, so that values are drawn by blitting glyphs."""
+
+    characters = "0123456789ABCDEFx"
+
+    def __init__(self, font, color, background):
+        self.glyphs = {c: font.render(c, True, color, background) for c in self.characters}
+        # Fixed cell width, so that a field always covers the same area whatever its digits.
+        self.width = max(glyph.get_width() for glyph in self.glyphs.values())
+        self.height = max(glyph.get_height() for glyph in self.glyphs.values())
+
+    def draw(self, surface, text, position):
+        x, y = position
+        glyphs = self.glyphs
+        for c in text:
+            surface.blit(glyphs[c], (x, y))
+            x += self.width
+
+
+class DebugPanel:
+    """The debug info panel: registers, stack, I, SP, PC and the opcode at PC.
+
+    The labels are rendered once, when the panel is created. refresh() compares the machine state with what is
+    on the panel, redraws only the values that changed from the glyph atlas and returns the changed areas.
+    """
+
+    background = (0x0f, 0x34, 0x3b)
+    color = (255, 255, 255)
+
+    def __init__(self, font, surface):
+        self.surface = surface
+        self.atlas = GlyphAtlas(font, self.color, self.background)
+        # (position, format) of every value field, in the order of values().
+        self.fields = []
+        self.shown = None
+        # Number of characters last drawn in each field. I can grow past four hex digits and PC and the stack
+        # past three, so a value can be wider or narrower than the one it replaces.
+        self.drawn = []
+        surface.fill(self.background)
+
+        v_x = 15
+        stack_x = 100
+        self.label(font, "Registers", (v_x, 5))
+        self.label(font, "Stack", (stack_x, 5))
+        for i in range(16):
+            y_offset = 20 + 15 * i
+            self.fields.append((self.label(font, f"{i:X}: ", (v_x, y_offset)), "0x{:02X}"))
+        for i in range(16):
+            y_offset = 20 + 15 * i
+            self.fields.append((self.label(font, f"{i:X}: ", (stack_x, y_offset)), "0x{:03X}"))
+
+        extras_x = 15
+        extras_y = 270
+        self.fields.append((self.label(font, "I:  ", (extras_x, extras_y)), "0x{:04X}"))
+        self.fields.append((self.label(font, "SP: ", (extras_x, extras_y + 15)), "0x{:02X}"))
+        self.fields.append((self.label(font, "PC: ", (extras_x, extras_y + 30)), "0x{:03X}"))
+
+        opcode_x = 100
+        self.label(font, "Opcode", (opcode_x, extras_y))
+        self.fields.append(((opcode_x, extras_y + 15), "{:04X}"))
+        self.drawn = [0] * len(self.fields)
+
+    def label(self, font, text, position):
+        """Draw a static label and return the position right after it."""
+
+        rendered = font.render(text, True, self.color, self.background)
+        self.surface.blit(rendered, position)
+        return position[0] + rendered.get_width(), position[1]
+
+    @staticmethod
+    def values(emulator):
+        memory = emulator.memory
+        pc = emulator.pc
+        return [
+            *emulator.registers, *emulator.stack, emulator.I, emulator.stack_pointer, pc,
+            memory[pc] << 8 | memory[pc + 1] if pc < len(memory) - 1 else 0,
+        ]
+
+    def refresh(self, emulator):
+        """Redraw the values that changed since the last refresh. Returns the list of redrawn rectangles."""
+
+        values = self.values(emulator)
+        shown = self.shown
+        self.shown = values
+        atlas = self.atlas
+        rects = []
+        for i, value in enumerate(values):
+            if shown is not None and shown[i] == value:
+                continue
+            position, value_format = self.fields[i]
+            text = value_format.format(value)
+            # Clear whichever is wider, the old value or the new one, so no digits of a longer old value remain.
+            rect = pygame.Rect(position, (atlas.width * max(len(text), self.drawn[i]), atlas.height))
+            self.drawn[i] = len(text)
+            self.surface.fill(self.background, rect)
+            atlas.draw(self.surface, text, position)
+            rects.append(rect)
+        return rects
+
+
+class PygameKeypad(Keypad):
+    """Keypad driven by pygame keyboard events."""
+
+    keyboard_mapping = {
+        0x1: pygame.K_1,
+        0x2: pygame.K_2,
+        0x3: pygame.K_3,
+        0xC: pygame.K_4,
+        0x4: pygame.K_q,
+        0x5: pygame.K_w,
+        0x6: pygame.K_e,
+        0xD: pygame.K_r,
+        0x7: pygame.K_a,
+        0x8: pygame.K_s,
+        0x9: pygame.K_d,
+        0xE: pygame.K_f,
+        0xA: pygame.K_z,
+        0x0: pygame.K_x,
+        0xB: pygame.K_c,
+        0xF: pygame.K_v
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.pygame_key_to_key = {value: key for key, value in PygameKeypad.keyboard_mapping.items()}
+
+    def handle_event(self, event):
+        """Update the key state from a KEYDOWN or KEYUP event."""
+
+        key = self.pygame_key_to_key.get(getattr(event, "key", None))
+        if key is None:
+            return
+        if event.type == pygame.KEYDOWN:
+            self.press(key)
+        elif event.type == pygame.KEYUP:
+            self.release(key)
+
+
+def synthesise_tone(frequency, sample_rate, channels, periods=100):
+    """Return a 16-bit square wave of `periods` whole periods, shaped (samples, channels), for looping."""
+
+    samples = round(periods * sample_rate / frequency)
+    # Sign of a sine, so that the loop point falls on a period boundary.
+    wave = np.where(np.sin(2 * np.pi * periods * np.arange(samples) / samples) >= 0, 0x3FFF, -0x3FFF)
+    return np.repeat(wave.astype(np.int16)[:, np.newaxis], channels, axis=1)
+
+
+class PygameSound(Sound):
+    """Loops a tone through the pygame mixer while the sound timer runs.
+
+    The tone is a square wave synthesised once, at startup, or the sample in the sound file if one is given and
+    exists. Starting and stopping only queue commands to the mixer's own thread.
+    """
+
+    frequency = 440
+    volume = 0.1
+
+    def __init__(self, sound_name=None):
+        pygame.mixer.init(frequency=44100, size=-16, channels=1)
+        if sound_name is not None and os.path.exists(sound_name):
+            self.sound = pygame.mixer.Sound(sound_name)
+        else:
+            sample_rate, _, channels = pygame.mixer.get_init()
+            samples = synthesise_tone(self.frequency, sample_rate, channels)
+            self.sound = pygame.sndarray.make_sound(samples if channels > 1 else samples[:, 0])
+        self.sound.set_volume(self.volume)
+
+    def start(self):
+        self.sound.play(loops=-1)
+
+    def stop(self):
+        self.sound.stop()
+
+
+class PygameFrontend:
+    """Runs an Emulator in a pygame window, optionally with the debug panel.
+
+    In debug mode the program starts paused: F1 executes one instruction and F3 runs or pauses it at full speed,
+    with the panel refreshed once per frame. With a debugger.Debugger, the frontend is in debug mode and runs the
+    program from the start until a breakpoint or watchpoint pauses it.
+    """
+
+    font_name = "SourceCodePro-Black.ttf"
+    # Sample to loop as the tone, used instead of the synthesised one if the file exists.
+    sound_name = "beep-6.wav"
+
+    def __init__(self, emulator, recording=None, ips=DEFAULT_IPS, profile_path=None, debugger=None,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        self.emulator = emulator
+        self.debugger = debugger
+        self.debug_mode = emulator.debug_mode or debugger is not None
+        self.panel = None
+        # replay.InputLog that the key state changes are recorded into, if any.
+        self.recording = recording
+        self.ips = ips
+        self.keypad = None
+        self.scheduler = None
+        # Whether a debug mode run is going on, as opposed to stepping with F1.
+        self.running = False
+        # With a path, the run is profiled. F2 and quitting print the report and write it there as JSON.
+        self.profile_path = profile_path
+        self.profiler = None
+        # Where the ROM's analysis is cached; None neither reads nor writes the cache.
+        self.cache_dir = cache_dir
+
+    def start(self):
+        """Start the emulator."""
+
+        emulator = self.emulator
+        emulator.run = True
+        select_quirks(emulator)
+        emulator.map_opcodes_to_functions()
+        emulator.load_standard_sprites()
+        emulator.load_program_into_memory()
+        jit = Jit(emulator)
+        jit.install()
+        # Compile the ROM's code before the first frame instead of while the first frames run.
+        with open(emulator.file, "rb") as f:
+            jit.preload(load_analysis(f.read(), self.cache_dir).blocks)
+        if self.debugger is not None:
+            self.debugger.install()
+            self.debugger.on_break.append(self.pause)
+            self.running = True
+
+        pygame.init()
+        try:
+            emulator.sound = PygameSound(self.sound_name)
+        except pygame.error as error:
+            # No audio device, run silently.
+            print(f"sound disabled: {error}", file=sys.stderr)
+        self.keypad = PygameKeypad()
+        emulator.display = PygameDisplay(self.debug_mode)
+        scheduler = self.scheduler = Scheduler(emulator, ips=self.ips, sleep=self.wait_for_events)
+        # Also handle events on every tick, in case the host is too far behind to ever wait.
+        scheduler.on_tick.append(self.handle_pending_events)
+        if self.debug_mode:
+            emulator.keypad = self.keypad
+            self.panel = DebugPanel(pygame.font.Font(self.font_name, 12), emulator.display.info_bar_window)
+            # The panel goes first, so that a frame presented on the same tick includes it.
+            scheduler.on_tick.append(self.refresh_info_panel)
+            scheduler.on_tick.append(FramePresenter(emulator).on_tick)
+            self.panel.refresh(emulator)
+            emulator.update_display()
+            if not self.running:
+                self.run_program_debug_mode()
+            while emulator.run:
+                if self.running:
+                    self.run_scheduler()
+                else:
+                    # Nothing runs between steps, so just block until the next event.
+                    self.handle_event(pygame.event.wait())
+        else:
+            # Events update self.keypad whenever they arrive. The program sees it through a keypad that only
+            # changes at tick boundaries, so that the run can be recorded and replayed exactly.
+            emulator.keypad = Keypad()
+            scheduler.input_source = KeypadInput(self.keypad)
+            if self.recording is not None:
+                scheduler.input_source = RecordingInput(scheduler.input_source, self.recording)
+            scheduler.on_tick.append(FramePresenter(emulator).on_tick)
+            if self.profile_path is not None:
+                self.profiler = Profiler(emulator)
+                self.profiler.install(scheduler)
+            self.run_scheduler()
+            if self.recording is not None:
+                finish_recording(scheduler, self.recording)
+            self.dump_profile()
+        pygame.quit()
+
+    def run_scheduler(self):
+        """Run until the window is closed or the debug run is paused. Exits on a fault."""
+
+        try:
+            self.scheduler.run()
+        except EmulatorFault as fault:
+            print(fault, file=sys.stderr)
+            self.dump_profile()
+            pygame.quit()
+            sys.exit(1)
+
+    def dump_profile(self):
+        if self.profiler is not None:
+            print(self.profiler.dump(self.profile_path))
+
+    def wait_for_events(self, seconds):
+        """Handle events as they arrive for `seconds`. This is the scheduler's sleep between ticks."""
+
+        deadline = time.perf_counter() + seconds
+        while self.emulator.run:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            # Blocks until an event arrives or the timeout (in ms) expires, then returns NOEVENT.
+            self.handle_event(pygame.event.wait(max(1, int(remaining * 1000))))
+
+    def handle_pending_events(self, scheduler):
+        for event in pygame.event.get():
+            self.handle_event(event)
+
+    def handle_event(self, event):
+        """Handle quitting, key presses and the debug keys."""
+
+        if event.type == pygame.QUIT:
+            # The scheduler stops at the end of its tick and start() shuts pygame down.
+            self.emulator.run = False
+            return
+
+        self.keypad.handle_event(event)
+
+        if event.type == pygame.KEYDOWN:
+            # F2 = print the profile so far.
+            if event.key == pygame.K_F2:
+                self.dump_profile()
+            if not self.debug_mode:
+                return
+            # F3 = run or pause.
+            if event.key == pygame.K_F3:
+                if self.running:
+                    self.pause()
+                else:
+                    self.running = True
+            # F1 = decode next opcode.
+            if event.key == pygame.K_F1 and not self.running:
+                try:
+                    self.run_program_debug_mode()
+                except EmulatorFault as fault:
+                    print(fault, file=sys.stderr)
+                    pygame.quit()
+                    sys.exit(1)
+
+    def pause(self, debugger=None):
+        """Stop a debug mode run at the end of the current tick, or at the breakpoint that fired, and go back to
+        stepping."""
+
+        if debugger is not None:
+            print(describe(debugger.hit), file=sys.stderr)
+            # The tick was cut short, so its on_tick callbacks do not run until it is finished. Show where it
+            # stopped.
+            self.refresh_info_panel()
+            if self.emulator.display_dirty:
+                self.emulator.update_display()
+        self.running = False
+        self.scheduler.stop()
+
+    def run_program_debug_mode(self):
+        self.scheduler.step()
+        self.refresh_info_panel()
+        if self.emulator.display_dirty:
+            self.emulator.update_display()
+
+    def refresh_info_panel(self, scheduler=None):
+        """Redraw the changed panel fields and present them, unless the whole frame is about to be presented."""
+
+        rects = self.panel.refresh(self.emulator)
+        if rects and not self.emulator.display_dirty:
+            self.emulator.display.update_info_bar(rects)
@@ -0,0 +1,178 @@
+"""CHIP-8 variant behaviours ("quirks"), selected per ROM.
+
+Each quirk replaces some instruction handlers with a variant. quirk_class() turns a set of quirks into an
+Emulator subclass holding those variants, and build_decode_table() builds and caches a separate dispatch table
+for every such class, so a quirk set costs nothing per instruction: the handlers in the table simply are the
+variants. Emulator.map_opcodes_to_functions() picks the table for the emulator's quirks.
+
+The database is a JSON object mapping the SHA-1 hash of a ROM (hex) to a profile name or a list of quirks, for
+example {"3b7b2b...": {"name": "Blinky", "profile": "cosmac"}}.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from emulator import SPRITE_BITS, Emulator
+from faults import MemoryAccessFault
+
+# Shift instructions 8xy6 and 8xyE shift Vy into Vx, instead of shifting Vx in place.
+SHIFT_VY = "shift_vy"
+# Fx55 and Fx65 leave I pointing after the last register stored or loaded, instead of leaving it unchanged.
+INCREMENT_I = "increment_i"
+# Bxnn jumps to xnn + Vx, instead of Bnnn jumping to nnn + V0.
+JUMP_VX = "jump_vx"
+# Sprites that reach past the edge of the screen are clipped, instead of wrapping to the opposite side.
+CLIP_SPRITES = "clip_sprites"
+
+QUIRKS = (SHIFT_VY, INCREMENT_I, JUMP_VX, CLIP_SPRITES)
+
+PROFILES = {
+    # The behaviour of the plain Emulator handlers.
+    "default": frozenset(),
+    # The original COSMAC VIP interpreter.
+    "cosmac": frozenset({SHIFT_VY, INCREMENT_I, CLIP_SPRITES}),
+    # SUPER-CHIP on the HP48.
+    "schip": frozenset({JUMP_VX, CLIP_SPRITES}),
+}
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quirks.json")
+
+
+def instruction_8xy6_shift_vy(self, vx, vy):
+    """Set Vx = Vy SHR 1."""
+
+    value = self.registers[vy]
+    self.registers[vx] = value >> 1
+    self.registers[0xF] = value & 0x1
+    self.pc += 2
+
+
+def instruction_8xyE_shift_vy(self, vx, vy):
+    """Set Vx = Vy SHL 1."""
+
+    value = self.registers[vy]
+    self.registers[vx] = (value << 1) % Emulator.UNSIGNED_CHAR_SIZE
+    self.registers[0xF] = (value >> 7) & 0x1
+    self.pc += 2
+
+
+def instruction_Fx55_increment_i(self, vx):
+    """Store registers V0 through Vx in memory starting at location I, then set I = I + x + 1."""
+
+    Emulator.instruction_Fx55(self, vx)
+    self.I += vx + 1
+
+
+def instruction_Fx65_increment_i(self, vx):
+    """Read registers V0 through Vx from memory starting at location I, then set I = I + x + 1."""
+
+    Emulator.instruction_Fx65(self, vx)
+    self.I += vx + 1
+
+
+def instruction_Bnnn_jump_vx(self, nnn):
+    """Jump to location xnn + Vx."""
+
+    self.pc = nnn + self.registers[nnn >> 8]
+
+
+def instruction_Dxyn_clip_sprites(self, vx, vy, num_of_bytes):
+    """Display n-byte sprite starting at memory location I at (Vx, Vy), set VF = collision. The sprite is clipped
+    at the edges of the screen."""
+
+    sprite_bytes = self.memory[self.I:self.I + num_of_bytes]
+    if len(sprite_bytes) != num_of_bytes:
+        raise self.fault(MemoryAccessFault)
+
+    # The position wraps, the sprite itself does not.
+    x = self.registers[vx] % Emulator.DISPLAY_SIZE[0]
+    y = self.registers[vy] % Emulator.DISPLAY_SIZE[1]
+    width = min(8, Emulator.DISPLAY_SIZE[0] - x)
+    height = min(num_of_bytes, Emulator.DISPLAY_SIZE[1] - y)
+    sprite = SPRITE_BITS.take(sprite_bytes[:height], axis=0)[:, :width].T
+
+    screen_area = self.pixels[x:x + width, y:y + height]
+    self.registers[0xF] = int(np.count_nonzero(screen_area & sprite) != 0)
+    screen_area ^= sprite
+
+    self.display_dirty = True
+    self.pc += 2
+
+
+# Quirk -> {handler name: variant}. The variants keep the handler names, which the engines and tools go by.
+VARIANTS = {
+    SHIFT_VY: {"instruction_8xy6": instruction_8xy6_shift_vy, "instruction_8xyE": instruction_8xyE_shift_vy},
+    INCREMENT_I: {"instruction_Fx55": instruction_Fx55_increment_i, "instruction_Fx65": instruction_Fx65_increment_i},
+    JUMP_VX: {"instruction_Bnnn": instruction_Bnnn_jump_vx},
+    CLIP_SPRITES: {"instruction_Dxyn": instruction_Dxyn_clip_sprites},
+}
+for _handlers in VARIANTS.values():
+    for _name, _variant in _handlers.items():
+        _variant.__name__ = _name
+
+_quirk_classes = {}
+
+
+def quirk_class(emulator_class, quirks):
+    """Return the subclass of emulator_class whose handlers implement `quirks`. Classes are built once per set."""
+
+    quirks = frozenset(quirks)
+    key = (emulator_class, quirks)
+    cls = _quirk_classes.get(key)
+    if cls is None:
+        unknown = quirks.difference(QUIRKS)
+        if unknown:
+            raise ValueError(f"unknown quirks: {', '.join(sorted(unknown))}")
+        handlers = {"__slots__": ()}
+        for quirk in sorted(quirks):
+            handlers.update(VARIANTS[quirk])
+        name = f"{emulator_class.__name__}[{','.join(sorted(quirks))}]"
+        cls = _quirk_classes[key] = type(name, (emulator_class,), handlers)
+    return cls
+
+
+def parse_quirks(text):
+    """Return the quirk set for a profile name or a comma-separated list of quirks."""
+
+    if text in PROFILES:
+        return PROFILES[text]
+    quirks = frozenset(quirk.strip() for quirk in text.split(",") if quirk.strip())
+    unknown = quirks.difference(QUIRKS)
+    if unknown:
+        raise ValueError(f"unknown quirks or profile: {', '.join(sorted(unknown))}")
+    return quirks
+
+
+def load_database(path=DEFAULT_DATABASE):
+    """Return the quirk database as {ROM SHA-1 hex: quirk set}. A missing file is an empty database."""
+
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return {}
+    database = {}
+    for rom_hash, entry in entries.items():
+        if isinstance(entry, dict):
+            entry = entry.get("profile", entry.get("quirks", []))
+        database[rom_hash.lower()] = PROFILES[entry] if isinstance(entry, str) else frozenset(entry)
+    return database
+
+
+def quirks_for_rom(rom, database=None):
+    """Return the quirks the database lists for the ROM bytes, or the default profile."""
+
+    if database is None:
+        database = load_database()
+    return database.get(hashlib.sha1(rom).hexdigest(), PROFILES["default"])
+
+
+def select_quirks(emulator, database=None):
+    """Set the emulator's quirks from the database, unless they were chosen explicitly. Call before
+    map_opcodes_to_functions()."""
+
+    if emulator.quirks is None:
+        with open(emulator.file, "rb") as f:
+            emulator.quirks = quirks_for_rom(f.read(Emulator.PROGRAM_SIZE + 1), database)
@@ -0,0 +1,199 @@
+"""Record a session's input and replay it headless, unthrottled, checking that it ends on the same frame.
+
+Usage:
+    python replay.py record ROM LOG [--seed N] [--ips N] [--cache-dir DIR | --no-cache]
+    python replay.py play ROM LOG [--engine interpreter|blocks|jit]
+
+A run is determined by the ROM, the seed of the Cxkk random number generator, the instructions per second, the
+quirks and the key state at every tick boundary. The log stores the first four (the ROM as a SHA-1 hash) and
+every change of the key state as (instruction number, 16-bit key mask), plus the tick count and framebuffer hash
+the recorded session ended with. A log replays with the quirks it was recorded with, whatever the quirk database
+says now.
+"""
+import argparse
+import hashlib
+import random
+import struct
+import sys
+import time
+
+from disassembler import add_cache_arguments
+from emulator import Emulator
+from engines import ENGINES, framebuffer_hash
+from faults import InputLogError
+from quirks import QUIRKS, select_quirks
+from scheduler import DEFAULT_IPS, Scheduler
+
+INPUT_LOG_MAGIC = b"C8IN"
+INPUT_LOG_VERSION = 2
+# magic, version, ROM SHA-1, seed, instructions per second, quirks (bit n set for QUIRKS[n]), ticks, final
+# framebuffer SHA-1, number of events.
+INPUT_LOG_HEADER = struct.Struct("<4sH20sQIHQ20sI")
+# Instruction number at which the new key mask applies, key mask.
+INPUT_LOG_EVENT = struct.Struct("<QH")
+
+
+class InputLog:
+    """Everything needed to reproduce a run: ROM hash, seed, IPS, quirks and the key state changes."""
+
+    def __init__(self, rom_hash, seed, ips=DEFAULT_IPS, quirks=frozenset()):
+        self.rom_hash = rom_hash
+        self.seed = seed
+        self.ips = ips
+        self.quirks = frozenset(quirks)
+        # (cycle, key mask) for every change of the key state, in order.
+        self.events = []
+        # Filled in when the recording ends.
+        self.ticks = 0
+        self.framebuffer = bytes(20)
+
+    def to_bytes(self):
+        header = INPUT_LOG_HEADER.pack(
+            INPUT_LOG_MAGIC, INPUT_LOG_VERSION, self.rom_hash, self.seed, self.ips,
+            sum(1 << QUIRKS.index(quirk) for quirk in self.quirks), self.ticks, self.framebuffer, len(self.events),
+        )
+        return header + b"".join(INPUT_LOG_EVENT.pack(cycle, mask) for cycle, mask in self.events)
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            magic, version, rom_hash, seed, ips, quirk_bits, ticks, framebuffer, count = \
+                INPUT_LOG_HEADER.unpack_from(data)
+        except struct.error:
+            raise InputLogError("input log is truncated") from None
+        if magic != INPUT_LOG_MAGIC or version != INPUT_LOG_VERSION:
+            raise InputLogError(f"unsupported input log (magic {magic!r}, version {version})")
+        if len(data) != INPUT_LOG_HEADER.size + count * INPUT_LOG_EVENT.size:
+            raise InputLogError("input log is truncated")
+        if quirk_bits >> len(QUIRKS):
+            raise InputLogError(f"input log has unknown quirks (flags {quirk_bits:#06x})")
+        quirks = frozenset(quirk for n, quirk in enumerate(QUIRKS) if quirk_bits >> n & 1)
+        log = cls(rom_hash, seed, ips, quirks)
+        log.ticks = ticks
+        log.framebuffer = framebuffer
+        log.events = list(INPUT_LOG_EVENT.iter_unpack(data[INPUT_LOG_HEADER.size:]))
+        return log
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class RecordingInput:
+    """Input source that passes another source's samples through and logs every change."""
+
+    def __init__(self, source, log):
+        self.source = source
+        self.log = log
+        self.mask = 0
+
+    def sample(self, cycle):
+        mask = self.source.sample(cycle)
+        if mask != self.mask:
+            self.log.events.append((cycle, mask))
+            self.mask = mask
+        return mask
+
+
+class ReplayInput:
+    """Input source that plays back the key state changes of an input log."""
+
+    def __init__(self, log):
+        self.events = log.events
+        self.next_event = 0
+        self.mask = 0
+
+    def sample(self, cycle):
+        events = self.events
+        while self.next_event < len(events) and events[self.next_event][0] <= cycle:
+            self.mask = events[self.next_event][1]
+            self.next_event += 1
+        return self.mask
+
+
+def rom_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def make_emulator(rom_path, seed, engine="jit", quirks=None):
+    emu = Emulator(rom_path, False, seed=seed, quirks=quirks)
+    select_quirks(emu)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.load_program_into_memory()
+    if ENGINES[engine] is not None:
+        ENGINES[engine](emu).install()
+    return emu
+
+
+def finish_recording(scheduler, log):
+    """Store the end of the recorded session, and the quirks it ran with, in the log."""
+
+    log.quirks = frozenset(scheduler.emulator.quirks or ())
+    log.ticks = scheduler.ticks
+    log.framebuffer = bytes.fromhex(framebuffer_hash(scheduler.emulator.pixels))
+
+
+def replay(rom_path, log, engine="jit"):
+    """Re-run a recorded session as fast as possible. Returns (emulator, matched) where matched tells whether the
+    final framebuffer is the one the recording ended with."""
+
+    if rom_hash(rom_path) != log.rom_hash:
+        raise InputLogError(f"{rom_path} is not the ROM this input log was recorded with")
+    emu = make_emulator(rom_path, log.seed, engine, log.quirks)
+    emu.run = True
+    scheduler = Scheduler(emu, ips=log.ips)
+    scheduler.input_source = ReplayInput(log)
+    for _ in range(log.ticks):
+        scheduler.run_tick()
+    return emu, bytes.fromhex(framebuffer_hash(emu.pixels)) == log.framebuffer
+
+
+def parse_seed(text):
+    """Parse a seed that fits the unsigned 64-bit field of the log header."""
+
+    seed = int(text, 0)
+    if not 0 <= seed < 1 << 64:
+        raise argparse.ArgumentTypeError(f"seed {text} is not between 0 and 2**64 - 1")
+    return seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=("record", "play"))
+    parser.add_argument("rom")
+    parser.add_argument("log")
+    parser.add_argument("--seed", type=parse_seed, help="random number generator seed (default: random)")
+    parser.add_argument("--ips", type=int, default=DEFAULT_IPS)
+    parser.add_argument("--engine", choices=ENGINES, default="jit")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        # Imported here so that replays work without pygame installed.
+        from pygame_frontend import PygameFrontend
+        seed = args.seed if args.seed is not None else random.getrandbits(64)
+        log = InputLog(rom_hash(args.rom), seed, args.ips)
+        emu = Emulator(args.rom, False, seed=seed)
+        PygameFrontend(emu, recording=log, ips=args.ips, cache_dir=args.cache_dir).start()
+        log.save(args.log)
+        return
+
+    log = InputLog.load(args.log)
+    start = time.perf_counter()
+    emu, matched = replay(args.rom, log, args.engine)
+    elapsed = time.perf_counter() - start
+    print(f"replayed {log.ticks:,} ticks ({log.ticks / 60:,.1f} s of play, {emu.cycles:,} instructions, "
+          f"{len(log.events):,} input changes) in {elapsed:.2f} s")
+    print("framebuffer matches the recording" if matched else "framebuffer DIFFERS from the recording")
+    sys.exit(0 if matched else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+from collections import deque
+
+import numpy as np
+
+# A full snapshot is kept every this many frames. Every other frame is stored as the bytes that differ from it.
+KEYFRAME_INTERVAL = 60
+# One minute of frames at 60 Hz.
+DEFAULT_CAPACITY = 3600
+
+
+class RewindBuffer:
+    """Ring buffer of per-frame save states, for stepping backwards and restarting from recent checkpoints.
+
+    Call record() once per frame, or register on_tick as a Scheduler callback. Every KEYFRAME_INTERVAL frames a
+    full save state is stored. The frames in between are stored as the positions and values of the bytes that
+    differ from the last keyframe, which for most programs is a few dozen bytes. Once `capacity` frames are
+    stored, recording a frame drops the oldest one.
+    """
+
+    def __init__(self, emulator, capacity=DEFAULT_CAPACITY, keyframe_interval=KEYFRAME_INTERVAL):
+        self.emulator = emulator
+        self.keyframe_interval = keyframe_interval
+        # (keyframe as a uint8 array, changed positions or None for the keyframe itself, values at those positions).
+        self.frames = deque(maxlen=capacity)
+        self.keyframe = None
+        self.frames_since_keyframe = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def memory_used(self):
+        """Bytes held by the stored frames and the keyframes they refer to."""
+
+        keyframes = {id(keyframe): keyframe.nbytes for keyframe, _, _ in self.frames}
+        deltas = sum(positions.nbytes + values.nbytes for _, positions, values in self.frames if positions is not None)
+        return sum(keyframes.values()) + deltas
+
+    def record(self):
+        """Store the emulator's current state as the newest frame."""
+
+        state = np.frombuffer(self.emulator.save_state(), dtype=np.uint8)
+        if self.keyframe is None or self.frames_since_keyframe >= self.keyframe_interval:
+            self.keyframe = state
+            self.frames_since_keyframe = 1
+            self.frames.append((state, None, None))
+            return
+        positions = np.flatnonzero(state != self.keyframe).astype(np.uint16)
+        self.frames.append((self.keyframe, positions, state[positions]))
+        self.frames_since_keyframe += 1
+
+    def on_tick(self, scheduler):
+        self.record()
+
+    def state(self, frames_ago=0):
+        """Return the save state recorded `frames_ago` frames before the newest one."""
+
+        keyframe, positions, values = self.frames[-1 - frames_ago]
+        if positions is None:
+            return keyframe.tobytes()
+        state = keyframe.copy()
+        state[positions] = values
+        return state.tobytes()
+
+    def rewind(self, frames=1):
+        """Drop the newest `frames` frames and restore the one before them. Returns how many frames were dropped."""
+
+        frames = min(frames, len(self.frames) - 1)
+        if frames < 0:
+            return 0
+        for _ in range(frames):
+            self.frames.pop()
+        self.emulator.load_state(self.state())
+        # Start a new keyframe on the next record, the current one may be older than the restored frame.
+        self.keyframe = None
+        return frames
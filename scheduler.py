@@ -0,0 +1,146 @@
+import time
+
+TIMER_FREQUENCY = 60
+DEFAULT_IPS = 700
+
+
+def cycles_for_tick(ips, tick):
+    """Number of instructions to execute during timer tick number `tick` to average `ips` instructions/s."""
+
+    # Spreading the remainder over the ticks keeps rates that are not a multiple of 60 exact over a second.
+    return (tick + 1) * ips // TIMER_FREQUENCY - tick * ips // TIMER_FREQUENCY
+
+
+class Scheduler:
+    """Runs an emulator at a fixed number of instructions per second and ticks its timers at exactly 60 Hz.
+
+    Every tick executes that tick's share of instructions, decrements the timers and calls the on_tick
+    callbacks, then sleeps until the next deadline. While the program waits for a key with Fx0A and none is
+    pressed, the instructions are counted without being executed. Deadlines are computed from the start of the
+    run rather than from the previous wake-up, so sleep overshoot does not accumulate. If the host falls more than
+    max_lag seconds behind, the schedule is moved forward instead of running a burst of catch-up ticks.
+    The emulated timeline (instructions per tick) is the same whatever the host does.
+    """
+
+    def __init__(self, emulator, ips=DEFAULT_IPS, clock=time.perf_counter, sleep=time.sleep, max_lag=0.25):
+        self.emulator = emulator
+        self.ips = ips
+        self.clock = clock
+        self.sleep = sleep
+        self.max_lag = max_lag
+        self.tick_period = 1 / TIMER_FREQUENCY
+        # Callables invoked as callback(scheduler) after every tick.
+        self.on_tick = []
+        # Input source sampled before every tick, see frontends.KeypadInput. None leaves the keypad alone.
+        self.input_source = None
+        # Set by stop() to make run() return at the end of the current tick.
+        self.stopping = False
+
+        self.ticks = 0
+        self.cycles = 0
+        self.elapsed = 0.0
+        self.resyncs = 0
+        # Lateness of the current tick, for callbacks that adapt to a slow host.
+        self.lateness = 0.0
+        # Lateness of each tick relative to its deadline, in seconds.
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    @property
+    def achieved_ips(self):
+        return self.cycles / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mean_jitter(self):
+        return self.total_jitter / self.ticks if self.ticks else 0.0
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "cycles": self.cycles,
+            "target_ips": self.ips,
+            "achieved_ips": self.achieved_ips,
+            "mean_jitter": self.mean_jitter,
+            "max_jitter": self.max_jitter,
+            "resyncs": self.resyncs,
+        }
+
+    def run_tick(self):
+        """Execute one tick's instructions, then decrement the timers. Returns False if a debugger breakpoint cut
+        the tick short; the next call then finishes it, without sampling the input again."""
+
+        emulator = self.emulator
+        if self.input_source is not None and not emulator.frame_remaining:
+            emulator.keypad.set_mask(self.input_source.sample(emulator.cycles))
+        self.cycles += emulator.run_frame(cycles_for_tick(self.ips, self.ticks))
+        if emulator.frame_remaining:
+            return False
+        self.ticks += 1
+        for callback in self.on_tick:
+            callback(self)
+        return True
+
+    def step(self):
+        """Execute a single instruction of the current tick with Emulator.step, for single-stepping in a debugger.
+        Returns True if it was the tick's last instruction.
+
+        The rest of the tick is left in emulator.frame_remaining, as when a breakpoint cuts it short, so stepping
+        and running can be mixed without changing the program's timeline. The step that executes the last
+        instruction finishes the tick like run_tick: the timers are decremented and the on_tick callbacks run.
+        """
+
+        emulator = self.emulator
+        if not emulator.frame_remaining:
+            if self.input_source is not None:
+                emulator.keypad.set_mask(self.input_source.sample(emulator.cycles))
+            emulator.frame_remaining = cycles_for_tick(self.ips, self.ticks)
+        emulator.step()
+        emulator.frame_remaining -= 1
+        self.cycles += 1
+        if emulator.frame_remaining:
+            return False
+        emulator.tick_timers()
+        emulator.frames += 1
+        self.ticks += 1
+        for callback in self.on_tick:
+            callback(self)
+        return True
+
+    def stop(self):
+        """Make run() return after the current tick, leaving the emulator runnable."""
+
+        self.stopping = True
+
+    def run(self, ticks=None):
+        """Run in real time until emulator.run is cleared or stop() is called, or for `ticks` ticks if given."""
+
+        emulator = self.emulator
+        start = self.clock()
+        # Deadlines are origin + n * tick_period, so rounding errors do not add up either.
+        origin = start
+        n = 0
+        ran = 0
+        try:
+            while emulator.run and not self.stopping and (ticks is None or ran < ticks):
+                deadline = origin + n * self.tick_period
+                now = self.clock()
+                if deadline > now:
+                    self.sleep(deadline - now)
+                    now = self.clock()
+                lateness = now - deadline
+                if lateness > self.max_lag:
+                    # Too far behind to catch up, restart the schedule from now.
+                    origin = now
+                    n = 0
+                    lateness = 0.0
+                    self.resyncs += 1
+                self.lateness = lateness
+                self.total_jitter += lateness
+                self.max_jitter = max(self.max_jitter, lateness)
+
+                if self.run_tick():
+                    ran += 1
+                    n += 1
+        finally:
+            self.stopping = False
+            self.elapsed += self.clock() - start
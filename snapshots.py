@@ -0,0 +1,125 @@
+import numpy as np
+
+from emulator import SAVE_STATE_RANDOM, Emulator
+
+# Memory is tracked in pages of this many bytes. Fx33 and most Fx55 writes touch a single page.
+PAGE_SIZE = 32
+MEMORY_PAGES = Emulator.MEMORY_SIZE // PAGE_SIZE
+# The framebuffer packed 8 pixels to a byte and the random number generator state, as in save states. They follow
+# memory and are paged the same way: each framebuffer page holds 4 rows, and the generator's position, which is all
+# that changes between most draws, is the short last page.
+FRAMEBUFFER_SIZE = Emulator.DISPLAY_SIZE[0] * Emulator.DISPLAY_SIZE[1] // 8
+TAIL_SIZE = FRAMEBUFFER_SIZE + SAVE_STATE_RANDOM.size
+PAGE_COUNT = MEMORY_PAGES + -(-TAIL_SIZE // PAGE_SIZE)
+# Every this many snapshots one is stored in full, so that restoring never walks a longer chain.
+FULL_INTERVAL = 300
+
+
+class Snapshot:
+    """The machine state relative to a parent snapshot.
+
+    `cpu` is Emulator.save_cpu_state(), which is always stored. `pages` maps page numbers to the contents of the
+    memory, framebuffer and random number generator pages that changed since the parent was taken. A snapshot
+    without a parent holds every page.
+    """
+
+    __slots__ = ("parent", "cpu", "pages", "depth")
+
+    def __init__(self, parent, cpu, pages):
+        self.parent = parent
+        self.cpu = cpu
+        self.pages = pages
+        # Number of parents up to the full snapshot at the root of the chain.
+        self.depth = 0 if parent is None else parent.depth + 1
+
+    @property
+    def nbytes(self):
+        """Bytes of state held by this snapshot, not counting its parents."""
+
+        return len(self.cpu) + sum(len(data) for data in self.pages.values())
+
+    def state(self):
+        """Return the full save state, in the format of Emulator.save_state(), reassembled from the chain."""
+
+        pages = {}
+        snapshot = self
+        while len(pages) < PAGE_COUNT:
+            for page, data in snapshot.pages.items():
+                pages.setdefault(page, data)
+            snapshot = snapshot.parent
+        return b"".join((self.cpu, *(pages[page] for page in range(PAGE_COUNT))))
+
+
+class Snapshotter:
+    """Takes incremental snapshots of an emulator.
+
+    A write observer sets a dirty bit for every page that Fx33, Fx55 or a loaded state writes to, so take() only
+    copies the pages written since the previous snapshot, which becomes the new one's parent. Framebuffer and random
+    number generator pages are compared with the parent's instead. Nothing is added to the instructions that do not
+    write memory.
+
+    Only Emulator instances are covered. BatchedEmulator has no write observers and no save states.
+    """
+
+    def __init__(self, emulator, full_interval=FULL_INTERVAL):
+        self.emulator = emulator
+        self.full_interval = full_interval
+        # Bit n is set when page n was written since the last snapshot.
+        self.dirty = 0
+        self.parent = None
+        # The framebuffer and random number generator state of the parent.
+        self.parent_tail = None
+        emulator.write_observers.append(self.mark)
+
+    def close(self):
+        self.emulator.write_observers.remove(self.mark)
+
+    def mark(self, address, length):
+        """Write observer: set the dirty bits of the pages in memory[address:address + length]."""
+
+        first = address // PAGE_SIZE
+        last = (address + length - 1) // PAGE_SIZE
+        self.dirty |= (2 << last) - (1 << first)
+
+    def take(self):
+        """Return a snapshot of the emulator's current state."""
+
+        emulator = self.emulator
+        memory = emulator.memory
+        tail = np.packbits(emulator.pixels).tobytes() + emulator.save_random_state()
+        parent = self.parent
+        if parent is None or parent.depth + 1 >= self.full_interval:
+            pages = {page: bytes(memory[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]) for page in range(MEMORY_PAGES)}
+            for page in range(MEMORY_PAGES, PAGE_COUNT):
+                start = (page - MEMORY_PAGES) * PAGE_SIZE
+                pages[page] = tail[start:start + PAGE_SIZE]
+            snapshot = Snapshot(None, emulator.save_cpu_state(), pages)
+        else:
+            pages = {}
+            dirty = self.dirty
+            page = 0
+            while dirty:
+                if dirty & 1:
+                    pages[page] = bytes(memory[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+                dirty >>= 1
+                page += 1
+            if tail != self.parent_tail:
+                for page in range(MEMORY_PAGES, PAGE_COUNT):
+                    start = (page - MEMORY_PAGES) * PAGE_SIZE
+                    data = tail[start:start + PAGE_SIZE]
+                    if data != self.parent_tail[start:start + PAGE_SIZE]:
+                        pages[page] = data
+            snapshot = Snapshot(parent, emulator.save_cpu_state(), pages)
+        self.parent = snapshot
+        self.parent_tail = tail
+        self.dirty = 0
+        return snapshot
+
+    def restore(self, snapshot):
+        """Load `snapshot` into the emulator. The next snapshot is taken relative to it."""
+
+        state = snapshot.state()
+        self.emulator.load_state(state)
+        self.parent = snapshot
+        self.parent_tail = state[-TAIL_SIZE:]
+        self.dirty = 0
@@ -0,0 +1,98 @@
+"""Run every ROM in a directory headless for a fixed budget and write one JSON line per ROM.
+
+Usage:
+    python sweep.py ROM_DIR [--frames N | --cycles N] [--workers N] [--output report.jsonl]
+
+ROMs are spread over a pool of worker processes that are reused from ROM to ROM. Each report line holds the
+ROM name, the number of instructions executed, how many of them the JIT skipped in idle loops, the achieved
+instructions per second, a SHA-1 hash of the final framebuffer and the fault that stopped the ROM early, if any.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from emulator import Emulator, build_decode_table
+from engines import ENGINES, framebuffer_hash
+from quirks import select_quirks
+from scheduler import DEFAULT_IPS, cycles_for_tick
+
+
+def warm_up():
+    """Worker initializer: build the decode table once per process instead of once per ROM."""
+
+    build_decode_table(Emulator)
+
+
+def run_rom(path, frames=None, cycles=None, ips=DEFAULT_IPS, engine="jit"):
+    """Run one ROM headless for `frames` 60 Hz frames or `cycles` instructions and return its report entry."""
+
+    emu = Emulator(path, False)
+    result = {
+        "rom": os.path.basename(path), "cycles": 0, "elided": 0, "ips": 0.0, "framebuffer": None, "fault": None,
+    }
+    runner = None
+    start = time.perf_counter()
+    try:
+        select_quirks(emu)
+        emu.map_opcodes_to_functions()
+        emu.load_standard_sprites()
+        emu.load_program_into_memory()
+        if ENGINES[engine] is not None:
+            runner = ENGINES[engine](emu)
+            runner.install()
+        if cycles is None:
+            emu.run_frames(frames, ips)
+        else:
+            while emu.cycles < cycles and (frames is None or emu.frames < frames):
+                emu.run_frame(min(cycles_for_tick(ips, emu.frames), cycles - emu.cycles))
+    except Exception as fault:
+        result["fault"] = f"{type(fault).__name__}: {fault}"
+    elapsed = time.perf_counter() - start
+
+    result["cycles"] = emu.cycles
+    result["elided"] = getattr(runner, "elided_cycles", 0)
+    result["ips"] = emu.cycles / elapsed if elapsed else 0.0
+    result["framebuffer"] = framebuffer_hash(emu.pixels)
+    return result
+
+
+def sweep(paths, output, workers=None, **budget):
+    """Run the ROMs on a process pool and write the results to `output` as JSON lines, in input order."""
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as pool:
+        futures = [pool.submit(run_rom, path, **budget) for path in paths]
+        for future in futures:
+            output.write(json.dumps(future.result()) + "\n")
+            output.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rom_dir")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--frames", type=int, help="number of 60 Hz frames to run (default 600)")
+    limit.add_argument("--cycles", type=int, help="number of instructions to run")
+    parser.add_argument("--ips", type=int, default=DEFAULT_IPS, help="instructions per frame are ips / 60")
+    parser.add_argument("--engine", choices=ENGINES, default="jit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", help="report file (default: standard output)")
+    args = parser.parse_args()
+
+    if args.frames is None and args.cycles is None:
+        args.frames = 600
+    paths = sorted(
+        os.path.join(args.rom_dir, name) for name in os.listdir(args.rom_dir) if name.lower().endswith(".ch8")
+    )
+    budget = {"frames": args.frames, "cycles": args.cycles, "ips": args.ips, "engine": args.engine}
+    if args.output:
+        with open(args.output, "w") as output:
+            sweep(paths, output, args.workers, **budget)
+    else:
+        sweep(paths, sys.stdout, args.workers, **budget)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import random
+import unittest
+import numpy as np
+from batched import BatchedEmulator
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator
+
+
+def batched_state(batch, machine):
+    return (batch.memory[machine].tolist(), batch.registers[machine].tolist(), batch.stack[machine].tolist(),
+            int(batch.stack_pointer[machine]), int(batch.pc[machine]), int(batch.I[machine]),
+            int(batch.delay_timer[machine]), int(batch.sound_timer[machine]), batch.pixels[machine].tolist())
+
+
+def emulator_state(emu):
+    return (list(emu.memory), list(emu.registers), list(emu.stack), emu.stack_pointer, emu.pc, emu.I,
+            emu.delay_timer, emu.sound_timer, emu.pixels.tolist())
+
+
+def random_program(rng, length):
+    """Random instructions, biased towards valid ones with small addresses so that programs run for a while."""
+
+    opcodes = []
+    for _ in range(length):
+        high = rng.choice([0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8, 0x8, 0x8, 0x9, 0xA, 0xB, 0xD, 0xE, 0xF, 0xF])
+        low = rng.randrange(0x1000)
+        if high == 0x0:
+            opcode = rng.choice([0x00E0, 0x00EE])
+        elif high in (0x1, 0x2, 0xB):
+            opcode = high << 12 | 0x200 + 2 * rng.randrange(length)
+        elif high == 0x8:
+            opcode = 0x8000 | low & 0xFF0 | rng.choice([0, 1, 2, 3, 4, 5, 6, 7, 0xE])
+        elif high == 0xA:
+            opcode = 0xA000 | rng.randrange(0x300)
+        elif high == 0xE:
+            opcode = 0xE000 | low & 0xF00 | rng.choice([0x9E, 0xA1])
+        elif high == 0xF:
+            opcode = 0xF000 | low & 0xF00 | rng.choice([0x07, 0x0A, 0x15, 0x18, 0x1E, 0x29, 0x33, 0x55, 0x65])
+        else:
+            opcode = high << 12 | low
+        opcodes.append(opcode)
+    return assemble(*opcodes)
+
+
+class TestBatchedEmulator(unittest.TestCase):
+
+    def test_matches_emulator_on_workloads(self):
+        for name, workload in WORKLOADS.items():
+            with self.subTest(workload=name):
+                reference = make_emulator(workload())
+                batch = BatchedEmulator(3)
+                batch.load_standard_sprites()
+                batch.load_program(workload())
+                for frame in range(40):
+                    reference.execute(11)
+                    batch.execute(11)
+                    reference.tick_timers()
+                    batch.tick_timers()
+                for machine in range(3):
+                    self.assertEqual(batched_state(batch, machine), emulator_state(reference))
+
+    def test_matches_emulator_on_random_programs(self):
+        rng = random.Random(8)
+        programs = [random_program(rng, 24) for _ in range(60)]
+        batch = BatchedEmulator(len(programs))
+        batch.load_standard_sprites()
+        references = []
+        for machine, program in enumerate(programs):
+            start = 512
+            batch.memory[machine, start:start + len(program)] = np.frombuffer(program, dtype=np.uint8)
+            batch.keys[machine, machine % 16] = machine % 3 == 0
+            emu = make_emulator(program)
+            emu.keypad.keys[machine % 16] = machine % 3 == 0
+            references.append(emu)
+
+        faulted = [False] * len(programs)
+        for step in range(200):
+            for machine, emu in enumerate(references):
+                if not faulted[machine]:
+                    try:
+                        emu.step()
+                    except Exception:
+                        faulted[machine] = True
+            batch.step()
+            if step % 12 == 0:
+                batch.tick_timers()
+                for emu in references:
+                    emu.tick_timers()
+
+        self.assertEqual(batch.faulted.tolist(), faulted)
+        for machine, emu in enumerate(references):
+            if not faulted[machine]:
+                with self.subTest(machine=machine):
+                    self.assertEqual(batched_state(batch, machine), emulator_state(emu))
+
+    def test_unknown_opcode_faults_only_that_machine(self):
+        batch = BatchedEmulator(2)
+        batch.load_program(assemble(0x7001, 0x1200))
+        batch.memory[1, 512:514] = [0xFF, 0xFF]
+        batch.execute(4)
+        self.assertEqual(batch.faulted.tolist(), [False, True])
+        self.assertEqual(batch.registers[0, 0], 2)
+        self.assertEqual(batch.pc[1], 512)
+
+
+if __name__ == '__main__':
+    unittest.main()
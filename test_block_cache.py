@@ -0,0 +1,54 @@
+import unittest
+from block_cache import BlockCache
+from faults import MemoryAccessFault
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator
+
+
+class TestBlockCache(unittest.TestCase):
+
+    def test_hits(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        cache = BlockCache(emu)
+        cache.install()
+        emu.execute(1000)
+        # One block for the initial straight-line code and one for the loop body.
+        self.assertEqual(cache.misses, 2)
+        self.assertGreater(cache.hit_rate, 0.95)
+
+    def test_self_modifying_write_invalidates_block(self):
+        emu = make_emulator(WORKLOADS["self_modifying"]())
+        cache = BlockCache(emu)
+        cache.install()
+        # The first block runs 0x200-0x208 and its Fx55 rewrites 0x200, which drops the block.
+        emu.execute(5)
+        self.assertNotIn(0x200, cache.blocks)
+        self.assertEqual(cache.invalidations, 1)
+        # The second pass through 0x200 must execute "V3 = 1" written by Fx55, not the compiled "V3 = 0".
+        emu.execute(2)
+        self.assertEqual(emu.registers[3], 1)
+
+    def test_rewritten_block_falls_back_to_interpreter(self):
+        emu = make_emulator(WORKLOADS["self_modifying"]())
+        cache = BlockCache(emu)
+        cache.install()
+        emu.execute(6 * 100)
+        self.assertNotIn(0x200, cache.blocks)
+        self.assertEqual(emu.registers[3], 99)
+
+    def test_fault_inside_block_counts_completed_instructions(self):
+        # The third instruction reads past the end of memory.
+        emu = make_emulator(assemble(0x6001, 0xAFFF, 0xF265))
+        BlockCache(emu).install()
+        with self.assertRaises(MemoryAccessFault):
+            emu.execute(10)
+        self.assertEqual(emu.cycles, 2)
+        self.assertEqual(emu.pc, 0x204)
+
+    def test_uninstall(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        cache = BlockCache(emu)
+        cache.install()
+        cache.uninstall()
+        self.assertEqual(emu.execute, emu.interpret)
+        self.assertEqual(emu.write_observers, [])
@@ -0,0 +1,121 @@
+import unittest
+from debugger import Condition, Debugger, parse_breakpoint, parse_watchpoint
+from jit import Jit
+from scheduler import Scheduler
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import machine_state, make_emulator
+
+# 200: V0 = 0, 202: V0 += 1, 204: V1 = 0, 206: I = 0x300, 208: BCD of V0 at I, 20A: jump to 202.
+COUNTER = assemble(0x6000, 0x7001, 0x6100, 0xA300, 0xF033, 0x1202)
+
+
+class TestDebugger(unittest.TestCase):
+
+    def setUp(self):
+        self.emu = make_emulator(COUNTER)
+        self.jit = Jit(self.emu)
+        self.jit.install()
+        self.debugger = Debugger(self.emu)
+        self.debugger.install()
+
+    def test_no_overhead_without_breakpoints(self):
+        self.assertEqual(self.emu.execute, self.jit.execute)
+        self.debugger.add_breakpoint(0x206)
+        self.assertEqual(self.emu.execute, self.debugger.execute)
+        self.debugger.remove_breakpoint(0x206)
+        self.assertEqual(self.emu.execute, self.jit.execute)
+        self.assertNotIn(self.debugger.watch, self.emu.write_observers)
+
+    def test_breakpoint_inside_a_block(self):
+        self.debugger.add_breakpoint(0x206)
+        self.assertEqual(self.emu.execute(1000), 3)
+        self.assertEqual(self.emu.pc, 0x206)
+        self.assertEqual(self.debugger.hit, ("break", 0x206, None))
+        # Continuing does not fire again on the same instruction, but does on the next pass.
+        self.assertEqual(self.emu.execute(1000), 5)
+        self.assertEqual(self.emu.pc, 0x206)
+        self.assertEqual(self.emu.cycles, 8)
+
+    def test_conditional_breakpoint(self):
+        self.debugger.add_breakpoint(0x204, Condition.parse("V0 == 0x2A"))
+        fired = []
+        self.debugger.on_break.append(fired.append)
+        while not fired:
+            self.emu.execute(100)
+        self.assertEqual(self.emu.registers[0], 0x2A)
+        self.assertEqual(self.emu.pc, 0x204)
+        self.assertEqual(self.debugger.breaks, 1)
+
+    def test_watchpoint_fires_after_the_write(self):
+        self.debugger.add_watchpoint(0x302)
+        fired = []
+        self.debugger.on_break.append(fired.append)
+        self.emu.execute(1000)
+        self.assertEqual(len(fired), 1)
+        self.assertEqual(self.debugger.hit, ("watch", 0x300, 3))
+        # Stopped right after Fx33.
+        self.assertEqual(self.emu.pc, 0x20A)
+        self.assertEqual(self.emu.memory[0x300:0x303], bytes([0, 0, 1]))
+
+    def test_hit_and_resume_does_not_change_the_run(self):
+        reference = make_emulator(WORKLOADS["sprites"]())
+        reference.run = True
+        Scheduler(reference, sleep=lambda seconds: None).run(ticks=100)
+
+        emu = make_emulator(WORKLOADS["sprites"]())
+        emu.run = True
+        scheduler = Scheduler(emu, sleep=lambda seconds: None)
+        debugger = Debugger(emu)
+        debugger.install()
+        debugger.add_breakpoint(0x20E)
+
+        def on_break(debugger):
+            debugger.remove_breakpoint(0x20E)
+            scheduler.stop()
+
+        debugger.on_break.append(on_break)
+        scheduler.run(ticks=100)
+        self.assertEqual(debugger.breaks, 1)
+        self.assertLess(scheduler.ticks, 100)
+        scheduler.run(ticks=100 - scheduler.ticks)
+        self.assertEqual(scheduler.ticks, 100)
+        self.assertEqual(machine_state(emu), machine_state(reference))
+
+    def test_stepping_after_a_hit_does_not_change_the_run(self):
+        reference = make_emulator(WORKLOADS["sprites"]())
+        reference.run = True
+        Scheduler(reference, sleep=lambda seconds: None).run(ticks=100)
+
+        emu = make_emulator(WORKLOADS["sprites"]())
+        emu.run = True
+        scheduler = Scheduler(emu, sleep=lambda seconds: None)
+        debugger = Debugger(emu)
+        debugger.install()
+        debugger.add_breakpoint(0x20E)
+        debugger.on_break.append(lambda debugger: scheduler.stop())
+        scheduler.run(ticks=100)
+        self.assertEqual(debugger.breaks, 1)
+        debugger.remove_breakpoint(0x20E)
+        ticks = scheduler.ticks
+        remaining = emu.frame_remaining
+        # Step through the rest of the cut tick and a few instructions of the next one.
+        finished = [scheduler.step() for _ in range(remaining + 5)]
+        self.assertEqual(finished.index(True), remaining - 1)
+        self.assertEqual(scheduler.ticks, ticks + 1)
+        self.assertEqual(emu.cycles, scheduler.cycles)
+        scheduler.run(ticks=100 - scheduler.ticks)
+        self.assertEqual(scheduler.ticks, 100)
+        self.assertEqual(machine_state(emu), machine_state(reference))
+
+    def test_parse(self):
+        pc, condition = parse_breakpoint("0x2a4:v3>=10")
+        self.assertEqual(pc, 0x2A4)
+        self.assertEqual(str(condition), "V3 >= 0xa")
+        self.assertEqual(parse_breakpoint("0x200"), (0x200, None))
+        self.assertEqual(parse_watchpoint("0x300-0x30F"), (0x300, 0x310))
+        with self.assertRaises(ValueError):
+            Condition.parse("PC = 3")
+
+
+if __name__ == "__main__":
+    unittest.main()
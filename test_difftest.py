@@ -0,0 +1,106 @@
+import hashlib
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+from batched import BatchedEmulator
+from difftest import compare, format_report, fuzz_cases, random_program, replay_case, run_cases
+from emulator import decode_opcode
+from faults import InputLogError
+from quirks import PROFILES
+from replay import InputLog
+from benchmarks.workloads import assemble
+
+
+class TestDifftest(unittest.TestCase):
+
+    def test_engines_match_on_fuzzed_programs(self):
+        for engines in (("interpreter", "jit"), ("blocks", "batched")):
+            for case in fuzz_cases(10, frames=20, engines=engines):
+                with self.subTest(engines=engines, case=case["name"]):
+                    self.assertIsNone(compare(**case)["diverged"])
+
+    def test_reports_the_first_diverging_instruction(self):
+        original = BatchedEmulator.instruction_7xkk
+
+        def add_twice(batch, m, opcodes):
+            original(batch, m, opcodes)
+            batch.pc[m] -= 2
+            original(batch, m, opcodes)
+
+        # 200: V0 = 0, 202: V0 += 1, 204: jump to 202.
+        rom = assemble(0x6000, 0x7001, 0x1202)
+        with mock.patch.object(BatchedEmulator, "instruction_7xkk", add_twice):
+            report = compare(rom, ("interpreter", "batched"), frames=10)
+        diverged = report["diverged"]
+        self.assertEqual((diverged["frame"], diverged["pc"], diverged["opcode"]), (0, 0x202, 0x7001))
+        self.assertEqual(diverged["cycle"], 1)
+        self.assertEqual(diverged["diff"], ["V0: 0x01 != 0x02"])
+        self.assertIn("DIVERGE at frame 0, cycle 1, instruction 7001 at 0x202", format_report(report))
+
+    def test_known_batched_differences_are_skipped(self):
+        # The batched engine draws Cxkk numbers from a different generator.
+        rom = assemble(0x6000, 0xC0FF, 0x1202)
+        report = compare(rom, ("interpreter", "batched"), frames=10, seed=1)
+        self.assertIsNone(report["diverged"])
+        self.assertIn("Cxkk", report["skipped"])
+        self.assertIsNone(compare(rom, ("interpreter", "jit"), frames=10, seed=1)["skipped"])
+
+        report = compare(assemble(0x1200), ("interpreter", "batched"), frames=10, quirks=PROFILES["cosmac"])
+        self.assertEqual(report["frames"], 0)
+        self.assertIn("skipped", format_report(report))
+
+    def test_reports_where_both_machines_fault(self):
+        # 200-226: V0 = 1 twenty times, 228: return without a call, in the second frame at 700 IPS.
+        rom = assemble(*[0x6001] * 20, 0x00EE)
+        for engines in (("interpreter", "jit"), ("jit", "batched")):
+            with self.subTest(engines=engines):
+                report = compare(rom, engines, frames=10)
+                self.assertIsNone(report["diverged"])
+                self.assertEqual((report["frames"], report["cycles"]), (1, 20))
+                self.assertIn("until both fault in frame 1, cycle 20", format_report(report))
+        report = compare(assemble(0x0123), frames=10)
+        self.assertEqual((report["frames"], report["cycles"]), (0, 0))
+        self.assertIn("Unknown opcode", format_report(report))
+
+    def test_replay_checks_the_rom(self):
+        rom = assemble(0x6001, 0x1202)
+        with tempfile.TemporaryDirectory() as directory:
+            rom_path = os.path.join(directory, "rom.ch8")
+            log_path = os.path.join(directory, "log.bin")
+            with open(rom_path, "wb") as f:
+                f.write(rom)
+            InputLog(hashlib.sha1(rom).digest(), 5).save(log_path)
+            case = replay_case(rom_path, log_path)
+            self.assertEqual((case["rom"], case["seed"]), (rom, 5))
+            with open(rom_path, "wb") as f:
+                f.write(assemble(0x6002, 0x1202))
+            with self.assertRaises(InputLogError):
+                replay_case(rom_path, log_path)
+
+    def test_random_programs_are_valid(self):
+        program = random_program(random.Random(3), 200, exclude=("instruction_Cxkk",))
+        opcodes = [program[i] << 8 | program[i + 1] for i in range(0, len(program), 2)]
+        self.assertEqual(len(opcodes), 200)
+        # The main loop jumps back to the start, the subroutines after it return.
+        self.assertEqual(opcodes[99], 0x1200)
+        self.assertEqual(opcodes[-1], 0x00EE)
+        for opcode in opcodes:
+            name, _ = decode_opcode(opcode)
+            self.assertNotEqual(name, "instruction_Cxkk")
+        self.assertEqual(random_program(random.Random(3), 8)[-2:], bytes([0x12, 0x00]))
+
+    def test_fuzzed_programs_rarely_fault(self):
+        reports = [compare(**case) for case in fuzz_cases(50)]
+        self.assertLessEqual(sum(report["fault"] is not None for report in reports), 5)
+        self.assertGreaterEqual(sorted(report["frames"] for report in reports)[25], 60)
+
+    def test_process_pool(self):
+        reports = list(run_cases(fuzz_cases(8, frames=5), workers=2))
+        self.assertEqual([report["name"] for report in reports], [f"fuzz seed {seed}" for seed in range(8)])
+        self.assertFalse(any(report["diverged"] for report in reports))
+
+
+if __name__ == "__main__":
+    unittest.main()
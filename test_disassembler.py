@@ -0,0 +1,78 @@
+import argparse
+import os
+import tempfile
+import unittest
+from disassembler import (
+    DEFAULT_CACHE_DIR, Analysis, add_cache_arguments, analyse, default_cache_dir, listing, load_analysis, mnemonic,
+)
+from jit import Jit
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator
+
+# 200: call 208, 202: skip if V0 == 3, 204: jump 200, 206: jump 206, 208: I = 20E, 20A: BCD of V0 at I,
+# 20C: return, 20E: two data bytes.
+PROGRAM = assemble(0x2208, 0x3003, 0x1200, 0x1206, 0xA20E, 0xF033, 0x00EE) + bytes([0xF0, 0x90])
+
+
+class TestDisassembler(unittest.TestCase):
+
+    def test_mnemonic(self):
+        self.assertEqual(mnemonic(0xD125), "DRW V1, V2, 5")
+        self.assertEqual(mnemonic(0x8AB4), "ADD VA, VB")
+        self.assertEqual(mnemonic(0xA2F0), "LD I, 0x2f0")
+        self.assertIsNone(mnemonic(0x5121))
+
+    def test_control_flow(self):
+        analysis = analyse(PROGRAM)
+        self.assertEqual(analysis.code, list(range(0x200, 0x20E, 2)))
+        self.assertEqual(analysis.blocks, {
+            0x200: (0x202, [0x202]),
+            0x202: (0x204, [0x204, 0x206]),
+            0x204: (0x206, [0x200]),
+            0x206: (0x208, [0x206]),
+            0x208: (0x20E, []),
+        })
+        self.assertEqual(analysis.functions, {0x200: [0x208], 0x208: []})
+        self.assertEqual(analysis.data, [(0x20E, 0x210)])
+        self.assertEqual(analysis.data_refs, [0x20E])
+        self.assertEqual(analysis.writes, [(0x20A, 0x20E, 3)])
+        # The BCD digits land in the data right after the last instruction.
+        self.assertFalse(analysis.self_modifying)
+        self.assertIn("sub_208:", listing(PROGRAM, analysis))
+
+    def test_self_modifying(self):
+        self.assertTrue(analyse(WORKLOADS["self_modifying"]()).self_modifying)
+        self.assertFalse(analyse(WORKLOADS["score"]()).self_modifying)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            analysis = load_analysis(PROGRAM, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = load_analysis(PROGRAM, cache_dir)
+            self.assertEqual(cached.to_dict(), analysis.to_dict())
+            self.assertEqual(cached.blocks, analysis.blocks)
+            self.assertEqual(cached.writes, analysis.writes)
+            self.assertIsInstance(cached, Analysis)
+
+    def test_cache_dir(self):
+        self.assertEqual(default_cache_dir({"XDG_CACHE_HOME": "/tmp/cache"}), "/tmp/cache/chip8-emulator/analysis")
+        home = os.path.join(os.path.expanduser("~"), ".cache", "chip8-emulator", "analysis")
+        self.assertEqual(default_cache_dir({}), home)
+        self.assertEqual(default_cache_dir({"XDG_CACHE_HOME": "relative"}), home)
+
+        parser = argparse.ArgumentParser()
+        add_cache_arguments(parser)
+        self.assertEqual(parser.parse_args([]).cache_dir, DEFAULT_CACHE_DIR)
+        self.assertEqual(parser.parse_args(["--cache-dir", "dir"]).cache_dir, "dir")
+        self.assertIsNone(parser.parse_args(["--no-cache"]).cache_dir)
+
+    def test_preload(self):
+        rom = WORKLOADS["sprites"]()
+        jit = Jit(make_emulator(rom))
+        jit.install()
+        jit.preload(analyse(rom).blocks)
+        # Every block the analysis found is compiled before the first instruction runs.
+        self.assertEqual(set(jit.blocks), set(analyse(rom).blocks))
+
+if __name__ == "__main__":
+    unittest.main()
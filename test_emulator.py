@@ -1,5 +1,22 @@
 import unittest
 from emulator import Emulator
+from faults import (
+    InvalidKeyFault, MemoryAccessFault, RomLoadError, SaveStateError, StackOverflowFault, StackUnderflowFault,
+    UnknownOpcodeFault,
+)
+from frontends import Sound
+
+
+class RecordingSound(Sound):
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        self.calls.append("start")
+
+    def stop(self):
+        self.calls.append("stop")
 
 
 class TestEmulator(unittest.TestCase):
@@ -15,6 +32,76 @@ class TestEmulator(unittest.TestCase):
         for i in range(8):
             self.assertEqual(self.emu.memory[512 + i], expected_results[i])
 
+    def test_decode_table(self):
+        self.assertEqual(len(self.emu.opcode_to_function_mapping), 0x10000)
+        self.assertEqual(self.emu.opcode_to_function_mapping[0xD12F], (Emulator.instruction_Dxyn, (0x1, 0x2, 0xF)))
+        self.assertEqual(self.emu.opcode_to_function_mapping[0xF365], (Emulator.instruction_Fx65, (0x3,)))
+
+    def test_sound_timer_gates_the_tone(self):
+        sound = self.emu.sound = RecordingSound()
+        self.emu.sound_timer = 3
+        for _ in range(10):
+            self.emu.tick_timers()
+        # Started once and stopped once, after three ticks of tone.
+        self.assertEqual(sound.calls, ["start", "stop"])
+        self.emu.sound_timer = 1
+        self.emu.tick_timers()
+        self.emu.sound_timer = 5
+        self.emu.tick_timers()
+        self.assertEqual(sound.calls, ["start", "stop", "start"])
+
+    def test_run_frames(self):
+        # 200: V0 += 1, 202: jump to 200.
+        self.emu.memory[0x200:0x204] = bytes([0x70, 0x01, 0x12, 0x00])
+        self.emu.delay_timer = 30
+        self.assertEqual(self.emu.run_cycles(5), 5)
+        self.assertEqual(self.emu.delay_timer, 30)
+        self.assertEqual(self.emu.run_frames(10, ips=600), 100)
+        self.assertEqual(self.emu.frames, 10)
+        self.assertEqual(self.emu.delay_timer, 20)
+        self.assertEqual(self.emu.cycles, 105)
+
+        # The predicate is checked before every frame.
+        self.assertEqual(self.emu.run_until(lambda emu: emu.delay_timer == 0, ips=600), 200)
+        self.assertEqual(self.emu.frames, 30)
+        self.assertEqual(self.emu.run_until(lambda emu: False, max_frames=3, ips=600), 30)
+        self.assertEqual(self.emu.frames, 33)
+
+    def test_run_frame_finishes_a_frame_cut_short(self):
+        self.emu.memory[0x200:0x204] = bytes([0x70, 0x01, 0x12, 0x00])
+        self.emu.delay_timer = 5
+        engine = self.emu.execute
+        # Stops after 3 instructions once, like a debugger breakpoint.
+        self.emu.execute = lambda cycles: engine(3)
+        self.assertEqual(self.emu.run_frame(10), 3)
+        self.assertEqual((self.emu.frame_remaining, self.emu.frames, self.emu.delay_timer), (7, 0, 5))
+        self.emu.execute = engine
+        # The budget passed in is ignored until the cut frame is finished.
+        self.assertEqual(self.emu.run_frame(20), 7)
+        self.assertEqual((self.emu.frame_remaining, self.emu.frames, self.emu.delay_timer), (0, 1, 4))
+        self.assertEqual(self.emu.cycles, 10)
+
+    def test_run_frame_while_waiting_for_a_key(self):
+        self.emu.memory[0x200:0x202] = bytes([0xF3, 0x0A])
+        self.emu.run_frame(10)
+        self.assertTrue(self.emu.key_wait)
+        # Suspended: counted, but not executed.
+        self.assertEqual(self.emu.run_frame(10), 10)
+        self.assertEqual(self.emu.cycles, 20)
+        self.emu.keypad.press(0x7)
+        self.emu.run_frame(1)
+        self.assertEqual(self.emu.registers[3], 0x7)
+        self.assertEqual(self.emu.pc, 0x202)
+
+    def test_unknown_opcode(self):
+        # 0x5121 and 0xE1FF do not decode to any instruction.
+        for opcode in (0x5121, 0xE1FF, 0x0123):
+            self.emu.current_opcode = opcode
+            with self.assertRaises(UnknownOpcodeFault) as context:
+                self.emu.run_current_instruction()
+            self.assertEqual(context.exception.opcode, opcode)
+            self.assertEqual(context.exception.pc, 0x200)
+
     def test_00EE(self):
         self.emu.stack[0] = 0x0123
         self.emu.stack_pointer = 1
@@ -28,6 +115,36 @@ class TestEmulator(unittest.TestCase):
         self.emu.run_current_instruction()
         self.assertEqual(self.emu.stack_pointer, 14)
 
+    def test_stack_faults(self):
+        self.emu.memory[0x200:0x204] = bytes([0x00, 0xEE, 0x22, 0x02])
+        with self.assertRaises(StackUnderflowFault) as raised:
+            self.emu.execute(1)
+        self.assertEqual((raised.exception.pc, raised.exception.opcode), (0x200, 0x00EE))
+        self.assertEqual(self.emu.stack_pointer, 0)
+
+        # 202 calls itself until the 16 levels of stack are used up.
+        self.emu.pc = 0x202
+        with self.assertRaises(StackOverflowFault):
+            self.emu.execute(100)
+        self.assertEqual(self.emu.stack_pointer, 16)
+        self.assertEqual(self.emu.cycles, 16)
+        self.assertEqual(self.emu.pc, 0x202)
+
+    def test_invalid_key(self):
+        self.emu.registers[2] = 0x10
+        self.emu.memory[0x200:0x202] = bytes([0xE2, 0x9E])
+        with self.assertRaises(InvalidKeyFault):
+            self.emu.execute(1)
+        self.assertEqual(self.emu.pc, 0x200)
+
+    def test_pc_past_end_of_memory(self):
+        # BFFF jumps to 0xFFF, where the opcode would run past the last byte.
+        self.emu.memory[0x200:0x202] = bytes([0xBF, 0xFF])
+        with self.assertRaises(MemoryAccessFault) as raised:
+            self.emu.execute(2)
+        self.assertEqual(raised.exception.pc, 0xFFF)
+        self.assertEqual(self.emu.cycles, 1)
+
     def test_1NNN(self):
         self.emu.current_opcode = 0x1012
         self.emu.run_current_instruction()
@@ -255,6 +372,121 @@ class TestEmulator(unittest.TestCase):
         self.emu.run_current_instruction()
         self.assertEqual(self.emu.pc, 0x21C)
 
+    def test_CXKK_is_seeded(self):
+        values = []
+        for _ in range(2):
+            emu = Emulator("test.ch8", False, seed=7)
+            emu.map_opcodes_to_functions()
+            emu.current_opcode = 0xC3FF
+            draws = []
+            for _ in range(8):
+                emu.run_current_instruction()
+                draws.append(emu.registers[3])
+            values.append(draws)
+        self.assertEqual(values[0], values[1])
+        self.assertGreater(len(set(values[0])), 1)
+
+    def test_DXYN(self):
+        # Draw the "0" sprite (F0 90 90 90 F0) at (V[1], V[2]) = (2, 3).
+        self.emu.load_standard_sprites()
+        self.emu.registers[1] = 2
+        self.emu.registers[2] = 3
+        self.emu.I = self.emu.sprites_base_addr
+        self.emu.current_opcode = 0xD125
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[15], 0x0)
+        self.assertEqual(self.emu.pc, 0x202)
+        self.assertEqual(int(self.emu.pixels.sum()), 14)
+        self.assertTrue(self.emu.pixels[2][3] and self.emu.pixels[5][3] and self.emu.pixels[2][4])
+        self.assertFalse(self.emu.pixels[3][4] or self.emu.pixels[6][3])
+        self.assertTrue(self.emu.display_dirty)
+
+        # Drawing the same sprite again erases it and sets V[F] because pixels were unset.
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[15], 0x1)
+        self.assertFalse(self.emu.pixels.any())
+
+    def test_DXYN_sets_VF_only_on_collision(self):
+        # V[F] = 1 only when a lit pixel is turned off, not whenever the sprite lights a pixel.
+        self.emu.load_standard_sprites()
+        self.emu.registers[1] = 2
+        self.emu.registers[2] = 3
+        self.emu.registers[15] = 1
+        self.emu.I = self.emu.sprites_base_addr
+        self.emu.current_opcode = 0xD125
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[15], 0x0)
+
+        # The "0" sprite again at (10, 3), next to the first one: pixels are lit, none is turned off.
+        self.emu.registers[1] = 10
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[15], 0x0)
+        self.assertEqual(int(self.emu.pixels.sum()), 28)
+
+        # The "1" sprite (20 60 20 20 70) over the first "0" turns off (4, 3) and (3-5, 7) and lights (3-4, 4).
+        self.emu.registers[1] = 2
+        self.emu.I = self.emu.sprites_base_addr + 5
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[15], 0x1)
+        self.assertFalse(self.emu.pixels[4][3] or self.emu.pixels[3][7])
+        self.assertTrue(self.emu.pixels[3][4] and self.emu.pixels[2][7])
+
+    def test_DXYN_wraps_around(self):
+        # The "0" sprite drawn at (62, 30) wraps to the left and top edges.
+        self.emu.load_standard_sprites()
+        self.emu.registers[1] = 62
+        self.emu.registers[2] = 30
+        self.emu.I = self.emu.sprites_base_addr
+        self.emu.current_opcode = 0xD125
+        self.emu.run_current_instruction()
+        self.assertTrue(self.emu.pixels[62][30] and self.emu.pixels[1][30] and self.emu.pixels[1][2])
+        self.assertTrue(self.emu.pixels[62][2])
+        self.assertEqual(int(self.emu.pixels.sum()), 14)
+
+    def test_00E0(self):
+        self.emu.pixels[3][4] = True
+        self.emu.current_opcode = 0x00E0
+        self.emu.run_current_instruction()
+        self.assertFalse(self.emu.pixels.any())
+        self.assertEqual(self.emu.pc, 0x202)
+        self.assertTrue(self.emu.display_dirty)
+
+    def test_EX9E(self):
+        # V[1] = 0x5. Key 5 is not pressed, next instruction should not be skipped.
+        self.emu.registers[1] = 0x5
+        self.emu.current_opcode = 0xE19E
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.pc, 0x202)
+
+        # Key 5 is pressed, next instruction should be skipped.
+        self.emu.keypad.press(0x5)
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.pc, 0x206)
+
+    def test_EXA1(self):
+        # V[1] = 0x5. Key 5 is not pressed, next instruction should be skipped.
+        self.emu.registers[1] = 0x5
+        self.emu.current_opcode = 0xE1A1
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.pc, 0x204)
+
+        # Key 5 is pressed, next instruction should not be skipped.
+        self.emu.keypad.press(0x5)
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.pc, 0x206)
+
+    def test_FX0A(self):
+        # No key is pressed, PC should stay on the instruction.
+        self.emu.current_opcode = 0xF30A
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.pc, 0x200)
+
+        # Key B is pressed. V[3] should be set to 0xB.
+        self.emu.keypad.press(0xB)
+        self.emu.run_current_instruction()
+        self.assertEqual(self.emu.registers[3], 0xB)
+        self.assertEqual(self.emu.pc, 0x202)
+
     def test_FX1E(self):
         # I = 0x57, V[1] = 0x2. I should be set to 0x59.
         self.emu.I = 0x57
@@ -296,13 +528,13 @@ class TestEmulator(unittest.TestCase):
         self.assertEqual(self.emu.memory[self.emu.I + 2], 0x7)
         self.assertEqual(self.emu.pc, 0x202)
 
-        # V[1] = 0x1A5 (421). I should equal 4, I + 1 should equal 2 and I + 2 should equal 1.
-        self.emu.registers[1] = 0x1A5
+        # V[1] = 0xFF (255). I should equal 2, I + 1 should equal 5 and I + 2 should equal 5.
+        self.emu.registers[1] = 0xFF
         self.emu.current_opcode = 0xF133
         self.emu.run_current_instruction()
-        self.assertEqual(self.emu.memory[self.emu.I], 0x4)
-        self.assertEqual(self.emu.memory[self.emu.I + 1], 0x2)
-        self.assertEqual(self.emu.memory[self.emu.I + 2], 0x1)
+        self.assertEqual(self.emu.memory[self.emu.I], 0x2)
+        self.assertEqual(self.emu.memory[self.emu.I + 1], 0x5)
+        self.assertEqual(self.emu.memory[self.emu.I + 2], 0x5)
         self.assertEqual(self.emu.pc, 0x204)
 
     def test_FX55(self):
@@ -327,4 +559,69 @@ class TestEmulator(unittest.TestCase):
         self.emu.run_current_instruction()
         for i in range(5):
             self.assertEqual(self.emu.registers[i], memory_values[i])
-        self.assertEqual(self.emu.pc, 0x202)
\ No newline at end of file
+        self.assertEqual(self.emu.pc, 0x202)
+
+    def test_FX55_past_end_of_memory(self):
+        self.emu.I = 0xFFE
+        self.emu.current_opcode = 0xF255
+        with self.assertRaises(MemoryAccessFault) as raised:
+            self.emu.run_current_instruction()
+        self.assertEqual(raised.exception.pc, 0x200)
+        self.assertEqual(len(self.emu.memory), 4096)
+
+    def test_oversized_rom(self):
+        with self.assertRaises(RomLoadError):
+            self.emu.load_program(bytes(Emulator.PROGRAM_SIZE + 1))
+
+        self.emu.load_program(b"\xAB" * Emulator.PROGRAM_SIZE)
+        self.assertEqual(self.emu.memory[0xFFF], 0xAB)
+        self.assertEqual(len(self.emu.memory), 4096)
+
+    def test_save_and_load_state(self):
+        self.emu.load_standard_sprites()
+        self.emu.registers[3] = 0x42
+        self.emu.stack[1] = 0x345
+        self.emu.stack_pointer = 2
+        self.emu.pc = 0x246
+        self.emu.I = 0x12
+        self.emu.delay_timer = 9
+        self.emu.pixels[63][31] = True
+        state = self.emu.save_state()
+
+        emu = Emulator("test.ch8", False)
+        writes = []
+        emu.write_observers.append(lambda address, length: writes.append((address, length)))
+        emu.load_state(state)
+        self.assertEqual(emu.save_state(), state)
+        self.assertEqual((emu.registers[3], emu.stack[1], emu.stack_pointer, emu.pc), (0x42, 0x345, 2, 0x246))
+        self.assertTrue(emu.pixels[63][31])
+        # Only the sprite area differs from the blank memory.
+        self.assertEqual(writes, [(0, 80)])
+
+        with self.assertRaises(SaveStateError):
+            emu.load_state(state[:-1])
+        with self.assertRaises(SaveStateError):
+            emu.load_state(b"XXXX" + state[4:])
+        with self.assertRaises(SaveStateError):
+            emu.load_state(state[:-4] + b"\xFF\xFF\x00\x00")
+
+    def test_execution_after_load_state_draws_the_same_numbers(self):
+        # 200: V0 = random & 0xFF, 202: V1 = random & 0x0F, 204: jump to 200.
+        program = bytes.fromhex("C0FF C10F 1200")
+        self.emu.load_program(program)
+        self.emu.execute(31)
+        state = self.emu.save_state()
+        self.emu.execute(1000)
+
+        emu = Emulator("test.ch8", False, seed=2)
+        emu.map_opcodes_to_functions()
+        emu.load_state(state)
+        emu.execute(1000)
+        self.assertEqual(emu.save_state(), self.emu.save_state())
+        self.assertEqual(bytes(emu.registers[:2]), bytes(self.emu.registers[:2]))
+
+    def test_core_does_not_import_pygame(self):
+        import subprocess
+        import sys
+        code = "import sys, emulator; sys.exit('pygame' in sys.modules)"
+        self.assertEqual(subprocess.run([sys.executable, "-c", code]).returncode, 0)
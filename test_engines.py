@@ -0,0 +1,61 @@
+import unittest
+from block_cache import BlockCache
+from debugger import Debugger
+from disassembler import analyse
+from jit import Jit
+from profiler import Profiler
+from quirks import PROFILES
+from tracer import Tracer
+from benchmarks.workloads import WORKLOADS
+from test_support import machine_state, make_emulator
+
+
+def preloaded_jit(emu, rom):
+    jit = Jit(emu)
+    jit.install()
+    jit.preload(analyse(rom).blocks)
+
+
+def idle_debugger(emu, rom):
+    Jit(emu).install()
+    debugger = Debugger(emu)
+    debugger.install()
+    # Never reached, but makes the debugger's own engine run.
+    debugger.add_breakpoint(0xFFE)
+
+
+# Name -> function that installs the engine on an emulator loaded with rom.
+ENGINES = {
+    "blocks": lambda emu, rom: BlockCache(emu).install(),
+    "jit": lambda emu, rom: Jit(emu).install(),
+    "preloaded_jit": preloaded_jit,
+    "debugger": idle_debugger,
+    "profiler": lambda emu, rom: Profiler(emu).install(),
+    "tracer": lambda emu, rom: Tracer(emu).install(),
+}
+
+
+class TestEngines(unittest.TestCase):
+
+    def test_engines_match_interpreter(self):
+        """Every engine, under every quirk profile, ends every workload in the interpreter's state."""
+
+        for engine, install in ENGINES.items():
+            for profile, quirks in PROFILES.items():
+                for name, workload in WORKLOADS.items():
+                    with self.subTest(engine=engine, profile=profile, workload=name):
+                        reference = make_emulator(workload(), quirks)
+                        emu = make_emulator(workload(), quirks)
+                        install(emu, workload())
+                        # Odd batch sizes make blocks and loops straddle the end of a batch, and the timers
+                        # running down between batches let the idle loops exit.
+                        for _ in range(50):
+                            self.assertEqual(reference.execute(37), 37)
+                            self.assertEqual(emu.execute(37), 37)
+                            reference.tick_timers()
+                            emu.tick_timers()
+                        self.assertEqual(machine_state(emu), machine_state(reference))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from emulator import Emulator
+from jit import Jit, HOT_LOOP_THRESHOLD
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator, machine_state
+
+# Counts V0 up to 200 with chained skips inside the loop, then draws and starts again.
+COUNTING_LOOP = assemble(
+    0x6000,  # 200: V0 = 0
+    0x7001,  # 202: V0 += 1
+    0x4000,  # 204: skip next if V0 != 0
+    0x6105,  # 206: V1 = 5 (never runs)
+    0x3080,  # 208: skip next if V0 == 0x80
+    0x5120,  # 20A: skip next if V1 == V2
+    0x8214,  # 20C: V2 += V1, VF = carry
+    0x30C8,  # 20E: skip next if V0 == 200
+    0x1202,  # 210: jump 0x202
+    0xF029,  # 212: I = sprite for digit V0
+    0xD125,  # 214: draw
+    0x1200,  # 216: jump 0x200
+)
+
+# Sets the delay timer and waits for it with Fx07/3xkk/1nnn, counts the waits in V5, then parks in a jump to self.
+TIMER_WAIT = assemble(
+    0x6A14,  # 200: VA = 20
+    0xFA15,  # 202: delay timer = VA
+    0xF007,  # 204: V0 = delay timer
+    0x3000,  # 206: skip next if V0 == 0
+    0x1204,  # 208: jump 0x204
+    0x7501,  # 20A: V5 += 1
+    0x3503,  # 20C: skip next if V5 == 3
+    0x1202,  # 20E: jump 0x202
+    0x1210,  # 210: jump 0x210
+)
+
+
+class TestJit(unittest.TestCase):
+
+    def run_against_interpreter(self, rom, batches=200, batch=37):
+        reference = make_emulator(rom)
+        emu = make_emulator(rom)
+        jit = Jit(emu)
+        jit.install()
+        for _ in range(batches):
+            reference.execute(batch)
+            emu.execute(batch)
+            if reference.delay_timer > 0:
+                reference.delay_timer -= 1
+                emu.delay_timer -= 1
+        self.assertEqual(machine_state(emu), machine_state(reference))
+        return jit
+
+    def test_compiles_loop_with_skips_and_exit(self):
+        jit = self.run_against_interpreter(COUNTING_LOOP)
+        self.assertIn(0x202, jit.loops)
+        self.assertGreater(jit.loop_entries, 0)
+
+    def test_idle_loops_are_elided(self):
+        jit = self.run_against_interpreter(TIMER_WAIT, batches=400, batch=500)
+        self.assertIn(0x204, jit.loops)
+        self.assertIn(0x210, jit.loops)
+        self.assertEqual(jit.emulator.registers[5], 3)
+        # Nearly all of the 200,000 instructions are spent waiting.
+        self.assertGreater(jit.elided_cycles, 190_000)
+        # Budgets that end in the middle of an iteration.
+        self.assertGreater(self.run_against_interpreter(TIMER_WAIT, batches=300, batch=37).elided_cycles, 0)
+
+    def test_elision_can_be_turned_off(self):
+        emu = make_emulator(TIMER_WAIT)
+        jit = Jit(emu)
+        jit.elide_idle_loops = False
+        jit.install()
+        for _ in range(400):
+            emu.execute(500)
+            if emu.delay_timer > 0:
+                emu.delay_timer -= 1
+        self.assertIn(0x204, jit.loops)
+        self.assertEqual(jit.elided_cycles, 0)
+        self.assertEqual(emu.registers[5], 3)
+
+    def test_busy_loop_is_not_elided(self):
+        jit = self.run_against_interpreter(COUNTING_LOOP)
+        self.assertEqual(jit.elided_cycles, 0)
+
+    def test_loop_is_not_compiled_before_it_is_hot(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        jit = Jit(emu)
+        jit.install()
+        emu.execute(7 * (HOT_LOOP_THRESHOLD - 1))
+        self.assertEqual(jit.loops, {})
+        emu.execute(7 * 4)
+        self.assertIn(0x204, jit.loops)
+
+    def test_loop_with_unconditional_draw_is_not_compiled(self):
+        emu = make_emulator(WORKLOADS["sprites"]())
+        jit = Jit(emu)
+        self.assertIsNone(jit.compile_loop(0x208))
+        self.assertIsNotNone(jit.compile_loop(0x218))
+
+    def test_write_invalidates_loop(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        jit = Jit(emu)
+        jit.install()
+        jit.compile_loop(0x204)
+        emu.notify_memory_write(0x210, 1)
+        self.assertNotIn(0x204, jit.loops)
+
+    def test_switch_at_runtime(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        jit = Jit(emu)
+        jit.install()
+        jit.enabled = False
+        self.assertEqual(emu.execute, jit.execute_blocks)
+        emu.execute(7 * HOT_LOOP_THRESHOLD * 2)
+        self.assertEqual(jit.loop_entries, 0)
+        jit.enabled = True
+        self.assertEqual(emu.execute, jit.execute)
+        jit.uninstall()
+        self.assertEqual(emu.execute, emu.interpret)
+
+    def test_inlined_instructions_are_reference_handlers(self):
+        # Templates are keyed by the reference handlers, so a subclass override is never inlined.
+        class Variant(Emulator):
+            def instruction_8xy6(self, vx, vy):
+                Emulator.instruction_8xy6(self, vy, vy)
+
+        emu = Variant("test.ch8", False)
+        emu.map_opcodes_to_functions()
+        emu.memory[512:516] = assemble(0x8126, 0x1200)
+        self.assertIsNone(Jit(emu).compile_loop(0x200))
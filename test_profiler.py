@@ -0,0 +1,61 @@
+import json
+import unittest
+from faults import MemoryAccessFault
+from frontends import FramePresenter
+from profiler import Profiler
+from scheduler import Scheduler
+from jit import Jit
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_counts_match_execution(self):
+        emu = make_emulator(WORKLOADS["sprites"]())
+        profiler = Profiler(emu)
+        profiler.install()
+        self.assertEqual(emu.execute(500), 500)
+
+        report = json.loads(json.dumps(profiler.report()))
+        self.assertEqual(report["instructions"], 500)
+        self.assertEqual(sum(entry["count"] for entry in report["opcodes"].values()), 500)
+        self.assertEqual(sum(report["pc_counts"]), 500)
+        self.assertIn("Dxyn", report["opcodes"])
+        self.assertIn("Dxyn", profiler.dump())
+
+    def test_times_present_and_timer_waits(self):
+        emu = make_emulator(WORKLOADS["sprites"]())
+        emu.run = True
+        scheduler = Scheduler(emu, sleep=lambda seconds: None)
+        scheduler.on_tick.append(FramePresenter(emu).on_tick)
+        profiler = Profiler(emu)
+        profiler.install(scheduler)
+        scheduler.run(ticks=30)
+        self.assertGreater(profiler.present_count, 0)
+        self.assertGreater(profiler.wait_count, 0)
+
+    def test_uninstall_restores_engine(self):
+        emu = make_emulator(WORKLOADS["alu"]())
+        jit = Jit(emu)
+        jit.install()
+        display = emu.display
+        profiler = Profiler(emu)
+        profiler.install()
+        profiler.uninstall()
+        self.assertEqual(emu.execute, jit.execute)
+        self.assertIs(emu.display, display)
+
+    def test_pc_past_end_of_memory(self):
+        # 200: jump to 0xFFF, where the opcode would run past the last byte.
+        emu = make_emulator(assemble(0x1FFF))
+        profiler = Profiler(emu)
+        profiler.install()
+        with self.assertRaises(MemoryAccessFault) as raised:
+            emu.execute(2)
+        self.assertEqual(raised.exception.pc, 0xFFF)
+        self.assertEqual(emu.cycles, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import unittest
+
+from emulator import Emulator
+from benchmarks.workloads import assemble
+
+try:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from pygame_frontend import DebugPanel, synthesise_tone
+except ImportError:
+    pygame = None
+
+
+@unittest.skipIf(pygame is None, "pygame is not installed")
+class TestDebugPanel(unittest.TestCase):
+
+    def setUp(self):
+        pygame.font.init()
+        self.surface = pygame.Surface((160, 320))
+        self.panel = DebugPanel(pygame.font.Font(None, 12), self.surface)
+        self.emu = Emulator("test.ch8", True)
+        self.emu.map_opcodes_to_functions()
+        # V3 = 0x2A, then jump to self.
+        self.emu.memory[512:516] = assemble(0x632A, 0x1202)
+
+    def test_first_refresh_draws_every_field(self):
+        self.assertEqual(len(self.panel.refresh(self.emu)), len(self.panel.fields))
+
+    def test_only_changed_fields_are_redrawn(self):
+        self.panel.refresh(self.emu)
+        self.assertEqual(self.panel.refresh(self.emu), [])
+        self.emu.step()
+        # V3, PC and the opcode at PC changed.
+        rects = self.panel.refresh(self.emu)
+        self.assertEqual(len(rects), 3)
+        positions = [field[0] for field in self.panel.fields]
+        self.assertEqual({rect.topleft for rect in rects}, {positions[3], positions[34], positions[35]})
+        for rect in rects:
+            self.assertTrue(self.surface.get_rect().contains(rect))
+
+    def test_redrawn_field_matches_a_fresh_panel(self):
+        self.panel.refresh(self.emu)
+        self.emu.step()
+        self.panel.refresh(self.emu)
+        fresh_surface = pygame.Surface((160, 320))
+        DebugPanel(pygame.font.Font(None, 12), fresh_surface).refresh(self.emu)
+        self.assertEqual(pygame.image.tobytes(self.surface, "RGB"), pygame.image.tobytes(fresh_surface, "RGB"))
+
+    def test_narrower_value_clears_the_wider_one(self):
+        self.emu.I = 0x10000
+        self.panel.refresh(self.emu)
+        self.emu.I = 0xFFF
+        rects = self.panel.refresh(self.emu)
+        # I now shows 0x0FFF, which is one digit narrower than 0x10000.
+        self.assertEqual(rects[0].width, self.panel.atlas.width * 7)
+        fresh_surface = pygame.Surface((160, 320))
+        DebugPanel(pygame.font.Font(None, 12), fresh_surface).refresh(self.emu)
+        self.assertEqual(pygame.image.tobytes(self.surface, "RGB"), pygame.image.tobytes(fresh_surface, "RGB"))
+
+
+@unittest.skipIf(pygame is None, "pygame is not installed")
+class TestTone(unittest.TestCase):
+
+    def test_tone_loops_on_whole_periods(self):
+        samples = synthesise_tone(440, 44100, 2)
+        self.assertEqual(samples.shape, (10023, 2))
+        self.assertEqual(samples.dtype.name, "int16")
+        # 100 high and 100 low half periods, and the wave starts high right after it ends low.
+        edges = (samples[1:, 0] != samples[:-1, 0]).sum()
+        self.assertEqual(edges, 199)
+        self.assertGreater(samples[0, 0], 0)
+        self.assertLess(samples[-1, 0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from emulator import Emulator
+from quirks import (
+    CLIP_SPRITES, INCREMENT_I, JUMP_VX, PROFILES, SHIFT_VY, load_database, parse_quirks, quirk_class,
+    quirks_for_rom, select_quirks,
+)
+from benchmarks.workloads import assemble
+from test_support import make_emulator
+
+
+class TestQuirks(unittest.TestCase):
+
+    def test_tables_are_specialised_and_cached(self):
+        default = make_emulator(b"").opcode_to_function_mapping
+        cosmac = make_emulator(b"", PROFILES["cosmac"]).opcode_to_function_mapping
+        self.assertIsNot(default, cosmac)
+        self.assertIs(make_emulator(b"", PROFILES["cosmac"]).opcode_to_function_mapping, cosmac)
+        self.assertIs(default[0x8126][0], Emulator.instruction_8xy6)
+        self.assertIsNot(cosmac[0x8126][0], Emulator.instruction_8xy6)
+        self.assertEqual(cosmac[0x8126][0].__name__, "instruction_8xy6")
+        # Instructions without a variant share the default handlers.
+        self.assertIs(cosmac[0x7101][0], Emulator.instruction_7xkk)
+        self.assertIs(quirk_class(Emulator, [SHIFT_VY]), quirk_class(Emulator, {SHIFT_VY}))
+
+    def test_shift_vy(self):
+        for quirks, expected in ((None, (0x40, 0)), ({SHIFT_VY}, (0x03, 1))):
+            emu = make_emulator(assemble(0x6080, 0x6107, 0x8016), quirks)
+            emu.execute(3)
+            self.assertEqual((emu.registers[0], emu.registers[0xF]), expected)
+
+    def test_increment_i(self):
+        for quirks, expected in ((None, 0x300), ({INCREMENT_I}, 0x303)):
+            emu = make_emulator(assemble(0xA300, 0xF255), quirks)
+            emu.execute(2)
+            self.assertEqual(emu.I, expected)
+
+    def test_jump_vx(self):
+        for quirks, expected in ((None, 0x310), ({JUMP_VX}, 0x320)):
+            emu = make_emulator(assemble(0x6010, 0x6320, 0xB300), quirks)
+            emu.execute(3)
+            self.assertEqual(emu.pc, expected)
+
+    def test_clip_sprites(self):
+        # Draw the "0" sprite at (62, 30): wrapped, it also lights pixels on the left and at the top.
+        for quirks, wrapped in ((None, True), ({CLIP_SPRITES}, False)):
+            emu = make_emulator(assemble(0x623E, 0x631E, 0xF029, 0xD235), quirks)
+            emu.execute(4)
+            self.assertTrue(emu.pixels[62, 30])
+            self.assertEqual(bool(emu.pixels[:8].any() or emu.pixels[:, :4].any()), wrapped)
+
+    def test_database(self):
+        rom = assemble(0x1200)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "quirks.json")
+            with open(path, "w") as f:
+                json.dump({
+                    hashlib.sha1(b"other").hexdigest(): "schip",
+                    hashlib.sha1(rom).hexdigest(): {"name": "Test", "quirks": ["shift_vy"]},
+                }, f)
+            database = load_database(path)
+            self.assertEqual(quirks_for_rom(rom, database), {SHIFT_VY})
+            self.assertEqual(quirks_for_rom(b"other", database), PROFILES["schip"])
+            self.assertEqual(quirks_for_rom(b"unknown", database), PROFILES["default"])
+            self.assertEqual(load_database(os.path.join(directory, "missing.json")), {})
+
+            rom_path = os.path.join(directory, "test.ch8")
+            with open(rom_path, "wb") as f:
+                f.write(rom)
+            emu = Emulator(rom_path, False)
+            select_quirks(emu, database)
+            self.assertEqual(emu.quirks, {SHIFT_VY})
+            explicit = Emulator(rom_path, False, quirks=PROFILES["cosmac"])
+            select_quirks(explicit, database)
+            self.assertEqual(explicit.quirks, PROFILES["cosmac"])
+
+    def test_parse_quirks(self):
+        self.assertEqual(parse_quirks("schip"), PROFILES["schip"])
+        self.assertEqual(parse_quirks("shift_vy, jump_vx"), {SHIFT_VY, JUMP_VX})
+        with self.assertRaises(ValueError):
+            parse_quirks("wobbly")
+
+
+if __name__ == "__main__":
+    unittest.main()
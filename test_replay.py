@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import tempfile
+import unittest
+from faults import InputLogError
+from frontends import Keypad, KeypadInput
+from quirks import PROFILES
+from replay import InputLog, RecordingInput, finish_recording, make_emulator, parse_seed, replay, rom_hash
+from scheduler import Scheduler
+from benchmarks.workloads import assemble
+
+# Draws a digit at a random position on every pass through the loop while key 5 is held down.
+RANDOM_DRAW = assemble(
+    0xC03F,  # 200: V0 = random & 0x3F
+    0xC11F,  # 202: V1 = random & 0x1F
+    0x6205,  # 204: V2 = 5
+    0xE29E,  # 206: skip next if key V2 is pressed
+    0x1200,  # 208: jump 0x200
+    0xF229,  # 20A: I = sprite for digit V2
+    0xD015,  # 20C: draw at (V0, V1)
+    0x1200,  # 20E: jump 0x200
+)
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rom = os.path.join(self.directory.name, "random_draw.ch8")
+        with open(self.rom, "wb") as f:
+            f.write(RANDOM_DRAW)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, seed, ticks, quirks=None):
+        """Record a session in which a player presses and releases key 5 at random ticks."""
+
+        log = InputLog(rom_hash(self.rom), seed)
+        emu = make_emulator(self.rom, seed, engine="interpreter", quirks=quirks)
+        scheduler = Scheduler(emu)
+        player = Keypad()
+        scheduler.input_source = RecordingInput(KeypadInput(player), log)
+        rng = random.Random(1)
+        for _ in range(ticks):
+            if rng.random() < 0.1:
+                player.set_mask(player.mask() ^ 1 << 5)
+            scheduler.run_tick()
+        finish_recording(scheduler, log)
+        return log, emu
+
+    def test_replay_reproduces_the_session(self):
+        log, recorded = self.record(seed=1234, ticks=600)
+        self.assertGreater(len(log.events), 10)
+        self.assertTrue(recorded.pixels.any())
+
+        path = os.path.join(self.directory.name, "session.c8in")
+        log.save(path)
+        loaded = InputLog.load(path)
+        self.assertEqual(loaded.events, log.events)
+        for engine in ("interpreter", "jit"):
+            with self.subTest(engine=engine):
+                emu, matched = replay(self.rom, loaded, engine)
+                self.assertTrue(matched)
+                self.assertEqual(emu.cycles, recorded.cycles)
+                self.assertEqual(emu.pixels.tolist(), recorded.pixels.tolist())
+
+    def test_replays_with_the_recorded_quirks(self):
+        log, recorded = self.record(seed=1234, ticks=300, quirks=PROFILES["cosmac"])
+        path = os.path.join(self.directory.name, "session.c8in")
+        log.save(path)
+        loaded = InputLog.load(path)
+        self.assertEqual(loaded.quirks, PROFILES["cosmac"])
+        # The quirk database has nothing for this ROM, so it would replay with the default quirks.
+        emu, matched = replay(self.rom, loaded)
+        self.assertTrue(matched)
+        self.assertEqual(emu.quirks, PROFILES["cosmac"])
+        loaded.quirks = PROFILES["default"]
+        self.assertFalse(replay(self.rom, loaded)[1])
+
+        # The high byte of the quirk flags, which has no quirks.
+        data = bytearray(log.to_bytes())
+        data[39] = 0xFF
+        with self.assertRaises(InputLogError):
+            InputLog.from_bytes(bytes(data))
+
+    def test_parse_seed(self):
+        self.assertEqual(parse_seed("0x10"), 16)
+        self.assertEqual(parse_seed(str(2 ** 64 - 1)), 2 ** 64 - 1)
+        for text in ("-1", str(2 ** 64)):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_seed(text)
+
+    def test_other_seed_diverges(self):
+        log, _ = self.record(seed=1234, ticks=120)
+        log.seed = 4321
+        _, matched = replay(self.rom, log)
+        self.assertFalse(matched)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from rewind import RewindBuffer
+from benchmarks.workloads import WORKLOADS
+from test_support import make_emulator, machine_state
+
+
+class TestRewindBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.emu = make_emulator(WORKLOADS["sprites"]())
+
+    def run_frames(self, rewind, frames):
+        states = []
+        for _ in range(frames):
+            self.emu.execute(12)
+            self.emu.tick_timers()
+            rewind.record()
+            states.append(machine_state(self.emu))
+        return states
+
+    def test_rewind_restores_earlier_frames(self):
+        rewind = RewindBuffer(self.emu, keyframe_interval=8)
+        states = self.run_frames(rewind, 30)
+        self.assertEqual(rewind.rewind(), 1)
+        self.assertEqual(machine_state(self.emu), states[-2])
+        self.assertEqual(rewind.rewind(10), 10)
+        self.assertEqual(machine_state(self.emu), states[-12])
+
+        # Recording continues from the restored frame.
+        self.run_frames(rewind, 5)
+        self.assertEqual(len(rewind), 24)
+        self.assertEqual(rewind.rewind(1000), 23)
+        self.assertEqual(machine_state(self.emu), states[0])
+
+    def test_capacity_is_bounded(self):
+        rewind = RewindBuffer(self.emu, capacity=20, keyframe_interval=8)
+        states = self.run_frames(rewind, 50)
+        self.assertEqual(len(rewind), 20)
+        rewind.rewind(19)
+        self.assertEqual(machine_state(self.emu), states[30])
+        # Deltas are much smaller than full states.
+        self.assertLess(rewind.memory_used, 4 * len(self.emu.save_state()))
+
+
+if __name__ == '__main__':
+    unittest.main()
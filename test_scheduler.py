@@ -0,0 +1,156 @@
+import unittest
+from emulator import Emulator
+from frontends import Display, FramePresenter
+from scheduler import Scheduler, cycles_for_tick
+from benchmarks.workloads import assemble
+
+
+class FakeClock:
+    """Clock whose sleeps overshoot by a fixed amount, like a loaded host."""
+
+    def __init__(self, overshoot=0.0):
+        self.now = 100.0
+        self.overshoot = overshoot
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds + self.overshoot
+
+
+class CountingDisplay(Display):
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, pixels):
+        self.updates += 1
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.emu = Emulator("test.ch8", False)
+        self.emu.map_opcodes_to_functions()
+        # Jump to self.
+        self.emu.memory[512:514] = assemble(0x1200)
+        self.emu.run = True
+
+    def test_cycles_for_tick(self):
+        self.assertEqual(sum(cycles_for_tick(700, tick) for tick in range(60)), 700)
+        self.assertEqual({cycles_for_tick(700, tick) for tick in range(60)}, {11, 12})
+        self.assertEqual(sum(cycles_for_tick(600, tick) for tick in range(600)), 6000)
+
+    def test_runs_configured_ips_and_ticks_timers(self):
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, ips=900, clock=fake.clock, sleep=fake.sleep)
+        self.emu.delay_timer = 100
+        scheduler.run(ticks=60)
+        self.assertEqual(self.emu.cycles, 900)
+        self.assertEqual(self.emu.delay_timer, 40)
+        self.assertAlmostEqual(fake.now - 100.0, 59 / 60)
+
+    def test_drift_compensation(self):
+        # Every sleep wakes up 2 ms late, but deadlines stay anchored to the start of the run.
+        fake = FakeClock(overshoot=0.002)
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+        scheduler.run(ticks=601)
+        self.assertAlmostEqual(fake.now - 100.0, 10.0 + 0.002)
+        self.assertAlmostEqual(scheduler.max_jitter, 0.002)
+        self.assertAlmostEqual(scheduler.mean_jitter, 0.002 * 600 / 601)
+        self.assertEqual(scheduler.resyncs, 0)
+
+    def test_resync_when_too_far_behind(self):
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep, max_lag=0.1)
+
+        def stall(scheduler):
+            if scheduler.ticks == 10:
+                fake.now += 1.0
+
+        scheduler.on_tick.append(stall)
+        scheduler.run(ticks=20)
+        self.assertEqual(scheduler.resyncs, 1)
+        self.assertEqual(scheduler.ticks, 20)
+        # The 9 ticks after the stall are not run back to back to catch up.
+        self.assertEqual(len(fake.sleeps), 9 + 9)
+
+    def test_stops_when_emulator_stops(self):
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+
+        def quit_after_five(scheduler):
+            if scheduler.ticks == 5:
+                self.emu.run = False
+
+        scheduler.on_tick.append(quit_after_five)
+        scheduler.run()
+        self.assertEqual(scheduler.ticks, 5)
+        self.assertGreater(scheduler.achieved_ips, 0)
+
+    def test_presents_at_most_one_frame_per_tick(self):
+        # Clear the screen and jump back: dozens of draws per tick.
+        self.emu.memory[512:516] = assemble(0x00E0, 0x1200)
+        self.emu.display = CountingDisplay()
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+        presenter = FramePresenter(self.emu)
+        scheduler.on_tick.append(presenter.on_tick)
+        scheduler.run(ticks=30)
+        self.assertEqual(self.emu.display.updates, 30)
+        self.assertEqual(presenter.frames_presented, 30)
+        self.assertEqual(presenter.frames_skipped, 0)
+
+        # Nothing is presented while nothing is drawn.
+        self.emu.memory[512:514] = assemble(0x1200)
+        scheduler.run(ticks=10)
+        self.assertEqual(presenter.frames_presented, 30)
+
+    def test_skips_frames_when_behind(self):
+        self.emu.memory[512:516] = assemble(0x00E0, 0x1200)
+        self.emu.display = CountingDisplay()
+        # Every sleep overshoots by more than a tick period.
+        fake = FakeClock(overshoot=0.02)
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+        presenter = FramePresenter(self.emu, max_frame_skip=2)
+        scheduler.on_tick.append(presenter.on_tick)
+        scheduler.run(ticks=10)
+        self.assertGreater(presenter.frames_skipped, 0)
+        self.assertEqual(presenter.frames_presented + presenter.frames_skipped, 10)
+        self.assertEqual(self.emu.display.updates, presenter.frames_presented)
+        self.assertLessEqual(presenter.consecutive_skips, 2)
+
+    def test_key_wait_suspends_execution(self):
+        # Wait for a key into V0, then spin.
+        self.emu.memory[512:516] = assemble(0xF00A, 0x1202)
+        executed = []
+        interpret = self.emu.execute
+        self.emu.execute = lambda cycles: executed.append(cycles) or interpret(cycles)
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+        scheduler.run(ticks=10)
+        self.assertTrue(self.emu.key_wait)
+        # Only the first tick runs, the other nine are counted without executing anything.
+        self.assertEqual(len(executed), 1)
+        self.assertEqual(self.emu.cycles, sum(cycles_for_tick(700, tick) for tick in range(10)))
+        self.assertEqual(self.emu.pc, 512)
+
+        self.emu.keypad.press(7)
+        scheduler.run(ticks=1)
+        self.assertFalse(self.emu.key_wait)
+        self.assertEqual(self.emu.registers[0], 7)
+        self.assertEqual(self.emu.pc, 0x202)
+
+    def test_stop_returns_after_the_current_tick(self):
+        fake = FakeClock()
+        scheduler = Scheduler(self.emu, clock=fake.clock, sleep=fake.sleep)
+        scheduler.on_tick.append(lambda s: s.stop() if s.ticks == 3 else None)
+        scheduler.run()
+        self.assertEqual(scheduler.ticks, 3)
+        self.assertTrue(self.emu.run)
+        # stop() only ends the run it was called in.
+        scheduler.run(ticks=2)
+        self.assertEqual(scheduler.ticks, 5)
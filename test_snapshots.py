@@ -0,0 +1,57 @@
+import unittest
+from snapshots import FULL_INTERVAL, PAGE_SIZE, Snapshotter
+from benchmarks.workloads import WORKLOADS
+from test_support import make_emulator, machine_state
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def run_frames(self, emu, snapshotter, frames):
+        taken = []
+        for _ in range(frames):
+            emu.execute(12)
+            emu.tick_timers()
+            taken.append((snapshotter.take(), machine_state(emu)))
+        return taken
+
+    def test_restore_reassembles_the_chain(self):
+        for name, workload in WORKLOADS.items():
+            with self.subTest(workload=name):
+                emu = make_emulator(workload())
+                snapshotter = Snapshotter(emu, full_interval=16)
+                taken = self.run_frames(emu, snapshotter, 40)
+                for snapshot, state in taken[::7]:
+                    snapshotter.restore(snapshot)
+                    self.assertEqual(machine_state(emu), state)
+                    self.assertEqual(emu.save_state(), snapshot.state())
+                self.assertLess(max(snapshot.depth for snapshot, _ in taken), 16)
+
+    def test_only_written_pages_are_stored(self):
+        # The score workload writes three BCD digits with Fx33 every pass.
+        emu = make_emulator(WORKLOADS["score"]())
+        snapshotter = Snapshotter(emu)
+        taken = self.run_frames(emu, snapshotter, 10)
+        full, _ = taken[0]
+        self.assertIsNone(full.parent)
+        self.assertEqual(full.nbytes, len(emu.save_state()))
+        for snapshot, _ in taken[1:]:
+            self.assertLessEqual(len(snapshot.pages), 2)
+            self.assertLess(snapshot.nbytes, 2 * PAGE_SIZE + 300)
+
+    def test_next_snapshot_is_relative_to_the_restored_one(self):
+        emu = make_emulator(WORKLOADS["self_modifying"]())
+        snapshotter = Snapshotter(emu)
+        taken = self.run_frames(emu, snapshotter, 20)
+        snapshotter.restore(taken[5][0])
+        later = self.run_frames(emu, snapshotter, 3)
+        self.assertIs(later[0][0].parent, taken[5][0])
+        snapshotter.restore(later[1][0])
+        self.assertEqual(machine_state(emu), later[1][1])
+        self.assertEqual(later[-1][0].depth, 8)
+        self.assertLess(later[-1][0].depth, FULL_INTERVAL)
+        snapshotter.close()
+        self.assertNotIn(snapshotter.mark, emu.write_observers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+"""Helpers shared by the test modules."""
+from emulator import Emulator
+
+
+def make_emulator(rom, quirks=None):
+    """An emulator with the sprites loaded and `rom` at 0x200, ready to run without a window."""
+
+    emu = Emulator("test.ch8", False, quirks=quirks)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.memory[512:512 + len(rom)] = rom
+    return emu
+
+
+def machine_state(emu):
+    """Everything an instruction can change, for comparing two emulators."""
+
+    return (list(emu.memory), list(emu.registers), list(emu.stack), emu.stack_pointer, emu.pc, emu.I,
+            emu.delay_timer, emu.sound_timer, emu.cycles, emu.pixels.tolist())
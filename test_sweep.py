@@ -0,0 +1,56 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from sweep import run_rom, sweep
+from benchmarks.workloads import WORKLOADS, assemble
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.roms = {
+            "alu.ch8": WORKLOADS["alu"](),
+            "sprites.ch8": WORKLOADS["sprites"](),
+            "bad.ch8": assemble(0x6001, 0xFFFF),
+        }
+        self.paths = {}
+        for name, rom in self.roms.items():
+            self.paths[name] = os.path.join(self.directory.name, name)
+            with open(self.paths[name], "wb") as f:
+                f.write(rom)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run_rom(self):
+        result = run_rom(self.paths["sprites.ch8"], frames=60)
+        self.assertEqual(result["rom"], "sprites.ch8")
+        self.assertEqual(result["cycles"], 700)
+        self.assertIsNone(result["fault"])
+        self.assertGreater(result["ips"], 0)
+        # Same budget, same framebuffer, whatever the engine.
+        reference = run_rom(self.paths["sprites.ch8"], frames=60, engine="interpreter")
+        self.assertEqual(reference["framebuffer"], result["framebuffer"])
+
+    def test_cycle_budget(self):
+        self.assertEqual(run_rom(self.paths["alu.ch8"], cycles=1000)["cycles"], 1000)
+
+    def test_fault_is_reported(self):
+        result = run_rom(self.paths["bad.ch8"], frames=10)
+        self.assertEqual(result["cycles"], 1)
+        self.assertIn("UnknownOpcodeFault", result["fault"])
+
+    def test_sweep_writes_one_line_per_rom(self):
+        output = io.StringIO()
+        sweep(sorted(self.paths.values()), output, workers=2, frames=30)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line["rom"] for line in lines], ["alu.ch8", "bad.ch8", "sprites.ch8"])
+        self.assertEqual(lines[2]["framebuffer"], run_rom(self.paths["sprites.ch8"], frames=30)["framebuffer"])
+        self.assertIsNotNone(lines[1]["fault"])
+
+
+if __name__ == '__main__':
+    unittest.main()
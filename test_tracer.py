@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from faults import StackUnderflowFault
+from jit import Jit
+from tracer import NO_REGISTER, Tracer, call_stack, memory_writes, read_trace, summarise
+from benchmarks.workloads import WORKLOADS, assemble
+from test_support import make_emulator
+
+# 200: V0 = 5, 202: call 208, 204: I = 0x300, 206: jump to 206, 208: BCD of V0 at I (still 0), 20A: return.
+CALLS = assemble(0x6005, 0x2208, 0xA300, 0x1206, 0xF033, 0x00EE)
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "trace.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_match_execution(self):
+        emu = make_emulator(WORKLOADS["sprites"]())
+        jit = Jit(emu)
+        jit.install()
+        tracer = Tracer(emu)
+        tracer.install()
+        self.assertEqual(emu.execute(500), 500)
+        tracer.uninstall()
+        self.assertEqual(emu.execute, jit.execute)
+
+        self.assertEqual(tracer.dump(self.path), 500)
+        total, records = read_trace(self.path)
+        self.assertEqual(total, 500)
+        self.assertEqual([record.cycle for record in records], list(range(500)))
+        self.assertEqual(records[0].pc, 0x200)
+
+    def test_ring_buffer_keeps_the_newest_records(self):
+        emu = make_emulator(CALLS)
+        tracer = Tracer(emu, capacity=4)
+        tracer.install()
+        emu.execute(3)
+        emu.execute(7)
+        tracer.dump(self.path)
+        total, records = read_trace(self.path)
+        self.assertEqual(total, 10)
+        self.assertEqual([record.cycle for record in records], [6, 7, 8, 9])
+        self.assertTrue(all(record.pc == 0x206 for record in records))
+
+    def test_register_and_memory_writes(self):
+        emu = make_emulator(CALLS)
+        tracer = Tracer(emu)
+        tracer.install()
+        emu.execute(3)
+        tracer.dump(self.path)
+        _, records = read_trace(self.path)
+        self.assertEqual((records[0].register, records[0].value), (0, 5))
+        self.assertEqual(records[1].register, NO_REGISTER)
+        self.assertEqual(call_stack(records), [(0x202, 0x208)])
+        (record, address, data), = memory_writes(records)
+        self.assertEqual((record.pc, address, data), (0x208, 0, bytes([0, 0, 5])))
+
+        emu.execute(10)
+        tracer.dump(self.path)
+        total, records = read_trace(self.path)
+        self.assertEqual(call_stack(records), [])
+        self.assertIn("sub_208", summarise(total, records))
+
+    def test_I_past_16_bits(self):
+        # 200: V0 = 0xFF, 202: I += V0, 204: jump to 202.
+        emu = make_emulator(assemble(0x60FF, 0xF01E, 0x1202))
+        emu.I = 0xFF00
+        tracer = Tracer(emu)
+        tracer.install()
+        emu.execute(21)
+        tracer.dump(self.path)
+        _, records = read_trace(self.path)
+        self.assertEqual(emu.I, 0xFF00 + 10 * 0xFF)
+        self.assertEqual(records[-2].I, 0xFF00 + 9 * 0xFF)
+        self.assertGreater(records[-2].I, 0xFFFF)
+
+    def test_dump_on_fault(self):
+        emu = make_emulator(assemble(0x6001, 0x00EE))
+        tracer = Tracer(emu, fault_path=self.path)
+        tracer.install()
+        with self.assertRaises(StackUnderflowFault):
+            emu.execute(10)
+        self.assertEqual(emu.cycles, 1)
+        total, records = read_trace(self.path)
+        self.assertEqual(total, 2)
+        self.assertEqual((records[-1].cycle, records[-1].pc, records[-1].opcode), (1, 0x202, 0x00EE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,305 @@
+"""Record an execution trace into a ring buffer and analyse trace files offline.
+
+Usage:
+    python tracer.py record ROM [--frames N] [--capacity N] [--output FILE]
+    python tracer.py show TRACE [--pc START[-END]] [--op MNEMONIC] [--last N]
+    python tracer.py summary TRACE [--top N]
+    python tracer.py writes TRACE [--address START[-END]]
+
+Each executed instruction is one 22 byte record: the cycle number, PC, opcode, I before the instruction, and the
+register the instruction wrote with its new value (Fx33 records the register it read, so that the digits it
+stored can be recovered). Only the most recent records are kept; a trace file holds them oldest first. The
+tracer writes its file when the emulator faults, or when dump() is called.
+"""
+import argparse
+import struct
+import sys
+from collections import Counter, namedtuple
+
+from disassembler import mnemonic
+from emulator import INSTRUCTION_SET, Emulator
+from faults import EmulatorFault, MemoryAccessFault
+from quirks import select_quirks
+from scheduler import Scheduler
+
+TRACE_MAGIC = b"C8TR"
+TRACE_VERSION = 2
+# Magic, version, record size, records written in total, records in the file.
+HEADER = struct.Struct("<4sHHQQ")
+# Cycle, PC, opcode, I, register, value. Fx1E can take I past 0xFFFF, so it is as wide as in save states.
+RECORD = struct.Struct("<QHHQBB")
+# Register field of records whose instruction wrote no register.
+NO_REGISTER = 0xFF
+DEFAULT_CAPACITY = 1 << 16
+
+Record = namedtuple("Record", "cycle pc opcode I register value")
+
+# Handlers that write Vx, plus Fx33 which stores the digits of Vx.
+REGISTER_HANDLERS = frozenset({
+    "instruction_6xkk", "instruction_7xkk", "instruction_8xy0", "instruction_8xy1", "instruction_8xy2",
+    "instruction_8xy3", "instruction_8xy4", "instruction_8xy5", "instruction_8xy6", "instruction_8xy7",
+    "instruction_8xyE", "instruction_Cxkk", "instruction_Fx07", "instruction_Fx0A", "instruction_Fx33",
+    "instruction_Fx65",
+})
+
+
+def build_register_table():
+    """Return a 64K table mapping every opcode to the register its record holds, or NO_REGISTER."""
+
+    table = bytearray([NO_REGISTER]) * 0x10000
+    for mask, pattern, name, _ in INSTRUCTION_SET:
+        if name in REGISTER_HANDLERS:
+            for opcode in range(pattern, pattern + 0x1000):
+                if opcode & mask == pattern:
+                    table[opcode] = opcode >> 8 & 0xF
+    return bytes(table)
+
+
+REGISTER_TABLE = build_register_table()
+
+
+class Tracer:
+    """Execution engine that interprets and appends a record per instruction to a preallocated ring buffer.
+
+    install() swaps it in for the emulator's engine and uninstall() swaps that back, so nothing is recorded and
+    nothing is checked while the tracer is not installed. Like the profiler, it bypasses compiled engines. If
+    `fault_path` is set, the trace is written there when the emulator faults; the faulting instruction is the
+    last record, without a register.
+    """
+
+    def __init__(self, emulator, capacity=DEFAULT_CAPACITY, fault_path=None):
+        self.emulator = emulator
+        self.capacity = capacity
+        self.fault_path = fault_path
+        self.buffer = bytearray(capacity * RECORD.size)
+        # Records appended since the tracer was created; the newest is at (records - 1) % capacity.
+        self.records = 0
+        self.saved = None
+
+    def install(self):
+        self.saved = self.emulator.execute
+        self.emulator.execute = self.execute
+
+    def uninstall(self):
+        self.emulator.execute = self.saved
+        self.saved = None
+
+    def execute(self, cycles):
+        """Interpret up to `cycles` instructions, recording each one. Same contract as Emulator.interpret."""
+
+        emulator = self.emulator
+        decode_table = emulator.opcode_to_function_mapping
+        memory = emulator.memory
+        registers = emulator.registers
+        register_table = REGISTER_TABLE
+        pack_into = RECORD.pack_into
+        buffer = self.buffer
+        size = RECORD.size
+        end = len(buffer)
+        position = self.records % self.capacity * size
+        cycle = emulator.cycles
+        executed = 0
+        try:
+            try:
+                while executed < cycles:
+                    pc = emulator.pc
+                    I = emulator.I
+                    opcode = memory[pc] << 8 | memory[pc + 1]
+                    instruction, operands = decode_table[opcode]
+                    instruction(emulator, *operands)
+                    register = register_table[opcode]
+                    pack_into(buffer, position, cycle + executed, pc, opcode, I, register,
+                              registers[register] if register != NO_REGISTER else 0)
+                    position += size
+                    if position == end:
+                        position = 0
+                    executed += 1
+            except IndexError as error:
+                raise emulator.fault(MemoryAccessFault) from error
+        except EmulatorFault as fault:
+            self.records += executed
+            emulator.cycles += executed
+            executed = 0
+            self.append(emulator.cycles, fault.pc, fault.opcode, emulator.I)
+            if self.fault_path is not None:
+                self.dump(self.fault_path)
+            raise
+        finally:
+            self.records += executed
+            emulator.cycles += executed
+        return executed
+
+    def append(self, cycle, pc, opcode, I, register=NO_REGISTER, value=0):
+        RECORD.pack_into(self.buffer, self.records % self.capacity * RECORD.size, cycle, pc, opcode, I, register,
+                         value)
+        self.records += 1
+
+    def contents(self):
+        """Return the recorded bytes, oldest record first."""
+
+        if self.records <= self.capacity:
+            return bytes(self.buffer[:self.records * RECORD.size])
+        split = self.records % self.capacity * RECORD.size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def dump(self, path):
+        """Write the trace to `path` and return the number of records written."""
+
+        data = self.contents()
+        count = len(data) // RECORD.size
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size, self.records, count))
+            f.write(data)
+        return count
+
+
+def read_trace(path):
+    """Return (records written in total, list of Record) for a trace file, oldest record first."""
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a trace file")
+    magic, version, record_size, total, count = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace file")
+    body = memoryview(data)[HEADER.size:HEADER.size + count * RECORD.size]
+    return total, [Record._make(fields) for fields in RECORD.iter_unpack(body)]
+
+
+def format_record(record, depth=0):
+    text = mnemonic(record.opcode) or f"DW {record.opcode:#06x}"
+    line = f"{record.cycle:>12,}  {'  ' * depth}{record.pc:03X}  {record.opcode:04X}  {text:<18} I={record.I:03X}"
+    if record.register != NO_REGISTER:
+        line += f"  V{record.register:X}={record.value:02X}"
+    return line
+
+
+def call_depths(records):
+    """Yield (record, call depth) with the depth reconstructed from 2nnn and 00EE. Returns to callers from
+    before the start of the trace do not go below zero."""
+
+    depth = 0
+    for record in records:
+        yield record, depth
+        if record.opcode & 0xF000 == 0x2000:
+            depth += 1
+        elif record.opcode == 0x00EE and depth:
+            depth -= 1
+
+
+def call_stack(records):
+    """Return the call stack at the end of the trace as a list of (call site, subroutine), outermost first."""
+
+    stack = []
+    for record in records:
+        if record.opcode & 0xF000 == 0x2000:
+            stack.append((record.pc, record.opcode & 0xFFF))
+        elif record.opcode == 0x00EE and stack:
+            stack.pop()
+    return stack
+
+
+def memory_writes(records):
+    """Yield (record, address, bytes written) for Fx33 and Fx55. The bytes of Fx55 are not recorded and are
+    None."""
+
+    for record in records:
+        if record.opcode & 0xF0FF == 0xF033:
+            value = record.value
+            yield record, record.I, bytes((value // 100, value // 10 % 10, value % 10))
+        elif record.opcode & 0xF0FF == 0xF055:
+            yield record, record.I, None
+
+
+def summarise(total, records, top=10):
+    lines = [f"{len(records):,} records (of {total:,} written)"]
+    if records:
+        lines[0] += f", cycles {records[0].cycle:,} to {records[-1].cycle:,}"
+    lines += ["", "hottest PCs:"]
+    for pc, count in Counter(record.pc for record in records).most_common(top):
+        lines.append(f"  {pc:03X}  {count:>10,}  {count / len(records):>6.1%}")
+    calls = Counter(record.opcode & 0xFFF for record in records if record.opcode & 0xF000 == 0x2000)
+    if calls:
+        lines += ["", "calls:"]
+        lines += [f"  sub_{target:03X}  {count:>10,}" for target, count in calls.most_common(top)]
+    lines += ["", "call stack at the end of the trace:"]
+    lines += [f"  sub_{target:03X}  called from {site:03X}" for site, target in call_stack(records)] or ["  (empty)"]
+    writes = list(memory_writes(records))
+    lines += ["", f"{len(writes):,} memory writes"]
+    return "\n".join(lines)
+
+
+def parse_range(text):
+    """Parse "START" or "START-END" (END included) into (start, end) with end excluded."""
+
+    start, _, end = text.partition("-")
+    start = int(start, 0)
+    return start, int(end, 0) + 1 if end else start + 1
+
+
+def record_rom(args):
+    emu = Emulator(args.rom, False)
+    select_quirks(emu)
+    emu.map_opcodes_to_functions()
+    emu.load_standard_sprites()
+    emu.load_program_into_memory()
+    emu.run = True
+    tracer = Tracer(emu, args.capacity, fault_path=args.output)
+    tracer.install()
+    try:
+        Scheduler(emu, sleep=lambda seconds: None).run(ticks=args.frames)
+    except EmulatorFault as fault:
+        print(f"{fault}; trace written to {args.output}", file=sys.stderr)
+        sys.exit(1)
+    count = tracer.dump(args.output)
+    print(f"{count:,} records written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("record", help="run a ROM headless and write its trace")
+    command.add_argument("rom")
+    command.add_argument("--frames", type=int, default=600)
+    command.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="number of records kept")
+    command.add_argument("--output", default="trace.bin")
+    command = commands.add_parser("show", help="print the records")
+    command.add_argument("trace")
+    command.add_argument("--pc", type=parse_range, help="only instructions in this address range")
+    command.add_argument("--op", help="only instructions whose mnemonic starts with this, e.g. DRW")
+    command.add_argument("--last", type=int, help="only the last N matching records")
+    command = commands.add_parser("summary", help="hottest PCs, calls and the final call stack")
+    command.add_argument("trace")
+    command.add_argument("--top", type=int, default=10)
+    command = commands.add_parser("writes", help="memory writes of Fx33 and Fx55")
+    command.add_argument("trace")
+    command.add_argument("--address", type=parse_range, help="only writes overlapping this address range")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_rom(args)
+        return
+    total, records = read_trace(args.trace)
+    if args.command == "summary":
+        print(summarise(total, records, args.top))
+    elif args.command == "show":
+        lines = []
+        for entry, depth in call_depths(records):
+            if args.pc is not None and not args.pc[0] <= entry.pc < args.pc[1]:
+                continue
+            if args.op is not None and not (mnemonic(entry.opcode) or "").upper().startswith(args.op.upper()):
+                continue
+            lines.append(format_record(entry, depth))
+        print("\n".join(lines[-args.last:] if args.last else lines))
+    else:
+        for entry, address, data in memory_writes(records):
+            length = len(data) if data is not None else (entry.opcode >> 8 & 0xF) + 1
+            if args.address is not None and not (address < args.address[1] and args.address[0] < address + length):
+                continue
+            written = data.hex(" ").upper() if data is not None else f"V0-V{entry.opcode >> 8 & 0xF:X}"
+            print(f"{entry.cycle:>12,}  {entry.pc:03X}  {address:03X}-{address + length - 1:03X}  {written}")
+
+
+if __name__ == "__main__":
+    main()